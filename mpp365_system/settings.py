@@ -98,6 +98,24 @@ DATABASES = {
 }
 
 
+# Cache
+# Por defecto en memoria de cada proceso. Con varios workers usar un backend compartido
+# (por ejemplo CACHE_BACKEND=django.core.cache.backends.redis.RedisCache y CACHE_LOCATION=redis://...)
+# para que la invalidación del dashboard llegue a todos.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='mpp365'),
+    }
+}
+
+# Portafolio de empresas (superusuarios): hilos que calculan los KPIs en paralelo
+# y cantidad de empresas que resuelve cada consulta agrupada
+PORTAFOLIO_WORKERS = config('PORTAFOLIO_WORKERS', default=4, cast=int)
+PORTAFOLIO_TAMANO_LOTE = config('PORTAFOLIO_TAMANO_LOTE', default=50, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
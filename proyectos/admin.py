@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
@@ -5,10 +6,55 @@ from .models import (
     Cliente, Proveedor, Empleado, Proyecto, AsignacionEmpleado, Planilla,
     DetallePlanilla, Gasto, Pago, Usuario, OrdenCambio, Deduccion,
     Bonificacion, HoraExtra, HistorialSalario, Empresa, RegistroTrial,
-    PagoRecibido
+    PagoRecibido, ProyectoResumenFinanciero, CostoMensualProyecto, ProyectoFinancialSnapshot,
+    CierrePlanilla, DetalleCierrePlanilla, ReglaDeduccion, TramoDeduccion,
+    UsoMaquinariaMensual
 )
 
 
+class RecalcularPlanillaMixin:
+    """
+    Recalcula los totales persistidos de la planilla (Planilla.recalcular_totales)
+    cuando se crea, edita o elimina desde el admin una línea, deducción,
+    bonificación u hora extra. Las de una planilla cerrada solo se consultan, igual
+    que la planilla en PlanillaAdmin.
+    """
+
+    def has_change_permission(self, request, obj=None):
+        if obj is not None and obj.planilla.cerrada:
+            return False
+        return super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.planilla.cerrada:
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # No se pueden agregar ni mover líneas a una planilla cerrada
+        if db_field.name == 'planilla':
+            kwargs['queryset'] = Planilla.objects.filter(cerrada=False)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        planilla_anterior_id = form.initial.get('planilla') if change else None
+        super().save_model(request, obj, form, change)
+        obj.planilla.recalcular_totales()
+        if planilla_anterior_id and planilla_anterior_id != obj.planilla_id:
+            Planilla.objects.get(pk=planilla_anterior_id).recalcular_totales()
+
+    def delete_model(self, request, obj):
+        planilla = obj.planilla
+        super().delete_model(request, obj)
+        planilla.recalcular_totales()
+
+    def delete_queryset(self, request, queryset):
+        planillas = list(Planilla.objects.filter(pk__in=queryset.values('planilla')))
+        super().delete_queryset(request, queryset)
+        for planilla in planillas:
+            planilla.recalcular_totales()
+
+
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
     list_display = ('codigo', 'nombre', 'rtn', 'telefono', 'contacto', 'activo')
@@ -65,8 +111,18 @@ class AsignacionEmpleadoInline(admin.TabularInline):
     fields = ('empleado', 'fecha_asignacion', 'fecha_finalizacion', 'activo')
 
 
+class PlanillaInlineForm(forms.ModelForm):
+    """En las planillas cerradas también 'pagada' es de solo lectura"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and self.instance.cerrada and 'pagada' in self.fields:
+            self.fields['pagada'].disabled = True
+
+
 class PlanillaInline(admin.TabularInline):
     model = Planilla
+    form = PlanillaInlineForm
     extra = 0
     fields = ('periodo_inicio', 'periodo_fin', 'tipo_planilla', 'fecha_pago', 'pagada')
     readonly_fields = ('periodo_inicio', 'periodo_fin', 'tipo_planilla', 'fecha_pago')
@@ -152,36 +208,78 @@ class ProyectoAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # Totales anotados en la misma consulta: las columnas de utilidad no consultan por fila
+        return super().get_queryset(request).select_related('cliente').with_financials()
+
     def costos_totales_display(self, obj):
         if obj.pk:
-            costos = obj.calcular_costos_totales()
-            return format_html('<strong>${:,.2f}</strong>', costos)
+            costos = ProyectoFinancialSnapshot.de_proyecto(obj).costos_totales
+            return format_html('<strong>${}</strong>', f'{costos:,.2f}')
         return '-'
     costos_totales_display.short_description = 'Costos Totales'
 
     def utilidad_bruta_display(self, obj):
         if obj.pk:
-            utilidad = obj.calcular_utilidad_bruta()
+            utilidad = ProyectoFinancialSnapshot.de_proyecto(obj).utilidad_bruta
             color = 'green' if utilidad > 0 else 'red'
-            return format_html('<strong style="color: {};">${:,.2f}</strong>', color, utilidad)
+            return format_html('<strong style="color: {};">${}</strong>', color, f'{utilidad:,.2f}')
         return '-'
     utilidad_bruta_display.short_description = 'Utilidad Bruta'
 
     def margen_utilidad_display(self, obj):
         if obj.pk:
-            margen = obj.calcular_margen_utilidad()
+            margen = ProyectoFinancialSnapshot.de_proyecto(obj).margen_utilidad
             color = 'green' if margen > 0 else 'red'
-            return format_html('<strong style="color: {};">{:.2f}%</strong>', color, margen)
+            return format_html('<strong style="color: {};">{}%</strong>', color, f'{margen:.2f}')
         return '-'
     margen_utilidad_display.short_description = 'Margen de Utilidad'
 
     def utilidad_display(self, obj):
-        utilidad = obj.calcular_utilidad_bruta()
+        utilidad = ProyectoFinancialSnapshot.de_proyecto(obj).utilidad_bruta
         color = 'green' if utilidad > 0 else 'red'
-        return format_html('<span style="color: {};">${:,.2f}</span>', color, utilidad)
+        return format_html('<span style="color: {};">${}</span>', color, f'{utilidad:,.2f}')
     utilidad_display.short_description = 'Utilidad'
 
 
+@admin.register(ProyectoResumenFinanciero)
+class ProyectoResumenFinancieroAdmin(admin.ModelAdmin):
+    list_display = ('proyecto', 'total_planillas', 'total_gastos', 'total_maquinaria', 'total_ordenes_cambio', 'total_pagado', 'fecha_actualizacion')
+    search_fields = ('proyecto__codigo', 'proyecto__nombre')
+    list_select_related = ('proyecto',)
+    readonly_fields = ('proyecto',) + tuple(ProyectoResumenFinanciero.CAMPOS_TOTALES) + ('fecha_actualizacion',)
+
+    def has_add_permission(self, request):
+        # Se mantiene automáticamente desde signals y con el comando reconstruir_resumen_financiero
+        return False
+
+
+@admin.register(CostoMensualProyecto)
+class CostoMensualProyectoAdmin(admin.ModelAdmin):
+    list_display = ('proyecto', 'mes', 'categoria', 'monto', 'empresa')
+    list_filter = ('categoria', 'mes', 'empresa')
+    search_fields = ('proyecto__codigo', 'proyecto__nombre')
+    list_select_related = ('proyecto', 'empresa')
+    readonly_fields = ('empresa', 'proyecto', 'mes', 'categoria', 'monto')
+
+    def has_add_permission(self, request):
+        # Se mantiene automáticamente desde signals y con el comando reconstruir_costos_mensuales
+        return False
+
+
+@admin.register(UsoMaquinariaMensual)
+class UsoMaquinariaMensualAdmin(admin.ModelAdmin):
+    list_display = ('maquinaria', 'proyecto', 'mes', 'horas', 'costo', 'cantidad_usos', 'empresa')
+    list_filter = ('mes', 'empresa')
+    search_fields = ('maquinaria__codigo', 'maquinaria__nombre', 'proyecto__codigo')
+    list_select_related = ('maquinaria', 'proyecto', 'empresa')
+    readonly_fields = ('empresa', 'maquinaria', 'proyecto', 'mes', 'horas', 'costo', 'cantidad_usos')
+
+    def has_add_permission(self, request):
+        # Se mantiene automáticamente desde signals y con el comando reconstruir_usos_mensuales
+        return False
+
+
 @admin.register(AsignacionEmpleado)
 class AsignacionEmpleadoAdmin(admin.ModelAdmin):
     list_display = ('empleado', 'proyecto', 'fecha_asignacion', 'fecha_finalizacion', 'activo')
@@ -192,8 +290,8 @@ class AsignacionEmpleadoAdmin(admin.ModelAdmin):
 
 @admin.register(Planilla)
 class PlanillaAdmin(admin.ModelAdmin):
-    list_display = ('proyecto', 'periodo_inicio', 'periodo_fin', 'tipo_planilla', 'fecha_pago', 'monto_total_display', 'pagada')
-    list_filter = ('pagada', 'tipo_planilla', 'fecha_pago')
+    list_display = ('proyecto', 'periodo_inicio', 'periodo_fin', 'tipo_planilla', 'fecha_pago', 'monto_total_display', 'pagada', 'cerrada')
+    list_filter = ('pagada', 'cerrada', 'tipo_planilla', 'fecha_pago')
     search_fields = ('proyecto__codigo', 'proyecto__nombre')
     autocomplete_fields = ['proyecto']
     inlines = [DetallePlanillaInline, BonificacionInline, HoraExtraInline, DeduccionInline]
@@ -208,38 +306,51 @@ class PlanillaAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.recalcular_totales()
+
+    def has_change_permission(self, request, obj=None):
+        # Las planillas cerradas solo se consultan (sus montos están en el cierre)
+        if obj is not None and obj.cerrada:
+            return False
+        return super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.cerrada:
+            return False
+        return super().has_delete_permission(request, obj)
+
     def monto_total_display(self, obj):
         if obj.pk:
-            return format_html('<strong>${:,.2f}</strong>', obj.monto_total)
+            return format_html('<strong>${}</strong>', f'{obj.monto_total:,.2f}')
         return '-'
     monto_total_display.short_description = 'Monto Total'
 
 
 @admin.register(DetallePlanilla)
-class DetallePlanillaAdmin(admin.ModelAdmin):
+class DetallePlanillaAdmin(RecalcularPlanillaMixin, admin.ModelAdmin):
     list_display = ('planilla', 'empleado', 'salario_devengado', 'bonificaciones_display', 'deducciones_display', 'horas_extra_display', 'total_display')
     list_filter = ('planilla__fecha_pago', 'empleado')
     search_fields = ('empleado__nombres', 'empleado__apellidos', 'planilla__proyecto__codigo')
     autocomplete_fields = ['planilla', 'empleado']
     readonly_fields = ('salario_devengado',)
+    list_select_related = ('planilla__proyecto', 'empleado')
 
     def bonificaciones_display(self, obj):
-        total = obj.calcular_total_bonificaciones()
-        return format_html('<span>${:,.2f}</span>', total)
+        return format_html('<span>${}</span>', f'{obj.total_bonificaciones:,.2f}')
     bonificaciones_display.short_description = 'Bonificaciones'
 
     def deducciones_display(self, obj):
-        total = obj.calcular_total_deducciones()
-        return format_html('<span>${:,.2f}</span>', total)
+        return format_html('<span>${}</span>', f'{obj.total_deducciones:,.2f}')
     deducciones_display.short_description = 'Deducciones'
 
     def horas_extra_display(self, obj):
-        total = obj.calcular_monto_horas_extra()
-        return format_html('<span>${:,.2f}</span>', total)
+        return format_html('<span>${}</span>', f'{obj.monto_horas_extra:,.2f}')
     horas_extra_display.short_description = 'Horas Extra'
 
     def total_display(self, obj):
-        return format_html('<strong>${:,.2f}</strong>', obj.calcular_total())
+        return format_html('<strong>${}</strong>', f'{obj.total_neto:,.2f}')
     total_display.short_description = 'Total a Pagar'
 
 
@@ -344,17 +455,17 @@ class UsuarioAdmin(UserAdmin):
 
 
 @admin.register(Deduccion)
-class DeduccionAdmin(admin.ModelAdmin):
-    list_display = ('empleado', 'planilla', 'descripcion', 'monto', 'fecha_creacion')
-    list_filter = ('fecha_creacion', 'planilla__fecha_pago')
+class DeduccionAdmin(RecalcularPlanillaMixin, admin.ModelAdmin):
+    list_display = ('empleado', 'planilla', 'descripcion', 'monto', 'regla', 'fecha_creacion')
+    list_filter = ('fecha_creacion', 'planilla__fecha_pago', 'regla')
     search_fields = ('empleado__nombres', 'empleado__apellidos', 'descripcion', 'planilla__proyecto__nombre')
     autocomplete_fields = ['planilla', 'empleado']
     date_hierarchy = 'fecha_creacion'
-    readonly_fields = ('fecha_creacion',)
+    readonly_fields = ('regla', 'fecha_creacion')
 
     fieldsets = (
         ('Información de la Deducción', {
-            'fields': ('planilla', 'empleado', 'descripcion', 'monto')
+            'fields': ('planilla', 'empleado', 'descripcion', 'monto', 'regla')
         }),
         ('Fecha', {
             'fields': ('fecha_creacion',)
@@ -363,7 +474,7 @@ class DeduccionAdmin(admin.ModelAdmin):
 
 
 @admin.register(Bonificacion)
-class BonificacionAdmin(admin.ModelAdmin):
+class BonificacionAdmin(RecalcularPlanillaMixin, admin.ModelAdmin):
     list_display = ('empleado', 'planilla', 'descripcion', 'monto', 'fecha_creacion')
     list_filter = ('fecha_creacion', 'planilla__fecha_pago')
     search_fields = ('empleado__nombres', 'empleado__apellidos', 'descripcion', 'planilla__proyecto__nombre')
@@ -382,7 +493,7 @@ class BonificacionAdmin(admin.ModelAdmin):
 
 
 @admin.register(HoraExtra)
-class HoraExtraAdmin(admin.ModelAdmin):
+class HoraExtraAdmin(RecalcularPlanillaMixin, admin.ModelAdmin):
     list_display = ('empleado', 'planilla', 'descripcion', 'cantidad_horas', 'monto', 'fecha_creacion')
     list_filter = ('fecha_creacion', 'planilla__fecha_pago')
     search_fields = ('empleado__nombres', 'empleado__apellidos', 'descripcion', 'planilla__proyecto__nombre')
@@ -427,6 +538,45 @@ class HistorialSalarioAdmin(admin.ModelAdmin):
         return False
 
 
+class DetalleCierrePlanillaInline(admin.TabularInline):
+    model = DetalleCierrePlanilla
+    extra = 0
+    can_delete = False
+    fields = ('empleado_codigo', 'empleado_nombre', 'empleado_dni', 'salario_devengado', 'total_bonificaciones',
+              'monto_horas_extra', 'total_deducciones', 'total_neto')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CierrePlanilla)
+class CierrePlanillaAdmin(admin.ModelAdmin):
+    list_display = ('planilla', 'fecha_cierre', 'cerrada_por', 'cantidad_empleados', 'monto_total_display')
+    list_filter = ('fecha_cierre',)
+    search_fields = ('planilla__proyecto__codigo', 'planilla__proyecto__nombre')
+    list_select_related = ('planilla__proyecto', 'cerrada_por')
+    date_hierarchy = 'fecha_cierre'
+    inlines = [DetalleCierrePlanillaInline]
+    readonly_fields = ('planilla', 'fecha_cierre', 'cerrada_por', 'cantidad_empleados', 'total_devengado',
+                       'total_bonificaciones', 'total_horas_extra', 'monto_horas_extra', 'total_deducciones', 'monto_total')
+
+    def monto_total_display(self, obj):
+        return format_html('<strong>${}</strong>', f'{obj.monto_total:,.2f}')
+    monto_total_display.short_description = 'Monto Total'
+
+    def has_add_permission(self, request):
+        # Los cierres se crean desde la planilla
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # No permitir eliminar cierres
+        return False
+
+
 @admin.register(Empresa)
 class EmpresaAdmin(admin.ModelAdmin):
     list_display = ('codigo', 'nombre', 'razon_social', 'rtn', 'email', 'tipo_suscripcion', 'fecha_expiracion_suscripcion', 'activa')
@@ -584,3 +734,28 @@ class PagoRecibidoAdmin(admin.ModelAdmin):
                                           'plan_seleccionado', 'comprobante', 'referencia',
                                           'notas_cliente', 'estado')
         return self.readonly_fields
+
+
+class TramoDeduccionInline(admin.TabularInline):
+    model = TramoDeduccion
+    extra = 1
+    fields = ('desde', 'hasta', 'porcentaje')
+
+
+@admin.register(ReglaDeduccion)
+class ReglaDeduccionAdmin(admin.ModelAdmin):
+    list_display = ('codigo', 'descripcion', 'empresa', 'tipo_calculo', 'base', 'periodicidad', 'porcentaje', 'techo', 'orden', 'activa')
+    list_filter = ('empresa', 'tipo_calculo', 'activa')
+    search_fields = ('codigo', 'descripcion', 'empresa__nombre')
+    list_editable = ('orden', 'activa')
+    inlines = [TramoDeduccionInline]
+
+    fieldsets = (
+        ('Regla', {
+            'fields': ('empresa', 'codigo', 'descripcion', 'orden', 'activa')
+        }),
+        ('Cálculo', {
+            'fields': ('tipo_calculo', 'base', 'periodicidad', 'porcentaje', 'techo', 'exento', 'monto_maximo'),
+            'description': 'Techo, monto exento, tramos y monto máximo se expresan en la periodicidad de la regla.'
+        }),
+    )
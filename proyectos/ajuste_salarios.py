@@ -0,0 +1,102 @@
+"""
+Ajuste masivo de salarios.
+
+Aplica un aumento (o rebaja) porcentual o de monto fijo al salario base de los
+empleados de una empresa, filtrados por cargo y tipo de contrato. Los salarios
+se guardan con un solo bulk_update y el historial con un solo bulk_create, en
+lugar de un save() (con su signal de historial) por empleado.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+
+# Límite de Empleado.salario_base (max_digits=10, decimal_places=2)
+SALARIO_MAXIMO = Decimal('99999999.99')
+
+TIPOS_AJUSTE = [
+    ('porcentaje', 'Porcentaje'),
+    ('monto', 'Monto fijo'),
+]
+
+
+class ResultadoAjuste:
+    """Resumen de un ajuste: empleados ajustados y planilla mensual antes y después"""
+
+    def __init__(self):
+        self.cantidad = 0
+        self.total_anterior = Decimal('0')
+        self.total_nuevo = Decimal('0')
+
+    @property
+    def diferencia(self):
+        return self.total_nuevo - self.total_anterior
+
+
+def calcular_salario_ajustado(salario, tipo_ajuste, valor):
+    """Nuevo salario redondeado a centavos (valor es el porcentaje o el monto a sumar)"""
+    if tipo_ajuste == 'porcentaje':
+        nuevo = salario * (Decimal('100') + valor) / Decimal('100')
+    elif tipo_ajuste == 'monto':
+        nuevo = salario + valor
+    else:
+        raise ValueError(f'Tipo de ajuste inválido: {tipo_ajuste}')
+    return nuevo.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def ajustar_salarios(empresa, tipo_ajuste, valor, cargo=None, tipo_contrato=None, motivo='', usuario=None):
+    """
+    Ajusta el salario base de los empleados activos de la empresa (opcionalmente
+    solo los de un cargo y/o tipo de contrato) y registra el cambio en el historial.
+
+    Lanza ValueError si algún salario resultante queda en cero, negativo o fuera
+    de rango; en ese caso no se ajusta ninguno. Retorna un ResultadoAjuste.
+    """
+    from .cache_dashboard import invalidar_dashboard
+    from .cache_empleados import invalidar_empleados
+    from .models import Empleado, HistorialSalario
+
+    valor = Decimal(valor)
+    empleados = Empleado.objects.filter(empresa=empresa, activo=True)
+    if cargo:
+        empleados = empleados.filter(cargo__iexact=cargo)
+    if tipo_contrato:
+        empleados = empleados.filter(tipo_contrato=tipo_contrato)
+
+    resultado = ResultadoAjuste()
+    with transaction.atomic():
+        # Bloquear las filas evita perder un cambio de salario hecho en paralelo
+        empleados = list(empleados.select_for_update().only('pk', 'codigo', 'salario_base').order_by('pk'))
+
+        ajustados = []
+        historial = []
+        for empleado in empleados:
+            anterior = empleado.salario_base
+            nuevo = calcular_salario_ajustado(anterior, tipo_ajuste, valor)
+            if nuevo < Decimal('0.01') or nuevo > SALARIO_MAXIMO:
+                raise ValueError(
+                    f'El salario del empleado {empleado.codigo} quedaría en {nuevo:,.2f}, fuera del rango permitido.'
+                )
+            resultado.total_anterior += anterior
+            resultado.total_nuevo += nuevo
+            if nuevo == anterior:
+                continue
+            empleado.salario_base = nuevo
+            ajustados.append(empleado)
+            historial.append(HistorialSalario(
+                empleado=empleado,
+                salario_anterior=anterior,
+                salario_nuevo=nuevo,
+                usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+                motivo=motivo or 'Ajuste salarial masivo',
+            ))
+
+        Empleado.objects.bulk_update(ajustados, ['salario_base'], batch_size=1000)
+        HistorialSalario.objects.bulk_create(historial, batch_size=1000)
+        resultado.cantidad = len(ajustados)
+
+        # bulk_update no dispara los signals que invalidan estos caches
+        if ajustados:
+            empresa_id = empresa.pk if empresa else None
+            transaction.on_commit(lambda: (invalidar_empleados(empresa_id), invalidar_dashboard(empresa_id)))
+
+    return resultado
@@ -0,0 +1,107 @@
+"""
+Cache del dashboard por empresa.
+
+El payload (proyectos con sus costos y estadísticas) se guarda bajo una clave
+versionada por empresa. Los signals incrementan la versión cuando cambia un
+modelo que alimenta el dashboard, así que el cache nunca sirve datos viejos:
+las entradas de versiones anteriores simplemente dejan de leerse y expiran solas.
+"""
+import time
+
+from django.core.cache import cache
+
+# Las entradas huérfanas (versiones anteriores) se descartan después de este tiempo
+TIMEOUT_PAYLOAD = 60 * 60 * 24
+
+# Clave usada cuando el dashboard no está filtrado por empresa (superusuario sin empresa)
+TODAS_LAS_EMPRESAS = 'todas'
+
+
+def _clave_version(empresa_id):
+    return f'dashboard:version:{empresa_id or TODAS_LAS_EMPRESAS}'
+
+
+def _clave_contador(nombre, empresa_id=None):
+    """Clave de un contador de la empresa indicada, o del total de todos los dashboards"""
+    return f'dashboard:{nombre}:{empresa_id}' if empresa_id else f'dashboard:{nombre}:total'
+
+
+def _incrementar(clave):
+    """Incrementa un contador del cache, creándolo si no existe"""
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        # No existe (o expiró): add() evita pisar un valor creado en paralelo
+        if not cache.add(clave, 1, timeout=None):
+            return cache.incr(clave)
+        return 1
+
+
+def obtener_version(empresa_id):
+    """
+    Retorna la versión vigente del dashboard de la empresa.
+    La versión inicial se basa en el reloj para no reutilizar números de versión
+    si el cache pierde la clave (reinicio o desalojo).
+    """
+    clave = _clave_version(empresa_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), timeout=None)
+        version = cache.get(clave)
+    return version
+
+
+def obtener_versiones(empresa_ids):
+    """
+    Igual que obtener_version(), pero para varias empresas con una sola lectura
+    del cache (las versiones que no existen se crean una por una).
+    """
+    claves = {empresa_id: _clave_version(empresa_id) for empresa_id in empresa_ids}
+    encontradas = cache.get_many(list(claves.values()))
+    return {
+        empresa_id: encontradas[clave] if clave in encontradas else obtener_version(empresa_id)
+        for empresa_id, clave in claves.items()
+    }
+
+
+def invalidar_dashboard(empresa_id):
+    """
+    Incrementa la versión del dashboard de la empresa y la del dashboard global,
+    que también incluye sus datos.
+    """
+    for clave in {_clave_version(empresa_id), _clave_version(None)}:
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.add(clave, time.time_ns(), timeout=None)
+
+
+def obtener_dashboard(empresa_id, calcular):
+    """
+    Retorna el payload cacheado del dashboard de la empresa.
+    Si no existe para la versión vigente, lo calcula con calcular() y lo guarda.
+    """
+    clave = f'dashboard:payload:{empresa_id or TODAS_LAS_EMPRESAS}:{obtener_version(empresa_id)}'
+    payload = cache.get(clave)
+    contador = 'aciertos' if payload is not None else 'fallos'
+    _incrementar(_clave_contador(contador))
+    if empresa_id:
+        _incrementar(_clave_contador(contador, empresa_id))
+    if payload is not None:
+        return payload
+
+    payload = calcular()
+    cache.set(clave, payload, timeout=TIMEOUT_PAYLOAD)
+    return payload
+
+
+def estadisticas_cache_dashboard(empresa_id=None):
+    """Retorna los aciertos y fallos del cache (totales o de una empresa) y la tasa de aciertos"""
+    aciertos = cache.get(_clave_contador('aciertos', empresa_id)) or 0
+    fallos = cache.get(_clave_contador('fallos', empresa_id)) or 0
+    total = aciertos + fallos
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'tasa_aciertos': round(aciertos * 100 / total, 2) if total else None,
+    }
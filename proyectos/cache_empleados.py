@@ -0,0 +1,121 @@
+"""
+Cache de empleados por empresa.
+
+Guarda el catálogo de empleados activos (lo usan los formularios de planilla) y
+la nómina asignada de cada proyecto bajo claves con la versión de empleados de
+la empresa. Los signals incrementan esa versión cuando cambia un empleado o una
+asignación, así que nunca se sirven datos viejos: las entradas de versiones
+anteriores dejan de leerse y expiran solas. La versión también sirve de ETag
+para responder 304 sin leer el cache ni la base de datos.
+"""
+import time
+
+from django.core.cache import cache
+
+# Las entradas huérfanas (versiones anteriores) se descartan después de este tiempo
+TIMEOUT_PAYLOAD = 60 * 60 * 24
+
+# Clave usada cuando no hay empresa (superusuario sin empresa)
+SIN_EMPRESA = 'todas'
+
+
+def _clave_version(empresa_id):
+    return f'empleados:version:{empresa_id or SIN_EMPRESA}'
+
+
+def obtener_version_empleados(empresa_id):
+    """
+    Retorna la versión vigente de los empleados de la empresa.
+    La versión inicial se basa en el reloj para no reutilizar números de versión
+    si el cache pierde la clave (reinicio o desalojo).
+    """
+    clave = _clave_version(empresa_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), timeout=None)
+        version = cache.get(clave)
+    return version
+
+
+def invalidar_empleados(empresa_id):
+    """Incrementa la versión de los empleados de la empresa y la de la vista sin empresa"""
+    for clave in {_clave_version(empresa_id), _clave_version(None)}:
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.add(clave, time.time_ns(), timeout=None)
+
+
+def _obtener(clave, calcular):
+    payload = cache.get(clave)
+    if payload is None:
+        payload = calcular()
+        cache.set(clave, payload, timeout=TIMEOUT_PAYLOAD)
+    return payload
+
+
+def catalogo_empleados(empresa):
+    """
+    Empleados activos de la empresa como lista de diccionarios (id, codigo,
+    nombre_completo, dni, cargo, salario_base), ordenados por apellidos y nombres.
+    """
+    from .models import Empleado
+
+    empresa_id = empresa.pk if empresa else None
+
+    def calcular():
+        return [
+            {
+                'id': empleado['id'],
+                'codigo': empleado['codigo'],
+                'nombre_completo': f"{empleado['nombres']} {empleado['apellidos']}",
+                'dni': empleado['dni'],
+                'cargo': empleado['cargo'],
+                'salario_base': float(empleado['salario_base']),
+            }
+            for empleado in Empleado.objects.filter(empresa=empresa, activo=True)
+            .order_by('apellidos', 'nombres')
+            .values('id', 'codigo', 'nombres', 'apellidos', 'dni', 'cargo', 'salario_base')
+        ]
+
+    clave = f'empleados:catalogo:{empresa_id or SIN_EMPRESA}:{obtener_version_empleados(empresa_id)}'
+    return _obtener(clave, calcular)
+
+
+def etag_nomina_proyecto(proyecto_id, empresa):
+    """ETag de la nómina del proyecto: cambia con la versión de empleados de la empresa"""
+    empresa_id = empresa.pk if empresa else None
+    return f'"{proyecto_id}-{obtener_version_empleados(empresa_id)}"'
+
+
+def nomina_proyecto(proyecto_id, empresa):
+    """
+    Empleados activos asignados activamente al proyecto (id, nombre_completo,
+    salario_base, cargo). Con empresa, solo si el proyecto es de esa empresa.
+    """
+    from .models import AsignacionEmpleado
+
+    empresa_id = empresa.pk if empresa else None
+
+    def calcular():
+        asignaciones = AsignacionEmpleado.objects.filter(
+            proyecto_id=proyecto_id,
+            activo=True,
+            empleado__activo=True,
+        )
+        if empresa:
+            asignaciones = asignaciones.filter(proyecto__empresa=empresa)
+        empleados = {}
+        for fila in asignaciones.order_by('empleado__apellidos', 'empleado__nombres').values(
+            'empleado_id', 'empleado__nombres', 'empleado__apellidos', 'empleado__salario_base', 'empleado__cargo'
+        ):
+            empleados.setdefault(fila['empleado_id'], {
+                'id': fila['empleado_id'],
+                'nombre_completo': f"{fila['empleado__nombres']} {fila['empleado__apellidos']}",
+                'salario_base': float(fila['empleado__salario_base']),
+                'cargo': fila['empleado__cargo'],
+            })
+        return list(empleados.values())
+
+    clave = f'empleados:proyecto:{proyecto_id}:{empresa_id or SIN_EMPRESA}:{obtener_version_empleados(empresa_id)}'
+    return _obtener(clave, calcular)
@@ -0,0 +1,84 @@
+"""
+Cierre de planillas.
+
+Cerrar una planilla la marca como pagada y copia los totales de cada línea y de
+la planilla a CierrePlanilla/DetalleCierrePlanilla. Desde ese momento la planilla
+no se edita y se muestra y exporta desde esas tablas, sin agregaciones.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+
+class PlanillaCerrada(Exception):
+    """Se intentó modificar una planilla cerrada"""
+
+    def __init__(self, mensaje='La planilla está cerrada y no se puede modificar.'):
+        super().__init__(mensaje)
+
+
+# Campos de DetallePlanilla que se congelan en cada línea del cierre
+CAMPOS_MONTOS_CIERRE = [
+    'salario_devengado', 'total_bonificaciones', 'total_horas_extra',
+    'monto_horas_extra', 'total_deducciones', 'total_neto',
+]
+
+
+def cerrar_planilla(planilla, usuario=None):
+    """
+    Cierra la planilla: recalcula una última vez los totales de sus líneas, los
+    congela en un CierrePlanilla con una línea por empleado (un bulk_create) y
+    marca la planilla como pagada y cerrada. Lanza PlanillaCerrada si ya estaba cerrada.
+    Retorna el CierrePlanilla.
+    """
+    from .models import CierrePlanilla, DetalleCierrePlanilla, Planilla
+
+    with transaction.atomic():
+        # El bloqueo evita un cierre doble y que un guardado se cruce con el cierre
+        if Planilla.objects.select_for_update().filter(pk=planilla.pk).values_list('cerrada', flat=True).get():
+            raise PlanillaCerrada('La planilla ya está cerrada.')
+
+        detalles = planilla.calcular_totales_detalles()
+        planilla.guardar_totales(detalles)
+        empleados = {
+            empleado_id: (codigo, f'{nombres} {apellidos}', dni)
+            for empleado_id, codigo, nombres, apellidos, dni in planilla.detalles.values_list(
+                'empleado_id', 'empleado__codigo', 'empleado__nombres', 'empleado__apellidos', 'empleado__dni'
+            )
+        }
+
+        cierre = CierrePlanilla(
+            planilla=planilla,
+            cerrada_por=usuario if usuario is not None and usuario.is_authenticated else None,
+            cantidad_empleados=len(detalles),
+            total_devengado=sum((d.salario_devengado for d in detalles), Decimal('0')),
+            total_bonificaciones=sum((d.total_bonificaciones for d in detalles), Decimal('0')),
+            total_horas_extra=sum((d.total_horas_extra for d in detalles), Decimal('0')),
+            monto_horas_extra=sum((d.monto_horas_extra for d in detalles), Decimal('0')),
+            total_deducciones=sum((d.total_deducciones for d in detalles), Decimal('0')),
+            monto_total=planilla.monto_total,
+        )
+        cierre.save()
+
+        lineas = []
+        for detalle in detalles:
+            codigo, nombre, dni = empleados[detalle.empleado_id]
+            lineas.append(DetalleCierrePlanilla(
+                cierre=cierre,
+                empleado_id=detalle.empleado_id,
+                empleado_codigo=codigo,
+                empleado_nombre=nombre,
+                empleado_dni=dni,
+                **{campo: getattr(detalle, campo) for campo in CAMPOS_MONTOS_CIERRE},
+            ))
+        DetalleCierrePlanilla.objects.bulk_create(lineas, batch_size=1000)
+
+        # save() para que los signals de la planilla actualicen el resumen y el dashboard
+        planilla.cerrada = True
+        planilla.pagada = True
+        planilla.version = F('version') + 1
+        planilla.save(update_fields=['cerrada', 'pagada', 'version'])
+        planilla.refresh_from_db(fields=['version'])
+
+    return cierre
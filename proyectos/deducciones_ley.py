@@ -0,0 +1,135 @@
+"""
+Deducciones de ley.
+
+Calcula las deducciones configuradas en ReglaDeduccion (IHSS, RAP, ISR, etc.)
+para todas las líneas de una planilla a la vez: cada regla se evalúa sobre la
+columna completa de bases de la planilla (una pasada por regla y por tramo) en
+lugar de hacer la cuenta empleado por empleado, y las deducciones resultantes
+se guardan con un solo bulk_create.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+
+from .cierre_planilla import PlanillaCerrada
+from .signals import programar_recalculo_planilla, recalculos_suspendidos
+
+CERO = Decimal('0')
+CENTAVO = Decimal('0.01')
+
+# Meses que abarca cada periodicidad de las reglas
+MESES_POR_PERIODICIDAD = {'mensual': 1, 'anual': 12}
+
+
+class ResultadoDeducciones:
+    """Resumen del cálculo: deducciones creadas, total por regla y empleados con deducciones"""
+
+    def __init__(self):
+        self.creadas = 0
+        self.totales = {}
+        self.empleados = set()
+
+    @property
+    def monto_total(self):
+        return sum(self.totales.values(), CERO)
+
+
+def evaluar_regla(regla, tramos, bases):
+    """
+    Deducción de cada base de la lista, con las bases ya expresadas en la
+    periodicidad de la regla: aplica el techo, resta el monto exento y calcula el
+    porcentaje fijo o la suma de los tramos progresivos, limitada al monto máximo.
+    """
+    if regla.techo is not None:
+        bases = [min(base, regla.techo) for base in bases]
+    gravables = [max(base - regla.exento, CERO) for base in bases]
+
+    if regla.tipo_calculo == 'tramos':
+        montos = [CERO] * len(gravables)
+        for tramo in tramos:
+            tasa = tramo.porcentaje / 100
+            if tramo.hasta is None:
+                montos = [monto + max(gravable - tramo.desde, CERO) * tasa for monto, gravable in zip(montos, gravables)]
+            else:
+                montos = [
+                    monto + max(min(gravable, tramo.hasta) - tramo.desde, CERO) * tasa
+                    for monto, gravable in zip(montos, gravables)
+                ]
+    else:
+        tasa = (regla.porcentaje or CERO) / 100
+        montos = [gravable * tasa for gravable in gravables]
+
+    if regla.monto_maximo is not None:
+        montos = [min(monto, regla.monto_maximo) for monto in montos]
+    return montos
+
+
+def calcular_deducciones_ley(planilla, reglas):
+    """
+    Retorna las deducciones (sin guardar) que resultan de aplicar las reglas a las
+    líneas de la planilla. Las bases salen de los totales persistidos de cada línea.
+    """
+    from .models import Deduccion, DetallePlanilla
+
+    detalles = list(planilla.detalles.values_list(
+        'empleado_id', 'salario_devengado', 'total_bonificaciones', 'monto_horas_extra'
+    ))
+    if not detalles:
+        return []
+    empleados = [empleado_id for empleado_id, *_ in detalles]
+    columnas_base = {
+        'devengado': [devengado for _, devengado, _, _ in detalles],
+        'bruto': [devengado + bonificaciones + horas_extra for _, devengado, bonificaciones, horas_extra in detalles],
+    }
+    periodos_por_mes = DetallePlanilla.PERIODOS_POR_MES[planilla.tipo_planilla]
+
+    deducciones = []
+    for regla in reglas:
+        # Base del período llevada a la periodicidad de la regla (mensual o anual) y de vuelta
+        factor = Decimal(periodos_por_mes * MESES_POR_PERIODICIDAD[regla.periodicidad])
+        bases = [base * factor for base in columnas_base[regla.base]]
+        montos = evaluar_regla(regla, regla.tramos.all(), bases)
+        for empleado_id, monto in zip(empleados, montos):
+            monto = (monto / factor).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+            if monto > 0:
+                deducciones.append(Deduccion(
+                    planilla=planilla,
+                    empleado_id=empleado_id,
+                    regla=regla,
+                    descripcion=regla.descripcion,
+                    monto=monto,
+                ))
+    return deducciones
+
+
+def aplicar_deducciones_ley(planilla):
+    """
+    Reemplaza las deducciones de ley de la planilla por las que resultan de las
+    reglas activas de su empresa; las deducciones ingresadas a mano no se tocan.
+    Lanza PlanillaCerrada si la planilla está cerrada. Retorna un ResultadoDeducciones.
+    """
+    from .models import Deduccion, Planilla, ReglaDeduccion
+
+    resultado = ResultadoDeducciones()
+    reglas = list(
+        ReglaDeduccion.objects.filter(empresa_id=planilla.proyecto.empresa_id, activa=True)
+        .prefetch_related('tramos')
+    )
+
+    with transaction.atomic():
+        # Bloquear la planilla serializa el cálculo con los guardados del formulario y el cierre
+        if Planilla.objects.select_for_update().filter(pk=planilla.pk).values_list('cerrada', flat=True).get():
+            raise PlanillaCerrada()
+        with recalculos_suspendidos():
+            planilla.deducciones.filter(regla__isnull=False).delete()
+            deducciones = calcular_deducciones_ley(planilla, reglas)
+            Deduccion.objects.bulk_create(deducciones, batch_size=1000)
+
+        planilla.recalcular_totales()
+        programar_recalculo_planilla(planilla)
+
+    for deduccion in deducciones:
+        resultado.totales[deduccion.descripcion] = resultado.totales.get(deduccion.descripcion, CERO) + deduccion.monto
+        resultado.empleados.add(deduccion.empleado_id)
+    resultado.creadas = len(deducciones)
+    return resultado
@@ -0,0 +1,173 @@
+"""
+Respuestas de exportación en streaming (CSV, XLSX y NDJSON).
+
+Las filas se generan y envían de una en una, así que la memoria usada no depende
+de la cantidad de registros exportados. Para que la consulta tampoco cargue todo
+en memoria, las filas deben venir de queryset.iterator().
+"""
+import csv
+import json
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+
+
+class _Eco:
+    """Objeto tipo archivo que devuelve lo escrito en lugar de guardarlo (para csv.writer)"""
+
+    def write(self, valor):
+        return valor
+
+
+def _valor_json(valor):
+    """Convierte a JSON los tipos que json.dumps no soporta (Decimal, fechas)"""
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return str(valor)
+
+
+def respuesta_csv_streaming(nombre_archivo, encabezados, filas):
+    """
+    Retorna un StreamingHttpResponse CSV.
+    encabezados es la lista de títulos de columna y filas un iterable de listas.
+    """
+    writer = csv.writer(_Eco())
+
+    def generar():
+        # BOM para que Excel reconozca el archivo como UTF-8
+        yield '﻿'
+        yield writer.writerow(encabezados)
+        for fila in filas:
+            yield writer.writerow(fila)
+
+    response = StreamingHttpResponse(generar(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
+
+
+class _Sumidero:
+    """Destino de escritura sin posición para zipfile: acumula los bytes hasta que se vacían"""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes.clear()
+        return datos
+
+
+# Caracteres de control que XML 1.0 no admite
+_CONTROL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_ARCHIVOS_FIJOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celda_xlsx(valor):
+    """Celda de la hoja: números como valores numéricos y el resto como texto en línea"""
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = _CONTROL_XML.sub('', escape(str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xlsx(valores):
+    return '<row>' + ''.join(_celda_xlsx(valor) for valor in valores) + '</row>'
+
+
+def respuesta_xlsx_streaming(nombre_archivo, encabezados, filas, nombre_hoja='Datos'):
+    """
+    Retorna un StreamingHttpResponse XLSX con una sola hoja.
+    encabezados es la lista de títulos de columna y filas un iterable de listas.
+
+    El libro se arma con zipfile sobre un destino sin posición (descriptores de
+    datos al final de cada entrada), así que cada fila se comprime y se envía
+    apenas se genera, sin construir el archivo completo en memoria.
+    """
+    def generar():
+        sumidero = _Sumidero()
+        with zipfile.ZipFile(sumidero, mode='w', compression=zipfile.ZIP_DEFLATED) as libro:
+            for ruta, contenido in _XLSX_ARCHIVOS_FIJOS.items():
+                libro.writestr(ruta, contenido)
+            libro.writestr('xl/workbook.xml', (
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                f'<sheets><sheet name="{escape(nombre_hoja[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+                '</workbook>'
+            ))
+            yield sumidero.vaciar()
+
+            with libro.open('xl/worksheets/sheet1.xml', mode='w', force_zip64=True) as hoja:
+                hoja.write((
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                    + _fila_xlsx(encabezados)
+                ).encode('utf-8'))
+                for fila in filas:
+                    hoja.write(_fila_xlsx(fila).encode('utf-8'))
+                    datos = sumidero.vaciar()
+                    if datos:
+                        yield datos
+                hoja.write(b'</sheetData></worksheet>')
+        yield sumidero.vaciar()
+
+    response = StreamingHttpResponse(
+        generar(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
+
+
+def respuesta_ndjson_streaming(nombre_archivo, filas):
+    """
+    Retorna un StreamingHttpResponse NDJSON (un objeto JSON por línea).
+    filas es un iterable de diccionarios.
+    """
+    def generar():
+        for fila in filas:
+            yield json.dumps(fila, default=_valor_json, ensure_ascii=False) + '\n'
+
+    response = StreamingHttpResponse(generar(), content_type='application/x-ndjson; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from django import forms
 from django.forms import inlineformset_factory
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
@@ -6,6 +7,7 @@ from .models import (
     DetallePlanilla, Gasto, Pago, Usuario, Deduccion, Bonificacion, HoraExtra,
     PagoRecibido
 )
+from .ajuste_salarios import TIPOS_AJUSTE
 
 
 class ClienteForm(forms.ModelForm):
@@ -280,6 +282,135 @@ HoraExtraFormSet = inlineformset_factory(
 )
 
 
+class GenerarPlanillasForm(forms.Form):
+    """Formulario para generar en bloque las planillas de un período"""
+
+    periodo_inicio = forms.DateField(
+        label='Período Inicio',
+        input_formats=['%Y-%m-%d'],
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+    )
+    periodo_fin = forms.DateField(
+        label='Período Fin',
+        input_formats=['%Y-%m-%d'],
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+    )
+    tipo_planilla = forms.ChoiceField(
+        label='Tipo de Planilla',
+        choices=Planilla.TIPO_PLANILLA_CHOICES,
+        initial='quincenal',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    fecha_pago = forms.DateField(
+        label='Fecha de Pago',
+        input_formats=['%Y-%m-%d'],
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+    )
+    proyectos = forms.ModelMultipleChoiceField(
+        label='Proyectos',
+        queryset=Proyecto.objects.none(),
+        required=False,
+        widget=forms.SelectMultiple(attrs={'class': 'form-select', 'size': 8}),
+        help_text='Dejar vacío para generar las planillas de todos los proyectos en progreso',
+    )
+    observaciones = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        empresa = kwargs.pop('empresa', None)
+        super().__init__(*args, **kwargs)
+        # Solo proyectos en progreso de la empresa
+        self.fields['proyectos'].queryset = Proyecto.objects.filter(
+            empresa=empresa, estado='en_progreso'
+        ).order_by('codigo')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        periodo_inicio = cleaned_data.get('periodo_inicio')
+        periodo_fin = cleaned_data.get('periodo_fin')
+
+        if periodo_inicio and periodo_fin and periodo_inicio > periodo_fin:
+            raise forms.ValidationError({
+                'periodo_fin': 'La fecha de fin debe ser posterior a la fecha de inicio'
+            })
+
+        return cleaned_data
+
+
+class ImportarMovimientosPlanillaForm(forms.Form):
+    """Formulario para importar horas extra, bonificaciones y deducciones desde un archivo"""
+
+    archivo = forms.FileField(
+        label='Archivo',
+        help_text='CSV o XLSX con encabezados: tipo, codigo o dni, descripcion, horas y monto',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+    tipo = forms.ChoiceField(
+        label='Tipo',
+        required=False,
+        choices=[('', 'Según la columna "tipo" del archivo'), ('hora_extra', 'Horas extra'),
+                 ('bonificacion', 'Bonificaciones'), ('deduccion', 'Deducciones')],
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Solo se aceptan archivos CSV o XLSX.')
+        return archivo
+
+
+class AjusteSalarialForm(forms.Form):
+    """Formulario para ajustar en bloque el salario base de los empleados activos"""
+
+    tipo_ajuste = forms.ChoiceField(
+        label='Tipo de Ajuste',
+        choices=TIPOS_AJUSTE,
+        initial='porcentaje',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    valor = forms.DecimalField(
+        label='Valor',
+        max_digits=12,
+        decimal_places=2,
+        help_text='Porcentaje (5 = 5%) o monto a sumar al salario; use un valor negativo para una rebaja',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'placeholder': '5.00'}),
+    )
+    cargo = forms.ChoiceField(
+        label='Cargo',
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    tipo_contrato = forms.ChoiceField(
+        label='Tipo de Contrato',
+        required=False,
+        choices=[('', 'Todos')] + list(Empleado.TIPO_CONTRATO_CHOICES),
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    motivo = forms.CharField(
+        label='Motivo',
+        required=False,
+        max_length=200,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Aumento anual'}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        empresa = kwargs.pop('empresa', None)
+        super().__init__(*args, **kwargs)
+        cargos = Empleado.objects.filter(empresa=empresa, activo=True).values_list('cargo', flat=True).distinct().order_by('cargo')
+        self.fields['cargo'].choices = [('', 'Todos')] + [(cargo, cargo) for cargo in cargos]
+
+    def clean_valor(self):
+        valor = self.cleaned_data['valor']
+        if valor == 0:
+            raise forms.ValidationError('El ajuste no puede ser cero.')
+        if self.cleaned_data.get('tipo_ajuste') == 'porcentaje' and valor <= -100:
+            raise forms.ValidationError('Una rebaja no puede ser del 100% o más.')
+        return valor
+
+
 class GastoForm(forms.ModelForm):
     class Meta:
         model = Gasto
@@ -588,11 +719,69 @@ class UsoMaquinariaForm(forms.ModelForm):
                     'horometro_final': 'El horómetro final debe ser mayor al inicial'
                 })
 
+        # Una tarifa distinta de la vigente en la fecha de inicio es manual y el recálculo no la toca
+        maquinaria = cleaned_data.get('maquinaria')
+        fecha_inicio = cleaned_data.get('fecha_inicio')
+        tarifa = cleaned_data.get('tarifa_aplicada')
+        cambios_tarifa = {'maquinaria', 'fecha_inicio', 'tarifa_aplicada'} & set(self.changed_data)
+        if maquinaria and fecha_inicio and tarifa and (self.instance._state.adding or cambios_tarifa):
+            from .models import UsoMaquinaria
+            tarifa_vigente = UsoMaquinaria(maquinaria=maquinaria, fecha_inicio=fecha_inicio).tarifa_vigente()
+            self.instance.tarifa_manual = tarifa != tarifa_vigente
+
         return cleaned_data
 
 
 # ====== FORMULARIO DE EMPRESAS ======
 
+class TarifaMaquinariaForm(forms.Form):
+    """Formulario para registrar una tarifa de maquinaria vigente desde una fecha (también retroactiva)"""
+
+    tarifa = forms.DecimalField(
+        label='Tarifa por Hora',
+        max_digits=10,
+        decimal_places=2,
+        min_value=Decimal('0.01'),
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'placeholder': '850.00'}),
+    )
+    vigente_desde = forms.DateField(
+        label='Vigente Desde',
+        help_text='Los usos que iniciaron desde esta fecha se recalculan con la nueva tarifa',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+    )
+    motivo = forms.CharField(
+        label='Motivo',
+        required=False,
+        max_length=200,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Corrección de tarifa'}),
+    )
+
+    def clean_vigente_desde(self):
+        from django.utils import timezone
+
+        vigente_desde = self.cleaned_data['vigente_desde']
+        if vigente_desde > timezone.localdate():
+            raise forms.ValidationError('La fecha de vigencia no puede ser futura.')
+        return vigente_desde
+
+
+class ImportarUsosMaquinariaForm(forms.Form):
+    """Formulario para importar usos de maquinaria (bitácoras de horómetro) desde un archivo"""
+
+    archivo = forms.FileField(
+        label='Archivo',
+        help_text='CSV o XLSX con encabezados: maquinaria, proyecto, fecha_inicio, fecha_fin, '
+                  'horometro_inicial, horometro_final y opcionalmente tarifa, descripcion y observaciones',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Solo se aceptan archivos CSV o XLSX.')
+        return archivo
+
+
 class EmpresaForm(forms.ModelForm):
     """Formulario para crear y editar empresas"""
 
@@ -0,0 +1,131 @@
+"""
+Generación masiva de planillas.
+
+Crea en una sola transacción las planillas de un período para todos los
+proyectos en progreso de una empresa, con una línea por cada empleado asignado
+activo. Las líneas se insertan con bulk_create y sus totales se calculan en
+memoria: una planilla nueva todavía no tiene bonificaciones, deducciones ni
+horas extra, así que el total neto es el salario devengado.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+
+
+class ResultadoGeneracion:
+    """Resumen de una generación: planillas creadas y proyectos omitidos con su motivo"""
+
+    def __init__(self):
+        self.planillas = []
+        self.total_detalles = 0
+        self.omitidos = []
+
+    @property
+    def monto_total(self):
+        return sum((planilla.monto_total for planilla in self.planillas), Decimal('0'))
+
+
+def generar_planillas(empresa, periodo_inicio, periodo_fin, tipo_planilla, fecha_pago,
+                      proyectos=None, observaciones=None):
+    """
+    Genera las planillas del período para los proyectos en progreso de la empresa
+    (o solo para los proyectos indicados).
+
+    Se omiten los proyectos que ya tienen una planilla del mismo tipo y período,
+    y los que no tienen empleados activos asignados durante el período.
+    Retorna un ResultadoGeneracion.
+    """
+    from .models import AsignacionEmpleado, DetallePlanilla, HistorialSalario, Planilla, Proyecto
+
+    if periodo_inicio > periodo_fin:
+        raise ValueError('La fecha de inicio del período no puede ser posterior a la fecha de fin.')
+    if tipo_planilla not in dict(Planilla.TIPO_PLANILLA_CHOICES):
+        raise ValueError(f'Tipo de planilla inválido: {tipo_planilla}')
+
+    if proyectos is None:
+        proyectos = Proyecto.objects.filter(empresa=empresa, estado='en_progreso')
+    proyectos = {proyecto.pk: proyecto for proyecto in proyectos.order_by('codigo')}
+
+    resultado = ResultadoGeneracion()
+
+    with transaction.atomic():
+        # Bloquear los proyectos evita que dos generaciones simultáneas dupliquen planillas
+        list(Proyecto.objects.select_for_update().filter(pk__in=proyectos).values_list('pk', flat=True))
+
+        existentes = set(
+            Planilla.objects.filter(
+                proyecto_id__in=proyectos,
+                tipo_planilla=tipo_planilla,
+                periodo_inicio=periodo_inicio,
+                periodo_fin=periodo_fin,
+            ).values_list('proyecto_id', flat=True)
+        )
+
+        # Empleados activos asignados en algún momento del período (una consulta para todos los proyectos)
+        asignaciones = (
+            AsignacionEmpleado.objects.filter(
+                proyecto_id__in=proyectos,
+                activo=True,
+                empleado__activo=True,
+                fecha_asignacion__lte=periodo_fin,
+            )
+            .filter(Q(fecha_finalizacion__isnull=True) | Q(fecha_finalizacion__gte=periodo_inicio))
+            .order_by()
+            .values_list('proyecto_id', 'empleado_id')
+            .distinct()
+        )
+        asignaciones = list(asignaciones)
+        # Salario vigente al final del período (una consulta): el período puede ser pasado
+        salarios_vigentes = HistorialSalario.salarios_vigentes(
+            {empleado_id for _, empleado_id in asignaciones}, periodo_fin
+        )
+        salarios_por_proyecto = {}
+        for proyecto_id, empleado_id in asignaciones:
+            salarios_por_proyecto.setdefault(proyecto_id, {})[empleado_id] = salarios_vigentes[empleado_id]
+
+        pendientes = []
+        for proyecto_id, proyecto in proyectos.items():
+            if proyecto_id in existentes:
+                resultado.omitidos.append((proyecto, 'Ya tiene una planilla para este período'))
+                continue
+            salarios = salarios_por_proyecto.get(proyecto_id)
+            if not salarios:
+                resultado.omitidos.append((proyecto, 'Sin empleados activos asignados'))
+                continue
+
+            planilla = Planilla(
+                proyecto=proyecto,
+                periodo_inicio=periodo_inicio,
+                periodo_fin=periodo_fin,
+                tipo_planilla=tipo_planilla,
+                fecha_pago=fecha_pago,
+                observaciones=observaciones,
+            )
+            detalles = []
+            for empleado_id, salario_base in salarios.items():
+                detalle = DetallePlanilla(
+                    planilla=planilla,
+                    empleado_id=empleado_id,
+                    salario_devengado=DetallePlanilla.salario_del_periodo(salario_base, tipo_planilla),
+                )
+                detalle.actualizar_total_neto()
+                detalles.append(detalle)
+            planilla.monto_total = sum((detalle.total_neto for detalle in detalles), Decimal('0'))
+            pendientes.append((planilla, detalles))
+
+        # Las planillas se guardan una por una para que los signals programen la
+        # actualización del resumen financiero y de los costos mensuales del proyecto;
+        # al confirmar la transacción ya incluyen las líneas insertadas en bloque
+        detalles_nuevos = []
+        for planilla, detalles in pendientes:
+            planilla.save()
+            for detalle in detalles:
+                detalle.planilla = planilla
+            detalles_nuevos.extend(detalles)
+            resultado.planillas.append(planilla)
+
+        DetallePlanilla.objects.bulk_create(detalles_nuevos, batch_size=1000)
+        resultado.total_detalles = len(detalles_nuevos)
+
+    return resultado
@@ -0,0 +1,361 @@
+"""
+Importación en bloque de horas extra, bonificaciones y deducciones de una planilla.
+
+El archivo (CSV o XLSX) se valida completo contra un índice en memoria de los
+empleados de la empresa, buscados por código o DNI: una sola consulta sin
+importar la cantidad de filas. Si alguna fila tiene errores no se importa nada y
+se reportan los errores por fila; si todas son válidas se insertan con un
+bulk_create por modelo y los totales de los empleados afectados se recalculan
+una sola vez.
+
+Columnas reconocidas (la primera fila es el encabezado, sin distinguir
+mayúsculas ni tildes): tipo, codigo, dni, descripcion, horas y monto. La columna
+tipo (hora_extra, bonificacion o deduccion) se puede omitir si se indica un tipo
+para todo el archivo. Cada fila necesita el código o el DNI del empleado.
+"""
+import csv
+import io
+import re
+import unicodedata
+import zipfile
+from decimal import Decimal, InvalidOperation
+from xml.etree import ElementTree
+
+from django.db import transaction
+
+from .cierre_planilla import PlanillaCerrada
+from .signals import programar_recalculo_planilla, recalculos_suspendidos
+
+
+# Límite de filas por archivo para que una carga equivocada no bloquee la planilla
+MAX_FILAS_IMPORTACION = 5000
+
+TIPOS_MOVIMIENTO = {
+    'hora_extra': 'Hora extra',
+    'bonificacion': 'Bonificación',
+    'deduccion': 'Deducción',
+}
+
+# Variantes aceptadas en la columna tipo (ya normalizadas)
+_ALIAS_TIPO = {
+    'hora_extra': 'hora_extra', 'horas_extra': 'hora_extra', 'hora extra': 'hora_extra',
+    'horas extra': 'hora_extra', 'he': 'hora_extra', 'extra': 'hora_extra',
+    'bonificacion': 'bonificacion', 'bonificaciones': 'bonificacion', 'bono': 'bonificacion',
+    'deduccion': 'deduccion', 'deducciones': 'deduccion', 'descuento': 'deduccion',
+}
+
+# Encabezados aceptados para cada columna (ya normalizados)
+_ALIAS_COLUMNA = {
+    'tipo': 'tipo',
+    'codigo': 'codigo', 'codigo empleado': 'codigo', 'empleado': 'codigo',
+    'dni': 'dni', 'identidad': 'dni',
+    'descripcion': 'descripcion', 'concepto': 'descripcion',
+    'horas': 'horas', 'cantidad horas': 'horas', 'cantidad_horas': 'horas',
+    'monto': 'monto', 'valor': 'monto',
+}
+
+# Coma como separador de miles ('1,200', '12,345.50') y como separador decimal ('1234,50', '0,5')
+_NUMERO_CON_MILES = re.compile(r'^-?\d{1,3}(,\d{3})+(\.\d+)?$')
+_NUMERO_COMA_DECIMAL = re.compile(r'^-?\d+,\d{1,2}$')
+
+_NS_HOJA = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_RELACION = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_NS_PAQUETE = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+class ErrorImportacion(Exception):
+    """El archivo no se puede leer (formato, encabezados o tamaño)"""
+
+
+class ResultadoImportacion:
+    """Resultado de una importación: filas creadas por tipo o errores por fila"""
+
+    def __init__(self):
+        self.creados = dict.fromkeys(TIPOS_MOVIMIENTO, 0)
+        self.errores = []
+        self.empleados = set()
+
+    @property
+    def total_creados(self):
+        return sum(self.creados.values())
+
+    def agregar_error(self, fila, mensaje):
+        self.errores.append((fila, mensaje))
+
+
+def _normalizar(texto):
+    """Minúsculas, sin tildes ni espacios sobrantes (para encabezados y tipos)"""
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(texto.lower().split())
+
+
+def _normalizar_clave(valor):
+    """Código o DNI comparable: sin espacios ni guiones y en mayúsculas"""
+    clave = re.sub(r'[\s-]', '', str(valor or '')).upper()
+    # Excel guarda los números enteros como 801.0 cuando la celda tiene formato numérico
+    return clave[:-2] if clave.endswith('.0') and clave[:-2].isdigit() else clave
+
+
+def _leer_csv(archivo):
+    contenido = archivo.read()
+    try:
+        texto = contenido.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        texto = contenido.decode('latin-1')
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    return csv.reader(io.StringIO(texto), dialecto)
+
+
+def _indice_columna(referencia):
+    """'C12' -> 2"""
+    indice = 0
+    for letra in referencia:
+        if not letra.isalpha():
+            break
+        indice = indice * 26 + ord(letra.upper()) - ord('A') + 1
+    return indice - 1
+
+
+def _leer_xlsx(archivo):
+    """Filas de la primera hoja de un XLSX, leídas con iterparse para no cargar la hoja completa"""
+    try:
+        libro = zipfile.ZipFile(archivo)
+        workbook = ElementTree.fromstring(libro.read('xl/workbook.xml'))
+        relaciones = ElementTree.fromstring(libro.read('xl/_rels/workbook.xml.rels'))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError):
+        raise ErrorImportacion('El archivo no es un XLSX válido.')
+
+    hoja = workbook.find(f'{_NS_HOJA}sheets/{_NS_HOJA}sheet')
+    destinos = {rel.get('Id'): rel.get('Target') for rel in relaciones.iter(f'{_NS_PAQUETE}Relationship')}
+    destino = destinos.get(hoja.get(f'{_NS_RELACION}id')) if hoja is not None else None
+    if not destino:
+        raise ErrorImportacion('El archivo XLSX no tiene hojas.')
+    ruta_hoja = destino.lstrip('/') if destino.startswith('/') else f'xl/{destino}'
+
+    textos = []
+    if 'xl/sharedStrings.xml' in libro.namelist():
+        compartidos = ElementTree.fromstring(libro.read('xl/sharedStrings.xml'))
+        textos = [
+            ''.join(t.text or '' for t in si.iter(f'{_NS_HOJA}t'))
+            for si in compartidos.iter(f'{_NS_HOJA}si')
+        ]
+
+    def filas():
+        with libro.open(ruta_hoja) as contenido:
+            for _, elemento in ElementTree.iterparse(contenido):
+                if elemento.tag != f'{_NS_HOJA}row':
+                    continue
+                fila = []
+                for celda in elemento.iter(f'{_NS_HOJA}c'):
+                    columna = _indice_columna(celda.get('r', '')) if celda.get('r') else len(fila)
+                    tipo = celda.get('t')
+                    if tipo == 'inlineStr':
+                        valor = ''.join(t.text or '' for t in celda.iter(f'{_NS_HOJA}t'))
+                    else:
+                        valor = celda.findtext(f'{_NS_HOJA}v') or ''
+                        if tipo == 's' and valor:
+                            valor = textos[int(valor)]
+                    fila.extend([''] * (columna - len(fila)))
+                    fila.append(valor)
+                elemento.clear()
+                yield fila
+
+    return filas()
+
+
+def leer_filas(archivo):
+    """Iterador de filas (listas de textos) de un archivo CSV o XLSX según su extensión"""
+    nombre = (getattr(archivo, 'name', '') or '').lower()
+    if nombre.endswith('.xlsx'):
+        return _leer_xlsx(archivo)
+    if nombre.endswith(('.csv', '.txt')):
+        return _leer_csv(archivo)
+    raise ErrorImportacion('Formato no soportado. Use un archivo CSV o XLSX.')
+
+
+def _decimal(valor):
+    """
+    Convierte 'L. 1,234.50', '1,200', '1234,50' o '1234.5' a Decimal; None si está
+    vacío, no es un número o es ambiguo. Una coma seguida de grupos de tres dígitos es
+    separador de miles; una coma seguida de uno o dos dígitos es separador decimal.
+    Cualquier otra coma ('1234,567', '1.234,50') se rechaza en lugar de adivinar.
+    """
+    texto = re.sub(r'^(HNL|L\.?|\$)\s*', '', str(valor or '').strip(), flags=re.IGNORECASE).replace(' ', '')
+    if not texto:
+        return None
+    if ',' in texto:
+        if _NUMERO_CON_MILES.match(texto):
+            texto = texto.replace(',', '')
+        elif _NUMERO_COMA_DECIMAL.match(texto):
+            texto = texto.replace(',', '.')
+        else:
+            return None
+    try:
+        numero = Decimal(texto)
+    except InvalidOperation:
+        return None
+    return numero if numero.is_finite() else None
+
+
+def _monto_valido(valor, nombre, maximo):
+    """(monto redondeado a 2 decimales, mensaje de error)"""
+    numero = _decimal(valor)
+    if numero is None:
+        return None, f'{nombre} vacío o inválido: "{valor}"'
+    numero = numero.quantize(Decimal('0.01'))
+    if numero < Decimal('0.01'):
+        return None, f'{nombre} debe ser mayor que cero'
+    if numero >= maximo:
+        return None, f'{nombre} demasiado grande: {numero}'
+    return numero, None
+
+
+def _columnas(encabezado, tipo):
+    columnas = {}
+    for posicion, titulo in enumerate(encabezado):
+        columna = _ALIAS_COLUMNA.get(_normalizar(titulo))
+        if columna and columna not in columnas:
+            columnas[columna] = posicion
+    faltantes = []
+    if 'codigo' not in columnas and 'dni' not in columnas:
+        faltantes.append('codigo o dni')
+    if 'monto' not in columnas:
+        faltantes.append('monto')
+    if not tipo and 'tipo' not in columnas:
+        faltantes.append('tipo (o elegir un tipo para todo el archivo)')
+    if faltantes:
+        raise ErrorImportacion(f'Faltan columnas en el encabezado: {", ".join(faltantes)}.')
+    return columnas
+
+
+def _indice_empleados(empresa):
+    """Índices en memoria {código: empleado} y {dni: empleado} de la empresa (una consulta)"""
+    from .models import Empleado
+
+    por_codigo, por_dni = {}, {}
+    for empleado in Empleado.objects.filter(empresa=empresa).values('pk', 'codigo', 'dni', 'nombres', 'apellidos', 'activo'):
+        por_codigo[_normalizar_clave(empleado['codigo'])] = empleado
+        por_dni[_normalizar_clave(empleado['dni'])] = empleado
+    return por_codigo, por_dni
+
+
+def _validar_filas(planilla, filas, tipo, resultado):
+    """Valida todas las filas y retorna los movimientos a crear agrupados por tipo"""
+    from .models import Bonificacion, Deduccion, HoraExtra
+
+    encabezado = next(filas, None)
+    if not encabezado:
+        raise ErrorImportacion('El archivo está vacío.')
+    columnas = _columnas(encabezado, tipo)
+
+    por_codigo, por_dni = _indice_empleados(planilla.proyecto.empresa)
+    con_linea = set(planilla.detalles.values_list('empleado_id', flat=True))
+    modelos = {'hora_extra': HoraExtra, 'bonificacion': Bonificacion, 'deduccion': Deduccion}
+    movimientos = {tipo_movimiento: [] for tipo_movimiento in TIPOS_MOVIMIENTO}
+
+    def celda(fila, columna):
+        posicion = columnas.get(columna)
+        if posicion is None or posicion >= len(fila):
+            return ''
+        return str(fila[posicion]).strip()
+
+    cantidad = 0
+    for numero, fila in enumerate(filas, start=2):
+        if not any(str(valor).strip() for valor in fila):
+            continue
+        cantidad += 1
+        if cantidad > MAX_FILAS_IMPORTACION:
+            raise ErrorImportacion(f'El archivo supera el máximo de {MAX_FILAS_IMPORTACION} filas.')
+
+        errores = []
+        tipo_fila = tipo
+        if 'tipo' in columnas and celda(fila, 'tipo'):
+            tipo_fila = _ALIAS_TIPO.get(_normalizar(celda(fila, 'tipo')).replace('-', '_'))
+            if tipo_fila is None:
+                errores.append(f'Tipo desconocido: "{celda(fila, "tipo")}"')
+        elif not tipo_fila:
+            errores.append('Falta el tipo')
+
+        codigo, dni = celda(fila, 'codigo'), celda(fila, 'dni')
+        empleado = None
+        if not codigo and not dni:
+            errores.append('Falta el código o DNI del empleado')
+        else:
+            por_codigo_fila = por_codigo.get(_normalizar_clave(codigo)) if codigo else None
+            por_dni_fila = por_dni.get(_normalizar_clave(dni)) if dni else None
+            if codigo and por_codigo_fila is None:
+                errores.append(f'No existe un empleado con código "{codigo}"')
+            elif dni and por_dni_fila is None:
+                errores.append(f'No existe un empleado con DNI "{dni}"')
+            elif por_codigo_fila and por_dni_fila and por_codigo_fila['pk'] != por_dni_fila['pk']:
+                errores.append(f'El código "{codigo}" y el DNI "{dni}" son de empleados distintos')
+            else:
+                empleado = por_codigo_fila or por_dni_fila
+                nombre = f'{empleado["nombres"]} {empleado["apellidos"]}'
+                if not empleado['activo']:
+                    errores.append(f'El empleado {nombre} está inactivo')
+                elif empleado['pk'] not in con_linea:
+                    errores.append(f'El empleado {nombre} no está en esta planilla')
+
+        monto, error = _monto_valido(celda(fila, 'monto'), 'Monto', Decimal('100000000'))
+        if error:
+            errores.append(error)
+        horas = None
+        if tipo_fila == 'hora_extra':
+            horas, error = _monto_valido(celda(fila, 'horas'), 'Horas', Decimal('1000'))
+            if error:
+                errores.append(error)
+
+        descripcion = celda(fila, 'descripcion') or TIPOS_MOVIMIENTO.get(tipo_fila, '')
+        if len(descripcion) > 200:
+            errores.append('La descripción supera los 200 caracteres')
+
+        if errores:
+            resultado.agregar_error(numero, '; '.join(errores))
+            continue
+
+        datos = {'planilla': planilla, 'empleado_id': empleado['pk'], 'descripcion': descripcion, 'monto': monto}
+        if tipo_fila == 'hora_extra':
+            datos['cantidad_horas'] = horas
+        movimientos[tipo_fila].append(modelos[tipo_fila](**datos))
+        resultado.empleados.add(empleado['pk'])
+
+    if not cantidad:
+        raise ErrorImportacion('El archivo no tiene filas de datos.')
+    return movimientos
+
+
+def importar_movimientos_planilla(planilla, archivo, tipo=None):
+    """
+    Importa las horas extra, bonificaciones y deducciones del archivo a la planilla.
+
+    tipo aplica a las filas sin columna tipo. Lanza ErrorImportacion si el archivo
+    no se puede leer y PlanillaCerrada si la planilla está cerrada. Los errores de
+    cada fila quedan en el resultado y en ese caso no se guarda ninguna fila.
+    Retorna un ResultadoImportacion.
+    """
+    from .models import Planilla
+
+    resultado = ResultadoImportacion()
+    movimientos = _validar_filas(planilla, iter(leer_filas(archivo)), tipo, resultado)
+    if resultado.errores:
+        resultado.empleados.clear()
+        return resultado
+
+    with transaction.atomic():
+        # Bloquear la planilla serializa la importación con los guardados del formulario y el cierre
+        if Planilla.objects.select_for_update().filter(pk=planilla.pk).values_list('cerrada', flat=True).get():
+            raise PlanillaCerrada()
+        with recalculos_suspendidos():
+            for tipo_movimiento, objetos in movimientos.items():
+                if objetos:
+                    type(objetos[0]).objects.bulk_create(objetos, batch_size=500)
+                    resultado.creados[tipo_movimiento] = len(objetos)
+
+        planilla.recalcular_totales_empleados(resultado.empleados)
+        programar_recalculo_planilla(planilla)
+
+    return resultado
@@ -0,0 +1,346 @@
+"""
+Importación en bloque de usos de maquinaria (bitácoras de horómetro).
+
+Las máquinas y proyectos del archivo se buscan en índices en memoria de la
+empresa (una consulta cada uno). Las máquinas involucradas se bloquean con una
+sola consulta y sus lecturas se ordenan en memoria por fecha y horómetro, de modo
+que los horómetros crecientes y los intervalos sin traslape se validan en una sola
+pasada por máquina, en lugar de las consultas de UsoMaquinaria.clean() por uso.
+Si alguna fila tiene errores no se importa nada y se reportan los errores por
+fila; si todas son válidas los usos se insertan con un bulk_create y el estado de
+cada máquina (horómetro, último uso, uso activo) se actualiza una sola vez.
+
+Columnas reconocidas (la primera fila es el encabezado, sin distinguir
+mayúsculas ni tildes): maquinaria, proyecto, fecha_inicio, fecha_fin,
+horometro_inicial, horometro_final, tarifa, descripcion y observaciones. La
+maquinaria y el proyecto se indican por su código; sin tarifa se usa la tarifa
+vigente de la máquina en la fecha de inicio, y una tarifa distinta de esa queda
+como tarifa manual (ver tarifas_maquinaria). Solo el último uso de cada máquina puede quedar abierto
+(sin fecha de fin ni horómetro final).
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+
+from .importacion_planilla import (
+    ErrorImportacion, MAX_FILAS_IMPORTACION, _decimal, _normalizar, _normalizar_clave, leer_filas
+)
+from .signals import programar_recalculo_usos
+from .tarifas_maquinaria import historiales_tarifas, tarifa_en_fecha
+
+# Límite de UsoMaquinaria.horometro_* y tarifa_aplicada (max_digits=10, decimal_places=2)
+VALOR_MAXIMO = Decimal('100000000')
+
+# Encabezados aceptados para cada columna (ya normalizados)
+_ALIAS_COLUMNA = {
+    'maquinaria': 'maquinaria', 'maquina': 'maquinaria', 'codigo maquinaria': 'maquinaria', 'equipo': 'maquinaria',
+    'proyecto': 'proyecto', 'codigo proyecto': 'proyecto',
+    'fecha_inicio': 'fecha_inicio', 'fecha inicio': 'fecha_inicio', 'inicio': 'fecha_inicio', 'fecha': 'fecha_inicio',
+    'fecha_fin': 'fecha_fin', 'fecha fin': 'fecha_fin', 'fin': 'fecha_fin',
+    'horometro_inicial': 'horometro_inicial', 'horometro inicial': 'horometro_inicial',
+    'horometro_final': 'horometro_final', 'horometro final': 'horometro_final',
+    'tarifa': 'tarifa', 'tarifa_aplicada': 'tarifa', 'tarifa aplicada': 'tarifa', 'tarifa hora': 'tarifa',
+    'descripcion': 'descripcion', 'descripcion_trabajo': 'descripcion', 'trabajo': 'descripcion',
+    'observaciones': 'observaciones',
+}
+
+_FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y')
+
+
+class ResultadoImportacionUsos:
+    """Resultado de una importación: usos creados y máquinas afectadas o errores por fila"""
+
+    def __init__(self):
+        self.creados = 0
+        self.errores = []
+        self.maquinarias = set()
+
+    def agregar_error(self, fila, mensaje):
+        self.errores.append((fila, mensaje))
+
+
+class _Lectura:
+    """Fila válida del archivo, pendiente de validar contra las demás lecturas de su máquina"""
+
+    def __init__(self, numero, maquinaria_id, proyecto_id, datos):
+        self.numero = numero
+        self.maquinaria_id = maquinaria_id
+        self.proyecto_id = proyecto_id
+        self.datos = datos
+
+    @property
+    def abierta(self):
+        return self.datos['fecha_fin'] is None
+
+
+def _fecha(valor):
+    """Convierte 'AAAA-MM-DD', 'DD/MM/AAAA' o el número de serie de Excel en fecha; None si no es válida"""
+    texto = str(valor or '').strip()
+    if not texto:
+        return None
+    if texto.replace('.', '', 1).isdigit():
+        # Las celdas con formato de fecha de un XLSX traen días desde 1899-12-30
+        try:
+            return date(1899, 12, 30) + timedelta(days=int(float(texto)))
+        except (OverflowError, ValueError):
+            return None
+    for formato in _FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto[:10] if formato == '%Y-%m-%d' else texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _valor(valor, nombre, minimo=Decimal('0.00')):
+    """(número redondeado a 2 decimales, mensaje de error)"""
+    numero = _decimal(valor)
+    if numero is None:
+        return None, f'{nombre} vacío o inválido: "{valor}"'
+    numero = numero.quantize(Decimal('0.01'))
+    if numero < minimo:
+        return None, f'{nombre} debe ser mayor o igual a {minimo}'
+    if numero >= VALOR_MAXIMO:
+        return None, f'{nombre} demasiado grande: {numero}'
+    return numero, None
+
+
+def _columnas(encabezado):
+    columnas = {}
+    for posicion, titulo in enumerate(encabezado):
+        columna = _ALIAS_COLUMNA.get(_normalizar(titulo))
+        if columna and columna not in columnas:
+            columnas[columna] = posicion
+    faltantes = [
+        columna for columna in ('maquinaria', 'proyecto', 'fecha_inicio', 'horometro_inicial')
+        if columna not in columnas
+    ]
+    if faltantes:
+        raise ErrorImportacion(f'Faltan columnas en el encabezado: {", ".join(faltantes)}.')
+    return columnas
+
+
+def _indice(queryset):
+    """Índice en memoria {código normalizado: fila} (una consulta)"""
+    return {_normalizar_clave(fila['codigo']): fila for fila in queryset}
+
+
+def _leer_lecturas(empresa, filas, resultado):
+    """Valida cada fila por separado y retorna las lecturas válidas"""
+    from .models import Maquinaria, Proyecto
+
+    encabezado = next(filas, None)
+    if not encabezado:
+        raise ErrorImportacion('El archivo está vacío.')
+    columnas = _columnas(encabezado)
+
+    maquinarias = _indice(Maquinaria.objects.filter(empresa=empresa).values('pk', 'codigo', 'activo'))
+    proyectos = _indice(Proyecto.objects.filter(empresa=empresa).values('pk', 'codigo'))
+
+    def celda(fila, columna):
+        posicion = columnas.get(columna)
+        if posicion is None or posicion >= len(fila):
+            return ''
+        return str(fila[posicion]).strip()
+
+    lecturas = []
+    cantidad = 0
+    for numero, fila in enumerate(filas, start=2):
+        if not any(str(valor).strip() for valor in fila):
+            continue
+        cantidad += 1
+        if cantidad > MAX_FILAS_IMPORTACION:
+            raise ErrorImportacion(f'El archivo supera el máximo de {MAX_FILAS_IMPORTACION} filas.')
+
+        errores = []
+        maquinaria = maquinarias.get(_normalizar_clave(celda(fila, 'maquinaria')))
+        if maquinaria is None:
+            errores.append(f'No existe una maquinaria con código "{celda(fila, "maquinaria")}"')
+        elif not maquinaria['activo']:
+            errores.append(f'La maquinaria {maquinaria["codigo"]} está inactiva')
+        proyecto = proyectos.get(_normalizar_clave(celda(fila, 'proyecto')))
+        if proyecto is None:
+            errores.append(f'No existe un proyecto con código "{celda(fila, "proyecto")}"')
+
+        fecha_inicio = _fecha(celda(fila, 'fecha_inicio'))
+        if fecha_inicio is None:
+            errores.append(f'Fecha de inicio vacía o inválida: "{celda(fila, "fecha_inicio")}"')
+        fecha_fin = None
+        if celda(fila, 'fecha_fin'):
+            fecha_fin = _fecha(celda(fila, 'fecha_fin'))
+            if fecha_fin is None:
+                errores.append(f'Fecha de fin inválida: "{celda(fila, "fecha_fin")}"')
+            elif fecha_inicio and fecha_fin < fecha_inicio:
+                errores.append('La fecha de fin es anterior a la fecha de inicio')
+
+        horometro_inicial, error = _valor(celda(fila, 'horometro_inicial'), 'Horómetro inicial')
+        if error:
+            errores.append(error)
+        horometro_final = None
+        if celda(fila, 'horometro_final'):
+            horometro_final, error = _valor(celda(fila, 'horometro_final'), 'Horómetro final')
+            if error:
+                errores.append(error)
+            elif horometro_inicial is not None and horometro_final <= horometro_inicial:
+                errores.append('El horómetro final debe ser mayor al inicial')
+        if bool(celda(fila, 'fecha_fin')) != bool(celda(fila, 'horometro_final')):
+            errores.append('Un uso finalizado necesita la fecha de fin y el horómetro final')
+
+        tarifa = None
+        if celda(fila, 'tarifa'):
+            tarifa, error = _valor(celda(fila, 'tarifa'), 'Tarifa', minimo=Decimal('0.01'))
+            if error:
+                errores.append(error)
+
+        if errores:
+            resultado.agregar_error(numero, '; '.join(errores))
+            continue
+
+        lecturas.append(_Lectura(numero, maquinaria['pk'], proyecto['pk'], {
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'horometro_inicial': horometro_inicial,
+            'horometro_final': horometro_final,
+            'tarifa_aplicada': tarifa,
+            'descripcion_trabajo': celda(fila, 'descripcion') or None,
+            'observaciones': celda(fila, 'observaciones') or None,
+        }))
+
+    if not cantidad:
+        raise ErrorImportacion('El archivo no tiene filas de datos.')
+    return lecturas
+
+
+def _validar_secuencia(maquinaria, fin_ultimo_uso, lecturas, resultado):
+    """
+    Valida en una pasada las lecturas de una máquina ya ordenadas por fecha y horómetro:
+    cada uso empieza donde terminó el anterior o después (horómetro y fecha) y solo el
+    último puede quedar abierto. La primera lectura continúa el historial de la máquina.
+    """
+    if maquinaria.uso_activo_id:
+        resultado.agregar_error(
+            lecturas[0].numero,
+            f'La maquinaria {maquinaria.codigo} tiene un uso activo. Debe finalizarlo antes de importar usos nuevos.'
+        )
+        return
+    if maquinaria.estado in ('mantenimiento', 'fuera_servicio'):
+        resultado.agregar_error(
+            lecturas[0].numero,
+            f'La maquinaria {maquinaria.codigo} está {maquinaria.get_estado_display().lower()} y no puede ser utilizada.'
+        )
+        return
+
+    horometro_minimo = max(maquinaria.horometro_actual, maquinaria.ultimo_horometro_final or Decimal('0.00'))
+    fecha_minima = fin_ultimo_uso
+    anterior = None
+    for lectura in lecturas:
+        datos = lectura.datos
+        if anterior is not None and anterior.abierta:
+            resultado.agregar_error(
+                anterior.numero,
+                f'Solo el último uso de la maquinaria {maquinaria.codigo} puede quedar sin fecha de fin'
+            )
+        if datos['horometro_inicial'] < horometro_minimo:
+            origen = f'fila {anterior.numero}' if anterior else 'último horómetro registrado'
+            resultado.agregar_error(
+                lectura.numero,
+                f'El horómetro inicial ({datos["horometro_inicial"]}) es menor a {horometro_minimo} hrs ({origen})'
+            )
+        if fecha_minima and datos['fecha_inicio'] < fecha_minima:
+            origen = f'fila {anterior.numero}' if anterior else 'último uso registrado'
+            resultado.agregar_error(
+                lectura.numero,
+                f'El uso se traslapa con el anterior, que termina el {fecha_minima:%d/%m/%Y} ({origen})'
+            )
+        horometro_minimo = max(horometro_minimo, datos['horometro_final'] or datos['horometro_inicial'])
+        fecha_minima = max(fecha_minima or datos['fecha_inicio'], datos['fecha_fin'] or datos['fecha_inicio'])
+        anterior = lectura
+
+
+def importar_usos_maquinaria(empresa, filas):
+    """
+    Importa los usos de maquinaria de las filas (encabezado y filas de textos, por
+    ejemplo de leer_filas()). Lanza ErrorImportacion si el archivo no se puede
+    leer. Los errores de cada fila quedan en el resultado y en ese caso no se guarda
+    ninguna fila. Retorna un ResultadoImportacionUsos.
+    """
+    from .models import Maquinaria, UsoMaquinaria
+
+    resultado = ResultadoImportacionUsos()
+    lecturas = _leer_lecturas(empresa, iter(filas), resultado)
+
+    por_maquinaria = {}
+    for lectura in lecturas:
+        por_maquinaria.setdefault(lectura.maquinaria_id, []).append(lectura)
+    for lecturas_maquinaria in por_maquinaria.values():
+        lecturas_maquinaria.sort(key=lambda lectura: (
+            lectura.datos['fecha_inicio'], lectura.datos['horometro_inicial'], lectura.numero
+        ))
+
+    with transaction.atomic():
+        # bulk_create no dispara los signals: el estado de las máquinas y los recálculos se hacen al final.
+        # Bloquear las máquinas serializa la importación con los retiros y devoluciones (ver uso_maquinaria)
+        maquinarias = {
+            maquinaria.pk: maquinaria
+            for maquinaria in Maquinaria.objects.select_for_update().filter(pk__in=por_maquinaria).order_by('pk')
+        }
+        fin_ultimo_uso = {
+            maquinaria_id: fecha_fin or fecha_inicio
+            for maquinaria_id, fecha_inicio, fecha_fin in UsoMaquinaria.objects.filter(
+                pk__in=[maquinaria.ultimo_uso_id for maquinaria in maquinarias.values() if maquinaria.ultimo_uso_id]
+            ).values_list('maquinaria_id', 'fecha_inicio', 'fecha_fin')
+        }
+        for maquinaria_id, lecturas_maquinaria in por_maquinaria.items():
+            _validar_secuencia(
+                maquinarias[maquinaria_id], fin_ultimo_uso.get(maquinaria_id), lecturas_maquinaria, resultado
+            )
+        if resultado.errores:
+            resultado.errores.sort()
+            return resultado
+
+        historiales = historiales_tarifas(por_maquinaria)
+        usos_por_maquinaria = {}
+        for maquinaria_id, lecturas_maquinaria in por_maquinaria.items():
+            maquinaria = maquinarias[maquinaria_id]
+            usos_maquinaria = usos_por_maquinaria[maquinaria_id] = []
+            for lectura in lecturas_maquinaria:
+                uso = UsoMaquinaria(maquinaria=maquinaria, proyecto_id=lectura.proyecto_id, **lectura.datos)
+                tarifa_vigente = tarifa_en_fecha(historiales.get(maquinaria_id), uso.fecha_inicio)
+                if tarifa_vigente is None:
+                    tarifa_vigente = maquinaria.tarifa_hora
+                if not uso.tarifa_aplicada:
+                    uso.tarifa_aplicada = tarifa_vigente
+                uso.tarifa_manual = uso.tarifa_aplicada != tarifa_vigente
+                uso.calcular_costos()
+                usos_maquinaria.append(uso)
+        usos = [uso for usos_maquinaria in usos_por_maquinaria.values() for uso in usos_maquinaria]
+        UsoMaquinaria.objects.bulk_create(usos, batch_size=500)
+
+        # Estado de cada máquina según su última lectura (una sola actualización para todas)
+        for maquinaria_id, usos_maquinaria in usos_por_maquinaria.items():
+            maquinaria = maquinarias[maquinaria_id]
+            if usos_maquinaria[-1].fecha_fin is None:
+                maquinaria.uso_activo = usos_maquinaria[-1]
+                maquinaria.estado = 'en_uso'
+            finalizados = [uso for uso in usos_maquinaria if uso.horometro_final]
+            if finalizados:
+                maquinaria.horometro_actual = finalizados[-1].horometro_final
+                maquinaria.ultimo_horometro_final = finalizados[-1].horometro_final
+                maquinaria.ultimo_uso = finalizados[-1]
+        Maquinaria.objects.bulk_update(
+            maquinarias.values(),
+            ['estado', 'uso_activo', 'horometro_actual', 'ultimo_horometro_final', 'ultimo_uso'],
+            batch_size=500,
+        )
+
+        programar_recalculo_usos(usos)
+
+    resultado.creados = len(usos)
+    resultado.maquinarias = set(por_maquinaria)
+    return resultado
+
+
+def importar_archivo_usos_maquinaria(empresa, archivo):
+    """Importa los usos de maquinaria de un archivo CSV o XLSX (ver importar_usos_maquinaria)"""
+    return importar_usos_maquinaria(empresa, leer_filas(archivo))
@@ -0,0 +1,66 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from proyectos.generacion_planillas import generar_planillas
+from proyectos.models import Empresa, Planilla, Proyecto
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera en bloque las planillas de un período para los proyectos en progreso de una empresa, '
+        'con una línea por cada empleado asignado activo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', required=True, help='Código de la empresa')
+        parser.add_argument('--inicio', required=True, help='Inicio del período (AAAA-MM-DD)')
+        parser.add_argument('--fin', required=True, help='Fin del período (AAAA-MM-DD)')
+        parser.add_argument('--fecha-pago', help='Fecha de pago (AAAA-MM-DD, por defecto el fin del período)')
+        parser.add_argument(
+            '--tipo',
+            default='quincenal',
+            choices=[tipo for tipo, _ in Planilla.TIPO_PLANILLA_CHOICES],
+            help='Tipo de planilla (por defecto quincenal)',
+        )
+        parser.add_argument('--proyecto', action='append', help='Código de proyecto (repetible; por defecto todos en progreso)')
+
+    def _fecha(self, valor, nombre):
+        try:
+            return date.fromisoformat(valor)
+        except ValueError:
+            raise CommandError(f'{nombre} inválida: {valor} (formato AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            empresa = Empresa.objects.get(codigo__iexact=options['empresa'])
+        except Empresa.DoesNotExist:
+            raise CommandError(f'No existe la empresa {options["empresa"]}')
+
+        periodo_inicio = self._fecha(options['inicio'], 'Fecha de inicio')
+        periodo_fin = self._fecha(options['fin'], 'Fecha de fin')
+        fecha_pago = self._fecha(options['fecha_pago'], 'Fecha de pago') if options['fecha_pago'] else periodo_fin
+
+        proyectos = None
+        if options['proyecto']:
+            proyectos = Proyecto.objects.filter(empresa=empresa, codigo__in=options['proyecto'])
+            faltantes = set(options['proyecto']) - set(proyectos.values_list('codigo', flat=True))
+            if faltantes:
+                raise CommandError(f'Proyectos no encontrados: {", ".join(sorted(faltantes))}')
+
+        try:
+            resultado = generar_planillas(
+                empresa, periodo_inicio, periodo_fin, options['tipo'], fecha_pago, proyectos=proyectos
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        for planilla in resultado.planillas:
+            self.stdout.write(f'{planilla.proyecto.codigo}: planilla {planilla.pk} por ${planilla.monto_total:,.2f}')
+        for proyecto, motivo in resultado.omitidos:
+            self.stdout.write(self.style.WARNING(f'{proyecto.codigo}: omitido ({motivo})'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(resultado.planillas)} planillas generadas con {resultado.total_detalles} líneas '
+            f'(total ${resultado.monto_total:,.2f}).'
+        ))
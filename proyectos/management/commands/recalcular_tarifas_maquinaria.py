@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from proyectos.models import UsoMaquinaria
+from proyectos.tarifas_maquinaria import recalcular_tarifas_usos
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la tarifa aplicada y el costo de los usos de maquinaria con la tarifa '
+        'vigente (según el historial de tarifas) en la fecha de inicio de cada uso.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', help='Código de la empresa a procesar (por defecto todas)')
+        parser.add_argument('--maquinaria', help='Código de la maquinaria a procesar (por defecto todas)')
+        parser.add_argument('--desde', help='Solo usos que inician desde esta fecha (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Solo usos que inician hasta esta fecha (AAAA-MM-DD)')
+        parser.add_argument(
+            '--solo-verificar',
+            action='store_true',
+            help='Solo reporta los usos cuya tarifa no coincide con el historial, sin escribir cambios',
+        )
+        parser.add_argument(
+            '--incluir-manuales',
+            action='store_true',
+            help='También reemplaza las tarifas manuales (negociadas) por la del historial',
+        )
+
+    def handle(self, *args, **options):
+        usos = UsoMaquinaria.objects.all()
+        if options['empresa']:
+            usos = usos.filter(maquinaria__empresa__codigo__iexact=options['empresa'])
+        if options['maquinaria']:
+            usos = usos.filter(maquinaria__codigo__iexact=options['maquinaria'])
+        for opcion, filtro in (('desde', 'fecha_inicio__gte'), ('hasta', 'fecha_inicio__lte')):
+            if options[opcion]:
+                fecha = parse_date(options[opcion])
+                if fecha is None:
+                    raise CommandError(f'Fecha inválida en --{opcion}: {options[opcion]}. Use el formato AAAA-MM-DD.')
+                usos = usos.filter(**{filtro: fecha})
+
+        resultado = recalcular_tarifas_usos(
+            usos, solo_verificar=options['solo_verificar'], incluir_manuales=options['incluir_manuales']
+        )
+        resumen = (
+            f'{resultado.revisados} usos revisados, {resultado.actualizados} con tarifa distinta a la vigente '
+            f'(costo {resultado.costo_anterior} -> {resultado.costo_nuevo}).'
+        )
+        if resultado.manuales:
+            resumen += f' {resultado.manuales} usos con tarifa manual se conservaron (use --incluir-manuales).'
+
+        if options['solo_verificar']:
+            if resultado.actualizados:
+                raise CommandError(resumen)
+            self.stdout.write(self.style.SUCCESS(resumen))
+            return
+        self.stdout.write(self.style.SUCCESS(f'{resumen} Tarifas y costos actualizados.'))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from proyectos.models import Proyecto, CostoMensualProyecto
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye desde cero los costos mensuales de los proyectos (CostoMensualProyecto) '
+        'y reporta las diferencias encontradas contra los montos almacenados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', help='Código de la empresa a procesar (por defecto todas)')
+        parser.add_argument(
+            '--solo-verificar',
+            action='store_true',
+            help='Solo compara los montos almacenados contra los registros fuente, sin escribir cambios',
+        )
+
+    def handle(self, *args, **options):
+        proyectos = Proyecto.objects.all()
+        if options['empresa']:
+            proyectos = proyectos.filter(empresa__codigo__iexact=options['empresa'])
+
+        calculados = {clave: monto for clave, monto in CostoMensualProyecto.calcular(proyectos).items() if monto}
+        almacenados = {
+            (fila.proyecto_id, fila.mes, fila.categoria): fila.monto
+            for fila in CostoMensualProyecto.objects.filter(proyecto__in=proyectos)
+        }
+
+        diferencias = 0
+        for clave in sorted(set(calculados) | set(almacenados)):
+            antes, despues = almacenados.get(clave), calculados.get(clave)
+            if antes != despues:
+                diferencias += 1
+                proyecto_id, mes, categoria = clave
+                self.stdout.write(self.style.WARNING(
+                    f'Proyecto {proyecto_id} {mes:%Y-%m} {categoria}: {antes or 0} -> {despues or 0}'
+                ))
+
+        if options['solo_verificar']:
+            if diferencias:
+                raise CommandError(f'{diferencias} montos mensuales no coinciden con los registros fuente.')
+            self.stdout.write(self.style.SUCCESS(f'{len(calculados)} montos mensuales verificados sin diferencias.'))
+            return
+
+        empresas = dict(proyectos.values_list('pk', 'empresa_id'))
+        with transaction.atomic():
+            CostoMensualProyecto.objects.filter(proyecto__in=proyectos).delete()
+            CostoMensualProyecto.objects.bulk_create([
+                CostoMensualProyecto(
+                    empresa_id=empresas[proyecto_id], proyecto_id=proyecto_id, mes=mes, categoria=categoria, monto=monto
+                )
+                for (proyecto_id, mes, categoria), monto in calculados.items()
+            ], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(calculados)} montos mensuales reconstruidos, {diferencias} diferencias corregidas.'
+        ))
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from proyectos.cache_dashboard import invalidar_dashboard
+from proyectos.models import Proyecto, ProyectoResumenFinanciero
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye desde cero el resumen financiero de los proyectos (ProyectoResumenFinanciero) '
+        'y reporta las diferencias encontradas contra los totales almacenados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', help='Código de la empresa a procesar (por defecto todas)')
+        parser.add_argument(
+            '--solo-verificar',
+            action='store_true',
+            help='Solo compara los totales almacenados contra los registros fuente, sin escribir cambios',
+        )
+
+    def handle(self, *args, **options):
+        proyectos = Proyecto.objects.all()
+        if options['empresa']:
+            proyectos = proyectos.filter(empresa__codigo__iexact=options['empresa'])
+
+        calculados = ProyectoResumenFinanciero.calcular_totales(proyectos)
+        almacenados = ProyectoResumenFinanciero.objects.in_bulk(list(calculados.keys()))
+
+        nuevos, modificados = [], []
+        for proyecto_id, totales in calculados.items():
+            resumen = almacenados.get(proyecto_id)
+            if resumen is None:
+                nuevos.append(ProyectoResumenFinanciero(proyecto_id=proyecto_id, **totales))
+                self.stdout.write(self.style.WARNING(f'Proyecto {proyecto_id}: sin resumen'))
+                continue
+
+            diferencias = {
+                campo: (getattr(resumen, campo), valor)
+                for campo, valor in totales.items()
+                if getattr(resumen, campo) != valor
+            }
+            if diferencias:
+                detalle = ', '.join(f'{campo}: {antes} -> {despues}' for campo, (antes, despues) in diferencias.items())
+                self.stdout.write(self.style.WARNING(f'Proyecto {proyecto_id}: {detalle}'))
+                for campo, valor in totales.items():
+                    setattr(resumen, campo, valor)
+                modificados.append(resumen)
+
+        total_diferencias = len(nuevos) + len(modificados)
+
+        if options['solo_verificar']:
+            if total_diferencias:
+                raise CommandError(f'{total_diferencias} de {len(calculados)} resúmenes no coinciden con los registros fuente.')
+            self.stdout.write(self.style.SUCCESS(f'{len(calculados)} resúmenes verificados sin diferencias.'))
+            return
+
+        with transaction.atomic():
+            ProyectoResumenFinanciero.objects.bulk_create(nuevos, batch_size=500)
+            ProyectoResumenFinanciero.objects.bulk_update(
+                modificados, ProyectoResumenFinanciero.CAMPOS_TOTALES, batch_size=500
+            )
+
+        # bulk_create/bulk_update no disparan signals: invalidar el dashboard de las empresas afectadas
+        proyecto_ids = [resumen.proyecto_id for resumen in nuevos + modificados]
+        empresa_ids = set(Proyecto.objects.filter(pk__in=proyecto_ids).values_list('empresa_id', flat=True))
+        for empresa_id in empresa_ids:
+            invalidar_dashboard(empresa_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(calculados)} resúmenes procesados: {len(nuevos)} creados, {len(modificados)} corregidos.'
+        ))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from proyectos.models import Maquinaria, UsoMaquinariaMensual
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye desde cero los usos mensuales de la maquinaria (UsoMaquinariaMensual) '
+        'y reporta las diferencias encontradas contra los valores almacenados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', help='Código de la empresa a procesar (por defecto todas)')
+        parser.add_argument(
+            '--solo-verificar',
+            action='store_true',
+            help='Solo compara los valores almacenados contra los usos, sin escribir cambios',
+        )
+
+    def handle(self, *args, **options):
+        maquinarias = Maquinaria.objects.all()
+        if options['empresa']:
+            maquinarias = maquinarias.filter(empresa__codigo__iexact=options['empresa'])
+
+        calculados = UsoMaquinariaMensual.calcular(maquinarias)
+        almacenados = {
+            (fila.maquinaria_id, fila.proyecto_id, fila.mes): (fila.horas, fila.costo, fila.cantidad_usos)
+            for fila in UsoMaquinariaMensual.objects.filter(maquinaria__in=maquinarias)
+        }
+
+        diferencias = 0
+        for clave in sorted(set(calculados) | set(almacenados)):
+            antes, despues = almacenados.get(clave), calculados.get(clave)
+            if antes != despues:
+                diferencias += 1
+                maquinaria_id, proyecto_id, mes = clave
+                self.stdout.write(self.style.WARNING(
+                    f'Maquinaria {maquinaria_id} proyecto {proyecto_id} {mes:%Y-%m}: '
+                    f'{antes or "sin fila"} -> {despues or "sin fila"}'
+                ))
+
+        if options['solo_verificar']:
+            if diferencias:
+                raise CommandError(f'{diferencias} usos mensuales no coinciden con los usos de maquinaria.')
+            self.stdout.write(self.style.SUCCESS(f'{len(calculados)} usos mensuales verificados sin diferencias.'))
+            return
+
+        empresas = dict(maquinarias.values_list('pk', 'empresa_id'))
+        with transaction.atomic():
+            UsoMaquinariaMensual.objects.filter(maquinaria__in=maquinarias).delete()
+            UsoMaquinariaMensual.objects.bulk_create([
+                UsoMaquinariaMensual(
+                    empresa_id=empresas[maquinaria_id], maquinaria_id=maquinaria_id, proyecto_id=proyecto_id, mes=mes,
+                    horas=horas, costo=costo, cantidad_usos=cantidad
+                )
+                for (maquinaria_id, proyecto_id, mes), (horas, costo, cantidad) in calculados.items()
+            ], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(calculados)} usos mensuales reconstruidos, {diferencias} diferencias corregidas.'
+        ))
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.17 on 2026-10-17 00:11
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def poblar_resumenes(apps, schema_editor):
+    """
+    Calcula el resumen financiero de los proyectos existentes con una consulta
+    agrupada por fuente (la misma lógica que Proyecto.objects.with_financials()).
+    """
+    Proyecto = apps.get_model('proyectos', 'Proyecto')
+    ProyectoResumenFinanciero = apps.get_model('proyectos', 'ProyectoResumenFinanciero')
+    DetallePlanilla = apps.get_model('proyectos', 'DetallePlanilla')
+    Gasto = apps.get_model('proyectos', 'Gasto')
+    Pago = apps.get_model('proyectos', 'Pago')
+    OrdenCambio = apps.get_model('proyectos', 'OrdenCambio')
+    UsoMaquinaria = apps.get_model('proyectos', 'UsoMaquinaria')
+
+    def sumar(queryset, ruta, expresion):
+        filas = queryset.order_by().values(ruta).annotate(total=models.Sum(expresion)).values_list(ruta, 'total')
+        return {proyecto_id: total or Decimal('0.00') for proyecto_id, total in filas}
+
+    totales_planillas = sumar(DetallePlanilla.objects.all(), 'planilla__proyecto', 'salario_devengado')
+    for nombre_modelo, signo in [('Bonificacion', 1), ('HoraExtra', 1), ('Deduccion', -1)]:
+        Modelo = apps.get_model('proyectos', nombre_modelo)
+        en_detalle = models.Exists(DetallePlanilla.objects.filter(
+            planilla=models.OuterRef('planilla'), empleado=models.OuterRef('empleado')
+        ))
+        for proyecto_id, total in sumar(Modelo.objects.filter(en_detalle), 'planilla__proyecto', 'monto').items():
+            totales_planillas[proyecto_id] = totales_planillas.get(proyecto_id, Decimal('0.00')) + signo * total
+
+    totales = {
+        'total_planillas': totales_planillas,
+        'total_gastos': sumar(Gasto.objects.all(), 'proyecto', 'monto'),
+        'total_maquinaria': sumar(
+            UsoMaquinaria.objects.filter(horometro_final__gt=0, horometro_inicial__gt=0), 'proyecto',
+            models.ExpressionWrapper(
+                (models.F('horometro_final') - models.F('horometro_inicial')) * models.F('tarifa_aplicada'),
+                output_field=models.DecimalField(max_digits=18, decimal_places=2),
+            ),
+        ),
+        'total_ordenes_cambio': sumar(
+            OrdenCambio.objects.filter(estado__in=['aprobada', 'en_ejecucion', 'completada']), 'proyecto', 'monto_adicional'
+        ),
+        'total_pagado': sumar(Pago.objects.all(), 'proyecto', 'monto'),
+    }
+
+    ProyectoResumenFinanciero.objects.bulk_create([
+        ProyectoResumenFinanciero(
+            proyecto_id=proyecto_id,
+            **{campo: valores.get(proyecto_id, Decimal('0.00')) for campo, valores in totales.items()}
+        )
+        for proyecto_id in Proyecto.objects.values_list('pk', flat=True)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0027_empresa_plan_elegido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProyectoResumenFinanciero',
+            fields=[
+                ('proyecto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen_financiero', serialize=False, to='proyectos.proyecto', verbose_name='Proyecto')),
+                ('total_planillas', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Total Planillas')),
+                ('total_gastos', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Total Gastos')),
+                ('total_maquinaria', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Total Maquinaria')),
+                ('total_ordenes_cambio', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Total Órdenes de Cambio')),
+                ('total_pagado', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Total Pagado por el Cliente')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última Actualización')),
+            ],
+            options={
+                'verbose_name': 'Resumen Financiero de Proyecto',
+                'verbose_name_plural': 'Resúmenes Financieros de Proyectos',
+            },
+        ),
+        migrations.RunPython(poblar_resumenes, migrations.RunPython.noop),
+    ]
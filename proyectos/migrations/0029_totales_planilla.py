@@ -0,0 +1,81 @@
+# Generated by Django 4.2.17 on 2026-10-17 00:14
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def poblar_totales_planillas(apps, schema_editor):
+    """
+    Calcula los totales persistidos de las planillas existentes con una consulta
+    agrupada por (planilla, empleado) para cada tabla hija.
+    """
+    Planilla = apps.get_model('proyectos', 'Planilla')
+    DetallePlanilla = apps.get_model('proyectos', 'DetallePlanilla')
+
+    def montos(nombre_modelo):
+        Modelo = apps.get_model('proyectos', nombre_modelo)
+        filas = Modelo.objects.order_by().values('planilla', 'empleado').annotate(
+            total=models.Sum('monto')
+        ).values_list('planilla', 'empleado', 'total')
+        return {(planilla_id, empleado_id): total for planilla_id, empleado_id, total in filas}
+
+    deducciones = montos('Deduccion')
+    bonificaciones = montos('Bonificacion')
+    horas_extra = montos('HoraExtra')
+
+    detalles = list(DetallePlanilla.objects.all())
+    totales_planilla = {}
+    for detalle in detalles:
+        clave = (detalle.planilla_id, detalle.empleado_id)
+        detalle.total_deducciones = deducciones.get(clave) or Decimal('0')
+        detalle.total_bonificaciones = bonificaciones.get(clave) or Decimal('0')
+        detalle.monto_horas_extra = horas_extra.get(clave) or Decimal('0')
+        detalle.total_neto = (
+            detalle.salario_devengado + detalle.total_bonificaciones
+            + detalle.monto_horas_extra - detalle.total_deducciones
+        )
+        totales_planilla[detalle.planilla_id] = totales_planilla.get(detalle.planilla_id, Decimal('0')) + detalle.total_neto
+    DetallePlanilla.objects.bulk_update(
+        detalles, ['total_deducciones', 'total_bonificaciones', 'monto_horas_extra', 'total_neto'], batch_size=500
+    )
+
+    planillas = list(Planilla.objects.filter(pk__in=totales_planilla))
+    for planilla in planillas:
+        planilla.monto_total = totales_planilla[planilla.pk]
+    Planilla.objects.bulk_update(planillas, ['monto_total'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0028_proyectoresumenfinanciero'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detalleplanilla',
+            name='monto_horas_extra',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Monto Horas Extra'),
+        ),
+        migrations.AddField(
+            model_name='detalleplanilla',
+            name='total_bonificaciones',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Total Bonificaciones'),
+        ),
+        migrations.AddField(
+            model_name='detalleplanilla',
+            name='total_deducciones',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Total Deducciones'),
+        ),
+        migrations.AddField(
+            model_name='detalleplanilla',
+            name='total_neto',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Total Neto'),
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='monto_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14, verbose_name='Monto Total'),
+        ),
+        migrations.RunPython(poblar_totales_planillas, migrations.RunPython.noop),
+    ]
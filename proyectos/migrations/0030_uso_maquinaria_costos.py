@@ -0,0 +1,56 @@
+# Generated by Django 4.2.17 on 2026-10-17 00:15
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def poblar_costos_usos(apps, schema_editor):
+    """
+    Calcula horas_trabajadas y costo_total de los usos existentes con un solo UPDATE.
+    Sin horómetro inicial y final (mayores a cero) no hay horas, igual que en UsoMaquinaria.calcular_costos().
+    """
+    UsoMaquinaria = apps.get_model('proyectos', 'UsoMaquinaria')
+    horas = models.Case(
+        models.When(
+            horometro_final__gt=0, horometro_inicial__gt=0,
+            then=models.F('horometro_final') - models.F('horometro_inicial'),
+        ),
+        default=models.Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+    UsoMaquinaria.objects.update(
+        horas_trabajadas=horas,
+        costo_total=models.ExpressionWrapper(
+            horas * models.F('tarifa_aplicada'),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0029_totales_planilla'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usomaquinaria',
+            name='costo_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, verbose_name='Costo Total'),
+        ),
+        migrations.AddField(
+            model_name='usomaquinaria',
+            name='horas_trabajadas',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10, verbose_name='Horas Trabajadas'),
+        ),
+        migrations.RunPython(poblar_costos_usos, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='usomaquinaria',
+            index=models.Index(fields=['proyecto', 'costo_total'], name='uso_maq_proyecto_costo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usomaquinaria',
+            index=models.Index(fields=['maquinaria', 'costo_total'], name='uso_maq_maquinaria_costo_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.17 on 2026-10-17 00:18
+
+from django.db import migrations, models
+
+
+def poblar_total_horas_extra(apps, schema_editor):
+    """Calcula la cantidad de horas extra de las líneas existentes (una consulta agrupada)"""
+    DetallePlanilla = apps.get_model('proyectos', 'DetallePlanilla')
+    HoraExtra = apps.get_model('proyectos', 'HoraExtra')
+
+    horas = {
+        (planilla_id, empleado_id): total
+        for planilla_id, empleado_id, total in HoraExtra.objects.order_by().values('planilla', 'empleado').annotate(
+            total=models.Sum('cantidad_horas')
+        ).values_list('planilla', 'empleado', 'total')
+    }
+    detalles = list(DetallePlanilla.objects.all())
+    for detalle in detalles:
+        detalle.total_horas_extra = horas.get((detalle.planilla_id, detalle.empleado_id)) or 0
+    DetallePlanilla.objects.bulk_update(detalles, ['total_horas_extra'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0030_uso_maquinaria_costos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detalleplanilla',
+            name='total_horas_extra',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8, verbose_name='Total Horas Extra'),
+        ),
+        migrations.RunPython(poblar_total_horas_extra, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.17 on 2026-10-17 00:20
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncMonth
+
+
+def poblar_costos_mensuales(apps, schema_editor):
+    """
+    Calcula los costos mensuales existentes con una consulta agrupada por fuente
+    (la misma lógica que CostoMensualProyecto.calcular()).
+    """
+    Proyecto = apps.get_model('proyectos', 'Proyecto')
+    CostoMensualProyecto = apps.get_model('proyectos', 'CostoMensualProyecto')
+    DetallePlanilla = apps.get_model('proyectos', 'DetallePlanilla')
+
+    def modelo(nombre):
+        return apps.get_model('proyectos', nombre)
+
+    en_detalle = models.Exists(
+        DetallePlanilla.objects.filter(planilla=models.OuterRef('planilla'), empleado=models.OuterRef('empleado'))
+    )
+    fuentes = [
+        (DetallePlanilla.objects.all(), 'planilla__proyecto', 'planilla__fecha_pago', 'salario_devengado', 1, 'planillas'),
+        (modelo('Bonificacion').objects.filter(en_detalle), 'planilla__proyecto', 'planilla__fecha_pago', 'monto', 1, 'planillas'),
+        (modelo('HoraExtra').objects.filter(en_detalle), 'planilla__proyecto', 'planilla__fecha_pago', 'monto', 1, 'planillas'),
+        (modelo('Deduccion').objects.filter(en_detalle), 'planilla__proyecto', 'planilla__fecha_pago', 'monto', -1, 'planillas'),
+        (modelo('Gasto').objects.all(), 'proyecto', 'fecha_gasto', 'monto', 1, None),
+        (modelo('UsoMaquinaria').objects.all(), 'proyecto', 'fecha_inicio', 'costo_total', 1, 'maquinaria'),
+        (modelo('Pago').objects.all(), 'proyecto', 'fecha_pago', 'monto', 1, 'pagos'),
+    ]
+
+    montos = {}
+    for queryset, ruta_proyecto, campo_fecha, campo_monto, signo, categoria in fuentes:
+        agrupar = {'id_proyecto': models.F(ruta_proyecto), 'mes': TruncMonth(campo_fecha)}
+        if categoria is None:
+            agrupar['tipo'] = models.F('tipo_gasto')
+        for fila in queryset.order_by().values(**agrupar).annotate(total=models.Sum(campo_monto)):
+            clave = (fila['id_proyecto'], fila['mes'], categoria or f"gasto_{fila['tipo']}")
+            montos[clave] = montos.get(clave, Decimal('0.00')) + signo * (fila['total'] or 0)
+
+    empresas = dict(Proyecto.objects.values_list('pk', 'empresa_id'))
+    CostoMensualProyecto.objects.bulk_create([
+        CostoMensualProyecto(
+            empresa_id=empresas[proyecto_id], proyecto_id=proyecto_id, mes=mes, categoria=categoria, monto=monto
+        )
+        for (proyecto_id, mes, categoria), monto in montos.items()
+        if monto
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0031_detalleplanilla_total_horas_extra'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CostoMensualProyecto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes', verbose_name='Mes')),
+                ('categoria', models.CharField(choices=[('planillas', 'Planillas'), ('gasto_materiales', 'Gastos - Materiales'), ('gasto_equipo', 'Gastos - Equipo'), ('gasto_servicios', 'Gastos - Servicios'), ('gasto_transporte', 'Gastos - Transporte'), ('gasto_otros', 'Gastos - Otros'), ('maquinaria', 'Maquinaria'), ('pagos', 'Pagos del Cliente')], max_length=30, verbose_name='Categoría')),
+                ('monto', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Monto')),
+                ('empresa', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='costos_mensuales', to='proyectos.empresa', verbose_name='Empresa')),
+                ('proyecto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='costos_mensuales', to='proyectos.proyecto', verbose_name='Proyecto')),
+            ],
+            options={
+                'verbose_name': 'Costo Mensual de Proyecto',
+                'verbose_name_plural': 'Costos Mensuales de Proyectos',
+                'ordering': ['mes', 'proyecto', 'categoria'],
+                'indexes': [models.Index(fields=['empresa', 'mes'], name='costo_mensual_empresa_mes_idx')],
+                'unique_together': {('proyecto', 'mes', 'categoria')},
+            },
+        ),
+        migrations.RunPython(poblar_costos_mensuales, migrations.RunPython.noop),
+    ]
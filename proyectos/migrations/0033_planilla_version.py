@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-17 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0032_costomensualproyecto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planilla',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Versión'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.17 on 2026-10-17 00:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0033_planilla_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierrePlanilla',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_cierre', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Cierre')),
+                ('cantidad_empleados', models.PositiveIntegerField(default=0, verbose_name='Cantidad de Empleados')),
+                ('total_devengado', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Devengado')),
+                ('total_bonificaciones', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Bonificaciones')),
+                ('total_horas_extra', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Total Horas Extra')),
+                ('monto_horas_extra', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto Horas Extra')),
+                ('total_deducciones', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Deducciones')),
+                ('monto_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto Total')),
+                ('cerrada_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='planillas_cerradas', to=settings.AUTH_USER_MODEL, verbose_name='Cerrada por')),
+            ],
+            options={
+                'verbose_name': 'Cierre de Planilla',
+                'verbose_name_plural': 'Cierres de Planilla',
+            },
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='cerrada',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Cerrada'),
+        ),
+        migrations.CreateModel(
+            name='DetalleCierrePlanilla',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('empleado_codigo', models.CharField(max_length=20, verbose_name='Código')),
+                ('empleado_nombre', models.CharField(max_length=201, verbose_name='Empleado')),
+                ('empleado_dni', models.CharField(max_length=20, verbose_name='DNI')),
+                ('salario_devengado', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Salario Devengado')),
+                ('total_bonificaciones', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total Bonificaciones')),
+                ('total_horas_extra', models.DecimalField(decimal_places=2, default=0, max_digits=8, verbose_name='Total Horas Extra')),
+                ('monto_horas_extra', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Monto Horas Extra')),
+                ('total_deducciones', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total Deducciones')),
+                ('total_neto', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total Neto')),
+                ('cierre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detalles', to='proyectos.cierreplanilla')),
+                ('empleado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='detalles_cierre_planilla', to='proyectos.empleado')),
+            ],
+            options={
+                'verbose_name': 'Detalle de Cierre de Planilla',
+                'verbose_name_plural': 'Detalles de Cierre de Planilla',
+                'ordering': ['empleado_nombre', 'pk'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cierreplanilla',
+            name='planilla',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cierre', to='proyectos.planilla'),
+        ),
+    ]
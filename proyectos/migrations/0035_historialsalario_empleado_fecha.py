@@ -0,0 +1,17 @@
+# Generated by Django 4.2.17 on 2026-10-17 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0034_planilla_cierre'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historialsalario',
+            index=models.Index(fields=['empleado', 'fecha_cambio'], name='hist_salario_emp_fecha_idx'),
+        ),
+    ]
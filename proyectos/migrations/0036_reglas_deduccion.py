@@ -0,0 +1,60 @@
+# Generated by Django 4.2.17 on 2026-10-17 00:49
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0035_historialsalario_empleado_fecha'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReglaDeduccion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(help_text='Ej: IHSS, RAP, ISR', max_length=20, verbose_name='Código')),
+                ('descripcion', models.CharField(help_text='Texto de la deducción en la planilla', max_length=200, verbose_name='Descripción')),
+                ('tipo_calculo', models.CharField(choices=[('porcentaje', 'Porcentaje fijo'), ('tramos', 'Tramos progresivos')], default='porcentaje', max_length=20, verbose_name='Tipo de Cálculo')),
+                ('base', models.CharField(choices=[('devengado', 'Salario devengado'), ('bruto', 'Salario devengado + bonificaciones + horas extra')], default='devengado', max_length=20, verbose_name='Base de Cálculo')),
+                ('periodicidad', models.CharField(choices=[('mensual', 'Mensual'), ('anual', 'Anual')], default='mensual', max_length=10, verbose_name='Periodicidad')),
+                ('porcentaje', models.DecimalField(blank=True, decimal_places=3, help_text='Solo para porcentaje fijo (2.5 = 2.5%)', max_digits=6, null=True, validators=[django.core.validators.MinValueValidator(Decimal('0')), django.core.validators.MaxValueValidator(Decimal('100'))], verbose_name='Porcentaje')),
+                ('techo', models.DecimalField(blank=True, decimal_places=2, help_text='Base máxima sobre la que se calcula (vacío = sin techo)', max_digits=14, null=True, validators=[django.core.validators.MinValueValidator(Decimal('0'))], verbose_name='Techo')),
+                ('exento', models.DecimalField(decimal_places=2, default=0, help_text='Parte de la base que no se grava', max_digits=14, validators=[django.core.validators.MinValueValidator(Decimal('0'))], verbose_name='Monto Exento')),
+                ('monto_maximo', models.DecimalField(blank=True, decimal_places=2, help_text='Deducción máxima (vacío = sin máximo)', max_digits=14, null=True, validators=[django.core.validators.MinValueValidator(Decimal('0'))], verbose_name='Monto Máximo')),
+                ('orden', models.PositiveSmallIntegerField(default=0, verbose_name='Orden')),
+                ('activa', models.BooleanField(default=True, verbose_name='Activa')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reglas_deduccion', to='proyectos.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Regla de Deducción de Ley',
+                'verbose_name_plural': 'Reglas de Deducciones de Ley',
+                'ordering': ['orden', 'codigo'],
+                'unique_together': {('empresa', 'codigo')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TramoDeduccion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde', models.DecimalField(decimal_places=2, max_digits=14, validators=[django.core.validators.MinValueValidator(Decimal('0'))], verbose_name='Desde')),
+                ('hasta', models.DecimalField(blank=True, decimal_places=2, help_text='Vacío = en adelante', max_digits=14, null=True, verbose_name='Hasta')),
+                ('porcentaje', models.DecimalField(decimal_places=3, max_digits=6, validators=[django.core.validators.MinValueValidator(Decimal('0')), django.core.validators.MaxValueValidator(Decimal('100'))], verbose_name='Porcentaje')),
+                ('regla', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tramos', to='proyectos.regladeduccion', verbose_name='Regla')),
+            ],
+            options={
+                'verbose_name': 'Tramo de Deducción',
+                'verbose_name_plural': 'Tramos de Deducción',
+                'ordering': ['regla', 'desde'],
+            },
+        ),
+        migrations.AddField(
+            model_name='deduccion',
+            name='regla',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Regla que generó la deducción; vacío si se ingresó a mano', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deducciones', to='proyectos.regladeduccion', verbose_name='Regla de Ley'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.17 on 2026-10-17 01:36
+
+from django.db import migrations, models
+
+
+def cerrar_usos_activos_duplicados(apps, schema_editor):
+    """
+    Deja un solo uso activo por máquina antes de crear la restricción: los usos
+    activos anteriores se cierran en la fecha de inicio del uso que los siguió.
+    """
+    UsoMaquinaria = apps.get_model('proyectos', 'UsoMaquinaria')
+    activos = UsoMaquinaria.objects.filter(fecha_fin__isnull=True).order_by('maquinaria_id', 'fecha_inicio', 'pk')
+    anterior = None
+    for uso in activos:
+        if anterior is not None and anterior.maquinaria_id == uso.maquinaria_id:
+            UsoMaquinaria.objects.filter(pk=anterior.pk).update(fecha_fin=uso.fecha_inicio)
+        anterior = uso
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0036_reglas_deduccion'),
+    ]
+
+    operations = [
+        migrations.RunPython(cerrar_usos_activos_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usomaquinaria',
+            constraint=models.UniqueConstraint(condition=models.Q(('fecha_fin__isnull', True)), fields=('maquinaria',), name='uso_maq_unico_activo', violation_error_message='La maquinaria ya tiene un uso activo. Debe finalizar ese uso antes de crear uno nuevo.'),
+        ),
+    ]
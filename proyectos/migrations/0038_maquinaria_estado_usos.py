@@ -0,0 +1,51 @@
+# Generated by Django 4.2.17 on 2026-10-17 01:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def calcular_estado_usos(apps, schema_editor):
+    """Llena el último horómetro final, su uso y el uso activo de las maquinarias existentes"""
+    Maquinaria = apps.get_model('proyectos', 'Maquinaria')
+    UsoMaquinaria = apps.get_model('proyectos', 'UsoMaquinaria')
+    ultimos = {}
+    for uso_id, maquinaria_id, horometro_final in UsoMaquinaria.objects.filter(
+        horometro_final__isnull=False
+    ).order_by('maquinaria_id', 'horometro_final', 'pk').values_list('pk', 'maquinaria_id', 'horometro_final'):
+        ultimos[maquinaria_id] = (uso_id, horometro_final)
+    activos = dict(
+        UsoMaquinaria.objects.filter(fecha_fin__isnull=True).values_list('maquinaria_id', 'pk')
+    )
+    for maquinaria_id in set(ultimos) | set(activos):
+        ultimo_uso_id, ultimo_horometro_final = ultimos.get(maquinaria_id, (None, None))
+        Maquinaria.objects.filter(pk=maquinaria_id).update(
+            ultimo_uso_id=ultimo_uso_id,
+            ultimo_horometro_final=ultimo_horometro_final,
+            uso_activo_id=activos.get(maquinaria_id),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0037_uso_maquinaria_unico_activo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maquinaria',
+            name='ultimo_horometro_final',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Último Horómetro Final'),
+        ),
+        migrations.AddField(
+            model_name='maquinaria',
+            name='ultimo_uso',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='proyectos.usomaquinaria', verbose_name='Uso con el Último Horómetro Final'),
+        ),
+        migrations.AddField(
+            model_name='maquinaria',
+            name='uso_activo',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='proyectos.usomaquinaria', verbose_name='Uso Activo'),
+        ),
+        migrations.RunPython(calcular_estado_usos, migrations.RunPython.noop),
+    ]
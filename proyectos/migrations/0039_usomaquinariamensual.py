@@ -0,0 +1,60 @@
+# Generated by Django 4.2.17 on 2026-10-17 01:40
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncMonth
+
+
+def poblar_usos_mensuales(apps, schema_editor):
+    """
+    Calcula los usos mensuales existentes con una consulta agrupada
+    (la misma lógica que UsoMaquinariaMensual.calcular()).
+    """
+    Maquinaria = apps.get_model('proyectos', 'Maquinaria')
+    UsoMaquinaria = apps.get_model('proyectos', 'UsoMaquinaria')
+    UsoMaquinariaMensual = apps.get_model('proyectos', 'UsoMaquinariaMensual')
+
+    empresas = dict(Maquinaria.objects.values_list('pk', 'empresa_id'))
+    filas = UsoMaquinaria.objects.order_by().values(
+        'maquinaria_id', 'proyecto_id', mes=TruncMonth('fecha_inicio')
+    ).annotate(horas=models.Sum('horas_trabajadas'), costo=models.Sum('costo_total'), cantidad=models.Count('pk'))
+    UsoMaquinariaMensual.objects.bulk_create([
+        UsoMaquinariaMensual(
+            empresa_id=empresas[fila['maquinaria_id']], maquinaria_id=fila['maquinaria_id'],
+            proyecto_id=fila['proyecto_id'], mes=fila['mes'], horas=fila['horas'], costo=fila['costo'],
+            cantidad_usos=fila['cantidad'],
+        )
+        for fila in filas.iterator(chunk_size=2000)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0038_maquinaria_estado_usos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsoMaquinariaMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes', verbose_name='Mes')),
+                ('horas', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Horas Trabajadas')),
+                ('costo', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Costo')),
+                ('cantidad_usos', models.PositiveIntegerField(default=0, verbose_name='Cantidad de Usos')),
+                ('empresa', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='usos_maquinaria_mensuales', to='proyectos.empresa', verbose_name='Empresa')),
+                ('maquinaria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usos_mensuales', to='proyectos.maquinaria', verbose_name='Maquinaria')),
+                ('proyecto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usos_maquinaria_mensuales', to='proyectos.proyecto', verbose_name='Proyecto')),
+            ],
+            options={
+                'verbose_name': 'Uso Mensual de Maquinaria',
+                'verbose_name_plural': 'Usos Mensuales de Maquinaria',
+                'ordering': ['mes', 'maquinaria', 'proyecto'],
+                'indexes': [models.Index(fields=['empresa', 'mes'], name='uso_maq_mensual_emp_mes_idx')],
+                'unique_together': {('maquinaria', 'mes', 'proyecto')},
+            },
+        ),
+        migrations.RunPython(poblar_usos_mensuales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.17 on 2026-10-17 01:46
+
+from django.db import migrations, models
+import django.utils.timezone
+from django.utils import timezone
+
+
+def calcular_vigencias(apps, schema_editor):
+    """
+    Cada tarifa existente rige desde la fecha (local) en que se registró y hasta que
+    empieza la siguiente de la misma maquinaria (igual que actualizar_vigencias())
+    """
+    HistorialTarifaMaquinaria = apps.get_model('proyectos', 'HistorialTarifaMaquinaria')
+    cambios = list(HistorialTarifaMaquinaria.objects.order_by('maquinaria_id', 'fecha_cambio', 'pk'))
+    for cambio in cambios:
+        fecha_cambio = cambio.fecha_cambio
+        cambio.vigente_desde = timezone.localdate(fecha_cambio) if timezone.is_aware(fecha_cambio) else fecha_cambio.date()
+    for cambio, siguiente in zip(cambios, cambios[1:] + [None]):
+        cambio.vigente_hasta = (
+            siguiente.vigente_desde if siguiente and siguiente.maquinaria_id == cambio.maquinaria_id else None
+        )
+    HistorialTarifaMaquinaria.objects.bulk_update(cambios, ['vigente_desde', 'vigente_hasta'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0039_usomaquinariamensual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historialtarifamaquinaria',
+            name='vigente_desde',
+            field=models.DateField(default=django.utils.timezone.localdate, help_text='Fecha desde la que rige la tarifa nueva (puede ser anterior a la fecha del cambio)', verbose_name='Vigente Desde'),
+        ),
+        migrations.AddField(
+            model_name='historialtarifamaquinaria',
+            name='vigente_hasta',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Vigente Hasta'),
+        ),
+        migrations.AddIndex(
+            model_name='historialtarifamaquinaria',
+            index=models.Index(fields=['maquinaria', 'vigente_desde', 'vigente_hasta'], name='hist_tarifa_maq_vigencia_idx'),
+        ),
+        migrations.RunPython(calcular_vigencias, migrations.RunPython.noop),
+    ]
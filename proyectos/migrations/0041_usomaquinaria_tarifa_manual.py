@@ -0,0 +1,45 @@
+# Generated by Django 4.2.17 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+def marcar_tarifas_manuales(apps, schema_editor):
+    """
+    Los usos existentes no registran de dónde salió su tarifa: se marcan como manuales
+    los que tienen una tarifa que la maquinaria nunca tuvo (ni la actual ni ninguna del
+    historial), que solo pudo ingresarse a mano. Los demás siguen el historial.
+    """
+    HistorialTarifaMaquinaria = apps.get_model('proyectos', 'HistorialTarifaMaquinaria')
+    Maquinaria = apps.get_model('proyectos', 'Maquinaria')
+    UsoMaquinaria = apps.get_model('proyectos', 'UsoMaquinaria')
+
+    tarifas = {}
+    for maquinaria_id, tarifa_hora in Maquinaria.objects.values_list('pk', 'tarifa_hora'):
+        tarifas[maquinaria_id] = {tarifa_hora}
+    for maquinaria_id, tarifa_anterior, tarifa_nueva in HistorialTarifaMaquinaria.objects.values_list(
+        'maquinaria_id', 'tarifa_anterior', 'tarifa_nueva'
+    ):
+        tarifas.setdefault(maquinaria_id, set()).update({tarifa_anterior, tarifa_nueva})
+
+    manuales = [
+        pk for pk, maquinaria_id, tarifa in UsoMaquinaria.objects.values_list('pk', 'maquinaria_id', 'tarifa_aplicada')
+        if tarifa not in tarifas.get(maquinaria_id, ())
+    ]
+    for inicio in range(0, len(manuales), 500):
+        UsoMaquinaria.objects.filter(pk__in=manuales[inicio:inicio + 500]).update(tarifa_manual=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0040_historialtarifa_vigencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usomaquinaria',
+            name='tarifa_manual',
+            field=models.BooleanField(default=False, help_text='La tarifa aplicada se negoció para este uso y no se recalcula con el historial de tarifas', verbose_name='Tarifa Manual'),
+        ),
+        migrations.RunPython(marcar_tarifas_manuales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.17 on 2026-10-17 02:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0041_usomaquinaria_tarifa_manual'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deduccion',
+            name='regla',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Regla que generó la deducción; vacío si se ingresó a mano', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='deducciones', to='proyectos.regladeduccion', verbose_name='Regla de Ley'),
+        ),
+        migrations.AlterField(
+            model_name='regladeduccion',
+            name='activa',
+            field=models.BooleanField(default=True, help_text='Desmarque para dejar de aplicar la regla; una regla que ya generó deducciones no se puede eliminar', verbose_name='Activa'),
+        ),
+    ]
@@ -1,8 +1,10 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.core.validators import MinValueValidator, MaxValueValidator, FileExtensionValidator
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 import os
+from django.utils import timezone
 from django.utils.text import slugify
 
 
@@ -474,11 +476,200 @@ class Empleado(models.Model):
     def __str__(self):
         return f"{self.codigo} - {self.nombres} {self.apellidos}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Salario leído de la base de datos: el historial de salarios lo compara sin volver a consultarlo
+        if 'salario_base' in field_names:
+            instance._salario_base_original = values[field_names.index('salario_base')]
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or 'salario_base' in fields:
+            self._salario_base_original = self.salario_base
+
     @property
     def nombre_completo(self):
         return f"{self.nombres} {self.apellidos}"
 
 
+ESTADOS_ORDEN_CAMBIO_APROBADA = ['aprobada', 'en_ejecucion', 'completada']
+
+
+def _campo_monto():
+    """Campo de salida para montos agregados (admite sumas de muchos registros)"""
+    return models.DecimalField(max_digits=18, decimal_places=2)
+
+
+def _campo_porcentaje():
+    """Campo de salida para porcentajes calculados en la base de datos"""
+    return models.DecimalField(max_digits=18, decimal_places=6)
+
+
+def _suma_por_proyecto(queryset, campo_proyecto, expresion):
+    """
+    Subconsulta correlacionada que suma `expresion` para el proyecto exterior.
+    Se agrupa por `campo_proyecto` para que la base de datos devuelva una sola fila.
+    """
+    subconsulta = (
+        queryset.filter(**{campo_proyecto: models.OuterRef('pk')})
+        .order_by()
+        .values(campo_proyecto)
+        .annotate(total=models.Sum(expresion))
+        .values('total')
+    )
+    return Coalesce(
+        models.Subquery(subconsulta, output_field=_campo_monto()),
+        models.Value(Decimal('0.00')),
+        output_field=_campo_monto(),
+    )
+
+
+class ProyectoQuerySet(models.QuerySet):
+    """QuerySet de proyectos con cálculos financieros resueltos en la base de datos"""
+
+    def with_financials(self):
+        """
+        Anota costos, utilidad, margen, órdenes de cambio y pagos de cada proyecto
+        en una sola consulta (subconsultas correlacionadas, sin JOINs que dupliquen filas).
+
+        Los valores equivalen a los métodos calcular_* del modelo.
+        """
+        # Bonificaciones, deducciones y horas extra solo cuentan si el empleado
+        # tiene línea en la planilla (igual que DetallePlanilla.calcular_total)
+        en_detalle = models.Exists(
+            DetallePlanilla.objects.filter(
+                planilla=models.OuterRef('planilla'),
+                empleado=models.OuterRef('empleado'),
+            )
+        )
+        return self.annotate(
+            _salarios=_suma_por_proyecto(DetallePlanilla.objects.all(), 'planilla__proyecto', 'salario_devengado'),
+            _bonificaciones=_suma_por_proyecto(Bonificacion.objects.filter(en_detalle), 'planilla__proyecto', 'monto'),
+            _horas_extra=_suma_por_proyecto(HoraExtra.objects.filter(en_detalle), 'planilla__proyecto', 'monto'),
+            _deducciones=_suma_por_proyecto(Deduccion.objects.filter(en_detalle), 'planilla__proyecto', 'monto'),
+            total_gastos=_suma_por_proyecto(Gasto.objects.all(), 'proyecto', 'monto'),
+            total_maquinaria=_suma_por_proyecto(UsoMaquinaria.objects.all(), 'proyecto', 'costo_total'),
+            total_ordenes_cambio=_suma_por_proyecto(
+                OrdenCambio.objects.filter(estado__in=ESTADOS_ORDEN_CAMBIO_APROBADA), 'proyecto', 'monto_adicional'
+            ),
+            total_pagado=_suma_por_proyecto(Pago.objects.all(), 'proyecto', 'monto'),
+        ).annotate(
+            total_planillas=models.ExpressionWrapper(
+                models.F('_salarios') + models.F('_bonificaciones') + models.F('_horas_extra') - models.F('_deducciones'),
+                output_field=_campo_monto(),
+            ),
+        )._anotar_derivados()
+
+    def with_resumen(self):
+        """
+        Igual que with_financials(), pero leyendo los totales acumulados en
+        ProyectoResumenFinanciero (una fila por proyecto, sin re-sumar el historial).
+        """
+        totales = {
+            campo: Coalesce(
+                models.F(f'resumen_financiero__{campo}'),
+                models.Value(Decimal('0.00')),
+                output_field=_campo_monto(),
+            )
+            for campo in ['total_planillas', 'total_gastos', 'total_maquinaria', 'total_ordenes_cambio', 'total_pagado']
+        }
+        return self.annotate(**totales)._anotar_derivados()
+
+    def _anotar_derivados(self):
+        """Anota utilidad, margen y saldos a partir de los totales ya anotados"""
+        return self.annotate(
+            costos_totales=models.ExpressionWrapper(
+                models.F('total_planillas') + models.F('total_gastos') + models.F('total_maquinaria'),
+                output_field=_campo_monto(),
+            ),
+            monto_total_proyecto=models.ExpressionWrapper(
+                models.F('monto_contrato') + models.F('total_ordenes_cambio'),
+                output_field=_campo_monto(),
+            ),
+        ).annotate(
+            utilidad_bruta=models.ExpressionWrapper(
+                models.F('monto_contrato') - models.F('costos_totales'),
+                output_field=_campo_monto(),
+            ),
+            saldo_pendiente=models.ExpressionWrapper(
+                models.F('monto_total_proyecto') - models.F('total_pagado'),
+                output_field=_campo_monto(),
+            ),
+        ).annotate(
+            margen_utilidad=models.Case(
+                models.When(
+                    monto_contrato__gt=0,
+                    then=models.F('utilidad_bruta') * 100 / models.F('monto_contrato'),
+                ),
+                default=models.Value(Decimal('0')),
+                output_field=_campo_porcentaje(),
+            ),
+            porcentaje_pagado=models.Case(
+                models.When(
+                    monto_total_proyecto__gt=0,
+                    then=models.F('total_pagado') * 100 / models.F('monto_total_proyecto'),
+                ),
+                default=models.Value(Decimal('0')),
+                output_field=_campo_porcentaje(),
+            ),
+        )
+
+
+class ProyectoManager(EmpresaManager.from_queryset(ProyectoQuerySet)):
+    """Manager de proyectos: filtro por empresa + cálculos financieros anotados"""
+    pass
+
+
+class ProyectoFinancialSnapshot:
+    """
+    Totales financieros de un proyecto calculados una sola vez.
+
+    Se arma desde las anotaciones de Proyecto.objects.with_financials() (sin
+    consultas adicionales) o, si el proyecto no viene anotado, con una única
+    consulta. Evita que cada calcular_* del modelo vuelva a sumar costos y pagos.
+    """
+
+    CAMPOS = [
+        'total_planillas', 'total_gastos', 'total_maquinaria', 'costos_totales',
+        'total_ordenes_cambio', 'monto_total_proyecto', 'total_pagado', 'saldo_pendiente',
+        'porcentaje_pagado', 'utilidad_bruta', 'margen_utilidad',
+    ]
+
+    def __init__(self, monto_contrato, **totales):
+        self.monto_contrato = monto_contrato
+        for campo in self.CAMPOS:
+            setattr(self, campo, totales[campo])
+
+    @classmethod
+    def de_proyecto(cls, proyecto):
+        """
+        Retorna el snapshot del proyecto, reutilizando sus anotaciones si las tiene.
+        El resultado se guarda en la instancia para no recalcularlo.
+        """
+        snapshot = getattr(proyecto, '_snapshot_financiero', None)
+        if snapshot is None:
+            if all(hasattr(proyecto, campo) for campo in cls.CAMPOS):
+                totales = {campo: getattr(proyecto, campo) for campo in cls.CAMPOS}
+            else:
+                totales = (
+                    Proyecto.objects.filter(pk=proyecto.pk)
+                    .with_financials()
+                    .values(*cls.CAMPOS)
+                    .get()
+                )
+            snapshot = cls(proyecto.monto_contrato, **totales)
+            proyecto._snapshot_financiero = snapshot
+        return snapshot
+
+    def como_dict(self):
+        """Montos como float, para respuestas JSON"""
+        datos = {'monto_contrato': float(self.monto_contrato)}
+        datos.update({campo: float(getattr(self, campo)) for campo in self.CAMPOS})
+        return datos
+
+
 class Proyecto(models.Model):
     ESTADO_CHOICES = [
         ('planificacion', 'Planificación'),
@@ -501,7 +692,7 @@ class Proyecto(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='planificacion')
     porcentaje_avance = models.DecimalField(max_digits=5, decimal_places=2, default=0, validators=[MinValueValidator(Decimal('0'))], verbose_name='% Avance')
 
-    objects = EmpresaManager()
+    objects = ProyectoManager()
 
     class Meta:
         verbose_name = 'Proyecto'
@@ -514,32 +705,53 @@ class Proyecto(models.Model):
             return f"{self.codigo} - {self.nombre} ({self.cliente.nombre})"
         return f"{self.codigo} - {self.nombre}"
 
+    def _valor_anotado(self, nombre):
+        """
+        Retorna el valor anotado por Proyecto.objects.with_financials() si existe,
+        para no repetir en Python lo que la base de datos ya calculó.
+        """
+        return getattr(self, nombre, None)
+
     def calcular_costos_totales(self):
         """Calcula el total de costos del proyecto (planilla + gastos + maquinaria)"""
+        anotado = self._valor_anotado('costos_totales')
+        if anotado is not None:
+            return anotado
         total_planilla = sum(p.monto_total for p in self.planillas.all())
         total_gastos = sum(g.monto for g in self.gastos.all())
-        total_maquinaria = sum(uso.costo_total for uso in self.usos_maquinaria.all())
-        return total_planilla + total_gastos + total_maquinaria
+        return total_planilla + total_gastos + self.calcular_costo_maquinaria()
 
     def calcular_costo_maquinaria(self):
         """Calcula el total de costos de maquinaria del proyecto"""
-        return sum(uso.costo_total for uso in self.usos_maquinaria.all())
+        anotado = self._valor_anotado('total_maquinaria')
+        if anotado is not None:
+            return anotado
+        return self.usos_maquinaria.aggregate(total=models.Sum('costo_total'))['total'] or Decimal('0.00')
 
     def calcular_utilidad_bruta(self):
         """Calcula la utilidad bruta (monto contrato - costos totales)"""
+        anotado = self._valor_anotado('utilidad_bruta')
+        if anotado is not None:
+            return anotado
         return self.monto_contrato - self.calcular_costos_totales()
 
     def calcular_margen_utilidad(self):
         """Calcula el margen de utilidad en porcentaje"""
+        anotado = self._valor_anotado('margen_utilidad')
+        if anotado is not None:
+            return anotado
         if self.monto_contrato > 0:
             return (self.calcular_utilidad_bruta() / self.monto_contrato) * 100
         return 0
 
     def calcular_total_ordenes_cambio(self):
         """Calcula el total de órdenes de cambio aprobadas"""
+        anotado = self._valor_anotado('total_ordenes_cambio')
+        if anotado is not None:
+            return anotado
         return sum(
             oc.monto_adicional
-            for oc in self.ordenes_cambio.filter(estado__in=['aprobada', 'en_ejecucion', 'completada'])
+            for oc in self.ordenes_cambio.filter(estado__in=ESTADOS_ORDEN_CAMBIO_APROBADA)
         )
 
     def calcular_monto_total_proyecto(self):
@@ -548,6 +760,9 @@ class Proyecto(models.Model):
 
     def calcular_total_pagado(self):
         """Calcula el total pagado por el cliente (desembolsos)"""
+        anotado = self._valor_anotado('total_pagado')
+        if anotado is not None:
+            return anotado
         return sum(p.monto for p in self.pagos.all())
 
     def calcular_saldo_pendiente(self):
@@ -556,6 +771,9 @@ class Proyecto(models.Model):
 
     def calcular_porcentaje_pagado(self):
         """Calcula el porcentaje pagado del monto total"""
+        anotado = self._valor_anotado('porcentaje_pagado')
+        if anotado is not None:
+            return anotado
         monto_total = self.calcular_monto_total_proyecto()
         if monto_total > 0:
             return (self.calcular_total_pagado() / monto_total) * 100
@@ -593,6 +811,13 @@ class Planilla(models.Model):
     fecha_pago = models.DateField(verbose_name='Fecha de Pago')
     observaciones = models.TextField(blank=True, null=True)
     pagada = models.BooleanField(default=False)
+    monto_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False, verbose_name='Monto Total')
+    # Se incrementa cada vez que se guardan los totales (control de concurrencia optimista)
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name='Versión')
+    # Una planilla cerrada tiene sus montos congelados en CierrePlanilla y ya no se edita
+    cerrada = models.BooleanField(default=False, editable=False, verbose_name='Cerrada')
+
+    CAMPOS_MANTENIDOS = ['monto_total', 'version', 'cerrada']
 
     class Meta:
         verbose_name = 'Planilla'
@@ -602,16 +827,130 @@ class Planilla(models.Model):
     def __str__(self):
         return f"Planilla {self.proyecto.codigo} - {self.periodo_inicio} a {self.periodo_fin}"
 
-    @property
-    def monto_total(self):
-        """Calcula el monto total de la planilla"""
-        return sum(d.calcular_total() for d in self.detalles.all())
+    def save(self, *args, **kwargs):
+        # El monto total, la versión y el cierre solo se escriben con update() o update_fields
+        # (recálculos y cerrar_planilla): un guardado completo, como el del admin, el formulario
+        # o la API, no pisa sus valores con los de una instancia vieja
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_MANTENIDOS
+            ]
+        super().save(*args, **kwargs)
+
+    def calcular_totales_por_empleado(self, empleado_ids=None):
+        """
+        Calcula deducciones, bonificaciones y horas extra (cantidad y monto) de cada
+        empleado de la planilla con una consulta agrupada por empleado para cada tabla hija.
+        Retorna {empleado_id: {campo: total}}; los campos sin registros no aparecen.
+        """
+        from django.db.models import Sum
+        consultas = [
+            (self.deducciones.all(), {'total_deducciones': Sum('monto')}),
+            (self.bonificaciones.all(), {'total_bonificaciones': Sum('monto')}),
+            (self.horas_extra.all(), {'total_horas_extra': Sum('cantidad_horas'), 'monto_horas_extra': Sum('monto')}),
+        ]
+
+        totales = {}
+        for queryset, sumas in consultas:
+            if empleado_ids is not None:
+                queryset = queryset.filter(empleado_id__in=empleado_ids)
+            for fila in queryset.order_by().values('empleado').annotate(**sumas):
+                totales.setdefault(fila.pop('empleado'), {}).update(fila)
+        return totales
+
+    def calcular_totales_detalles(self):
+        """
+        Retorna las líneas de la planilla con sus totales calculados en memoria
+        (sin guardarlos) usando calcular_totales_por_empleado().
+        """
+        totales = self.calcular_totales_por_empleado()
+        detalles = list(self.detalles.all())
+        for detalle in detalles:
+            detalle.asignar_totales(totales.get(detalle.empleado_id, {}))
+        return detalles
+
+    def guardar_totales(self, detalles, campos_extra=()):
+        """
+        Guarda con un solo bulk_update los totales de las líneas (y los campos_extra
+        indicados) y el monto total de la planilla, e incrementa su versión.
+        """
+        DetallePlanilla.objects.bulk_update(detalles, DetallePlanilla.CAMPOS_TOTALES + list(campos_extra))
+        self.monto_total = sum((d.total_neto for d in detalles), Decimal('0'))
+        self._guardar_monto_total()
+        return self.monto_total
+
+    def _guardar_monto_total(self):
+        """
+        Guarda monto_total e incrementa la versión de la planilla.
+        El monto de una planilla cerrada no cambia: se conserva el congelado al cerrarla.
+        """
+        Planilla.objects.filter(pk=self.pk, cerrada=False).update(
+            monto_total=self.monto_total, version=models.F('version') + 1
+        )
+        self.monto_total, self.version = Planilla.objects.filter(pk=self.pk).values_list('monto_total', 'version').get()
+
+    def recalcular_totales_empleados(self, empleado_ids):
+        """
+        Recalcula y guarda solo los totales de las líneas de los empleados indicados;
+        el monto total de la planilla se obtiene sumando el total neto guardado de
+        todas las líneas (una consulta). Retorna las líneas recalculadas.
+        """
+        from django.db.models import Sum
+        empleado_ids = list(empleado_ids)
+        totales = self.calcular_totales_por_empleado(empleado_ids)
+        detalles = list(self.detalles.filter(empleado_id__in=empleado_ids))
+        for detalle in detalles:
+            detalle.asignar_totales(totales.get(detalle.empleado_id, {}))
+        if detalles:
+            DetallePlanilla.objects.bulk_update(detalles, DetallePlanilla.CAMPOS_TOTALES)
+        self.monto_total = self.detalles.aggregate(total=Sum('total_neto'))['total'] or Decimal('0')
+        self._guardar_monto_total()
+        return detalles
+
+    def recalcular_totales(self):
+        """
+        Recalcula y guarda los totales de cada línea y el monto total de la planilla.
+        Debe llamarse después de modificar detalles, deducciones, bonificaciones u horas extra.
+        """
+        return self.guardar_totales(self.calcular_totales_detalles())
+
+    def recalcular_salarios(self):
+        """
+        Vuelve a calcular el salario devengado de cada línea con el salario vigente
+        al final del período (HistorialSalario.salarios_vigentes) y guarda los totales.
+        Sirve para corregir planillas de períodos pasados creadas con el salario actual.
+        """
+        detalles = self.calcular_totales_detalles()
+        salarios = HistorialSalario.salarios_vigentes({d.empleado_id for d in detalles}, self.periodo_fin)
+        for detalle in detalles:
+            detalle.salario_devengado = DetallePlanilla.salario_del_periodo(
+                salarios[detalle.empleado_id], self.tipo_planilla
+            )
+            detalle.actualizar_total_neto()
+        return self.guardar_totales(detalles, campos_extra=['salario_devengado'])
 
 
 class DetallePlanilla(models.Model):
     planilla = models.ForeignKey(Planilla, on_delete=models.CASCADE, related_name='detalles')
     empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE)
     salario_devengado = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Salario Devengado', editable=False)
+    # Totales persistidos; los mantiene Planilla.recalcular_totales()
+    total_deducciones = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name='Total Deducciones')
+    total_bonificaciones = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name='Total Bonificaciones')
+    total_horas_extra = models.DecimalField(max_digits=8, decimal_places=2, default=0, editable=False, verbose_name='Total Horas Extra')
+    monto_horas_extra = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name='Monto Horas Extra')
+    total_neto = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name='Total Neto')
+
+    CAMPOS_CALCULADOS = ['total_deducciones', 'total_bonificaciones', 'total_horas_extra', 'monto_horas_extra']
+    CAMPOS_TOTALES = CAMPOS_CALCULADOS + ['total_neto']
+
+    # Períodos de cada tipo de planilla en un mes (el salario base es mensual)
+    PERIODOS_POR_MES = {
+        'semanal': 4,    # Salario mensual / 4 semanas
+        'quincenal': 2,  # Salario mensual / 2 quincenas
+        'mensual': 1,    # Salario completo
+    }
 
     class Meta:
         verbose_name = 'Detalle de Planilla'
@@ -624,66 +963,141 @@ class DetallePlanilla(models.Model):
     def save(self, *args, **kwargs):
         """Auto-calcular salario_devengado basado en el tipo de planilla"""
         if not self.salario_devengado or self.salario_devengado == 0:
-            if self.empleado and self.planilla:
-                if self.planilla.tipo_planilla == 'semanal':
-                    # Salario mensual / 4 semanas
-                    self.salario_devengado = self.empleado.salario_base / 4
-                elif self.planilla.tipo_planilla == 'quincenal':
-                    # Salario mensual / 2 quincenas
-                    self.salario_devengado = self.empleado.salario_base / 2
-                elif self.planilla.tipo_planilla == 'mensual':
-                    # Salario completo
-                    self.salario_devengado = self.empleado.salario_base
+            if self.empleado_id and self.planilla:
+                # Salario vigente al final del período, no el actual: la planilla puede ser de un período pasado
+                salario_base = HistorialSalario.salarios_vigentes([self.empleado_id], self.planilla.periodo_fin)[self.empleado_id]
+                salario = self.salario_del_periodo(salario_base, self.planilla.tipo_planilla)
+                if salario is not None:
+                    self.salario_devengado = salario
+        self.actualizar_total_neto()
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def salario_del_periodo(salario_base, tipo_planilla):
+        """
+        Salario devengado en un período a partir del salario base mensual,
+        redondeado a centavos. Retorna None si el tipo de planilla no es válido.
+        """
+        if tipo_planilla not in DetallePlanilla.PERIODOS_POR_MES:
+            return None
+        return (Decimal(salario_base) / DetallePlanilla.PERIODOS_POR_MES[tipo_planilla]).quantize(
+            Decimal('0.01'), rounding=ROUND_HALF_UP
+        )
+
+    def actualizar_total_neto(self):
+        """Recalcula total_neto a partir de los totales persistidos (sin consultas)"""
+        self.total_neto = (
+            (self.salario_devengado or 0) + self.total_bonificaciones
+            + self.monto_horas_extra - self.total_deducciones
+        )
+
+    def asignar_totales(self, totales):
+        """Asigna los totales calculados por Planilla.calcular_totales_por_empleado() y recalcula total_neto"""
+        for campo in self.CAMPOS_CALCULADOS:
+            setattr(self, campo, totales.get(campo) or Decimal('0'))
+        self.actualizar_total_neto()
+
+    def _totales_actuales(self):
+        """Totales de este empleado leídos de la base de datos (una consulta agrupada por tabla hija)"""
+        return self.planilla.calcular_totales_por_empleado([self.empleado_id]).get(self.empleado_id, {})
+
     def calcular_total_deducciones(self):
         """Calcula el total de deducciones registradas para este empleado en esta planilla"""
-        from django.db.models import Sum
-        total = Deduccion.objects.filter(
-            planilla=self.planilla,
-            empleado=self.empleado
-        ).aggregate(total=Sum('monto'))['total'] or 0
-        return total
+        return self._totales_actuales().get('total_deducciones') or 0
 
     def calcular_total_bonificaciones(self):
         """Calcula el total de bonificaciones registradas para este empleado en esta planilla"""
-        from django.db.models import Sum
-        total = Bonificacion.objects.filter(
-            planilla=self.planilla,
-            empleado=self.empleado
-        ).aggregate(total=Sum('monto'))['total'] or 0
-        return total
+        return self._totales_actuales().get('total_bonificaciones') or 0
 
     def calcular_total_horas_extra(self):
         """Calcula el total de horas extra (cantidad) registradas para este empleado en esta planilla"""
-        from django.db.models import Sum
-        total_horas = HoraExtra.objects.filter(
-            planilla=self.planilla,
-            empleado=self.empleado
-        ).aggregate(total=Sum('cantidad_horas'))['total'] or 0
-        return total_horas
+        return self._totales_actuales().get('total_horas_extra') or 0
 
     def calcular_monto_horas_extra(self):
         """Calcula el monto total de horas extra registradas para este empleado en esta planilla"""
-        from django.db.models import Sum
-        total_monto = HoraExtra.objects.filter(
-            planilla=self.planilla,
-            empleado=self.empleado
-        ).aggregate(total=Sum('monto'))['total'] or 0
-        return total_monto
+        return self._totales_actuales().get('monto_horas_extra') or 0
 
     def calcular_total(self):
         """
         Calcula el total a pagar al empleado.
         Total = Salario Devengado + Bonificaciones + Monto Horas Extra - Deducciones
         """
-        total_deducciones = self.calcular_total_deducciones()
-        total_bonificaciones = self.calcular_total_bonificaciones()
-        monto_horas_extra = self.calcular_monto_horas_extra()
+        totales = self._totales_actuales()
+        total_deducciones = totales.get('total_deducciones') or 0
+        total_bonificaciones = totales.get('total_bonificaciones') or 0
+        monto_horas_extra = totales.get('monto_horas_extra') or 0
 
         return self.salario_devengado + total_bonificaciones + monto_horas_extra - total_deducciones
 
 
+class RegistroInmutable(models.Model):
+    """Base de los registros que no se modifican una vez creados"""
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError(f'{self._meta.verbose_name} no se puede modificar.')
+        super().save(*args, **kwargs)
+
+
+class CierrePlanilla(RegistroInmutable):
+    """
+    Montos congelados de una planilla al cerrarla. Las planillas cerradas se muestran
+    y exportan desde aquí, sin sumar sus líneas ni las tablas hijas, y los reportes
+    históricos no cambian aunque después se editen esas filas.
+    """
+    planilla = models.OneToOneField(Planilla, on_delete=models.CASCADE, related_name='cierre')
+    fecha_cierre = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Cierre')
+    cerrada_por = models.ForeignKey(
+        'Usuario', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='planillas_cerradas', verbose_name='Cerrada por'
+    )
+    cantidad_empleados = models.PositiveIntegerField(default=0, verbose_name='Cantidad de Empleados')
+    total_devengado = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Total Devengado')
+    total_bonificaciones = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Total Bonificaciones')
+    total_horas_extra = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Total Horas Extra')
+    monto_horas_extra = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Monto Horas Extra')
+    total_deducciones = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Total Deducciones')
+    monto_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Monto Total')
+
+    class Meta:
+        verbose_name = 'Cierre de Planilla'
+        verbose_name_plural = 'Cierres de Planilla'
+
+    def __str__(self):
+        return f"Cierre {self.planilla}"
+
+
+class DetalleCierrePlanilla(RegistroInmutable):
+    """
+    Línea congelada de una planilla cerrada. Guarda una copia del código, nombre y DNI
+    del empleado para que el histórico no dependa de cambios posteriores en su ficha.
+    """
+    cierre = models.ForeignKey(CierrePlanilla, on_delete=models.CASCADE, related_name='detalles')
+    empleado = models.ForeignKey(
+        Empleado, on_delete=models.SET_NULL, null=True, blank=True, related_name='detalles_cierre_planilla'
+    )
+    empleado_codigo = models.CharField(max_length=20, verbose_name='Código')
+    empleado_nombre = models.CharField(max_length=201, verbose_name='Empleado')
+    empleado_dni = models.CharField(max_length=20, verbose_name='DNI')
+    salario_devengado = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Salario Devengado')
+    total_bonificaciones = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Total Bonificaciones')
+    total_horas_extra = models.DecimalField(max_digits=8, decimal_places=2, default=0, verbose_name='Total Horas Extra')
+    monto_horas_extra = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Monto Horas Extra')
+    total_deducciones = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Total Deducciones')
+    total_neto = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Total Neto')
+
+    class Meta:
+        verbose_name = 'Detalle de Cierre de Planilla'
+        verbose_name_plural = 'Detalles de Cierre de Planilla'
+        ordering = ['empleado_nombre', 'pk']
+
+    def __str__(self):
+        return f"{self.empleado_nombre} - {self.cierre}"
+
+
 class Gasto(models.Model):
     TIPO_GASTO_CHOICES = [
         ('materiales', 'Materiales'),
@@ -803,6 +1217,198 @@ class OrdenCambio(models.Model):
         return f"{self.codigo} - {self.proyecto.codigo} - ${self.monto_adicional}"
 
 
+class ProyectoResumenFinanciero(models.Model):
+    """
+    Totales acumulados por proyecto (planilla, gastos, maquinaria, órdenes de cambio y pagos).
+    Se mantiene al día desde signals al guardar/eliminar los registros que los alimentan,
+    para que los dashboards lean una fila por proyecto en lugar de re-sumar el historial.
+
+    La lectura es O(1), pero la escritura no aplica deltas por registro: cada cambio
+    programa (una vez por proyecto y transacción) un recálculo completo del proyecto
+    con recalcular(). Ver su docstring para el costo y el motivo.
+
+    Reconstruir/verificar: python manage.py reconstruir_resumen_financiero
+    """
+    CAMPOS_TOTALES = ['total_planillas', 'total_gastos', 'total_maquinaria', 'total_ordenes_cambio', 'total_pagado']
+
+    proyecto = models.OneToOneField(
+        Proyecto,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='resumen_financiero',
+        verbose_name='Proyecto'
+    )
+    total_planillas = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name='Total Planillas')
+    total_gastos = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name='Total Gastos')
+    total_maquinaria = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name='Total Maquinaria')
+    total_ordenes_cambio = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name='Total Órdenes de Cambio')
+    total_pagado = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name='Total Pagado por el Cliente')
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name='Última Actualización')
+
+    class Meta:
+        verbose_name = 'Resumen Financiero de Proyecto'
+        verbose_name_plural = 'Resúmenes Financieros de Proyectos'
+
+    def __str__(self):
+        return f"Resumen {self.proyecto_id} - Costos ${self.costos_totales}"
+
+    @property
+    def costos_totales(self):
+        return self.total_planillas + self.total_gastos + self.total_maquinaria
+
+    @classmethod
+    def calcular_totales(cls, proyectos):
+        """Retorna {proyecto_id: {campo: valor}} calculado desde los registros fuente"""
+        filas = proyectos.order_by().with_financials().values('pk', *cls.CAMPOS_TOTALES)
+        return {fila.pop('pk'): fila for fila in filas}
+
+    @classmethod
+    def recalcular(cls, proyecto_id):
+        """
+        Recalcula el resumen de un proyecto desde los registros fuente (una consulta de
+        agregación + un upsert).
+
+        Es un recálculo completo, no un delta: su costo crece con el historial del proyecto
+        (subconsultas agregadas sobre FKs indexadas), no es O(1) por escritura. Se acepta
+        porque los signals lo programan con on_commit una sola vez por proyecto y transacción,
+        y porque así el resumen es idempotente y se corrige solo: no acumula deriva por
+        escrituras concurrentes, por operaciones masivas que no disparan signals
+        (update(), bulk_create) ni por las reglas de Planilla que no son sumas por fila
+        (bonificaciones y horas extra solo cuentan si el empleado tiene detalle).
+        Para cargas masivas, usar recalculos_suspendidos() y recalcular al final.
+        """
+        totales = cls.calcular_totales(Proyecto.objects.filter(pk=proyecto_id)).get(proyecto_id)
+        if totales is None:
+            # El proyecto fue eliminado; su resumen se elimina en cascada
+            return None
+        resumen, _ = cls.objects.update_or_create(proyecto_id=proyecto_id, defaults=totales)
+        return resumen
+
+
+def _inicio_mes(fecha):
+    """Primer día del mes de la fecha"""
+    return fecha.replace(day=1)
+
+
+def _mes_siguiente(mes):
+    """Primer día del mes siguiente"""
+    from datetime import timedelta
+    return (mes.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+class CostoMensualProyecto(models.Model):
+    """
+    Montos mensuales por empresa, proyecto y categoría (planilla por fecha de pago,
+    gastos por fecha y tipo, maquinaria por fecha de inicio del uso y pagos del cliente
+    por fecha de pago), para servir series de tiempo sin recorrer las tablas fuente.
+
+    Se mantiene al día desde signals recalculando el mes afectado del proyecto.
+    Reconstruir/verificar: python manage.py reconstruir_costos_mensuales
+    """
+    CATEGORIA_CHOICES = [
+        ('planillas', 'Planillas'),
+        ('gasto_materiales', 'Gastos - Materiales'),
+        ('gasto_equipo', 'Gastos - Equipo'),
+        ('gasto_servicios', 'Gastos - Servicios'),
+        ('gasto_transporte', 'Gastos - Transporte'),
+        ('gasto_otros', 'Gastos - Otros'),
+        ('maquinaria', 'Maquinaria'),
+        ('pagos', 'Pagos del Cliente'),
+    ]
+
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='costos_mensuales',
+        verbose_name='Empresa',
+        null=True,
+        blank=True
+    )
+    proyecto = models.ForeignKey(
+        Proyecto,
+        on_delete=models.CASCADE,
+        related_name='costos_mensuales',
+        verbose_name='Proyecto'
+    )
+    mes = models.DateField(verbose_name='Mes', help_text='Primer día del mes')
+    categoria = models.CharField(max_length=30, choices=CATEGORIA_CHOICES, verbose_name='Categoría')
+    monto = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name='Monto')
+
+    class Meta:
+        verbose_name = 'Costo Mensual de Proyecto'
+        verbose_name_plural = 'Costos Mensuales de Proyectos'
+        ordering = ['mes', 'proyecto', 'categoria']
+        unique_together = ['proyecto', 'mes', 'categoria']
+        indexes = [
+            models.Index(fields=['empresa', 'mes'], name='costo_mensual_empresa_mes_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.proyecto_id} - {self.mes:%Y-%m} - {self.get_categoria_display()}: {self.monto}"
+
+    @classmethod
+    def calcular(cls, proyectos, desde=None, hasta=None):
+        """
+        Calcula desde los registros fuente {(proyecto_id, mes, categoria): monto} para los
+        proyectos del queryset, opcionalmente solo de los meses entre desde y hasta (inclusive).
+        Hace una consulta agrupada por mes para cada fuente.
+        """
+        from django.db.models.functions import TruncMonth
+
+        # Igual que DetallePlanilla.calcular_total: solo cuentan registros de empleados con línea en la planilla
+        en_detalle = models.Exists(
+            DetallePlanilla.objects.filter(planilla=models.OuterRef('planilla'), empleado=models.OuterRef('empleado'))
+        )
+        # (queryset, ruta al proyecto, campo de fecha, campo de monto, signo, categoría; None = por tipo de gasto)
+        fuentes = [
+            (DetallePlanilla.objects.all(), 'planilla__proyecto', 'planilla__fecha_pago', 'salario_devengado', 1, 'planillas'),
+            (Bonificacion.objects.filter(en_detalle), 'planilla__proyecto', 'planilla__fecha_pago', 'monto', 1, 'planillas'),
+            (HoraExtra.objects.filter(en_detalle), 'planilla__proyecto', 'planilla__fecha_pago', 'monto', 1, 'planillas'),
+            (Deduccion.objects.filter(en_detalle), 'planilla__proyecto', 'planilla__fecha_pago', 'monto', -1, 'planillas'),
+            (Gasto.objects.all(), 'proyecto', 'fecha_gasto', 'monto', 1, None),
+            (UsoMaquinaria.objects.all(), 'proyecto', 'fecha_inicio', 'costo_total', 1, 'maquinaria'),
+            (Pago.objects.all(), 'proyecto', 'fecha_pago', 'monto', 1, 'pagos'),
+        ]
+
+        montos = {}
+        for queryset, ruta_proyecto, campo_fecha, campo_monto, signo, categoria in fuentes:
+            queryset = queryset.filter(**{f'{ruta_proyecto}__in': proyectos.values('pk')})
+            if desde:
+                queryset = queryset.filter(**{f'{campo_fecha}__gte': desde})
+            if hasta:
+                queryset = queryset.filter(**{f'{campo_fecha}__lt': _mes_siguiente(hasta)})
+            agrupar = {'id_proyecto': models.F(ruta_proyecto), 'mes': TruncMonth(campo_fecha)}
+            if categoria is None:
+                agrupar['tipo'] = models.F('tipo_gasto')
+            filas = queryset.order_by().values(**agrupar).annotate(total=models.Sum(campo_monto))
+            for fila in filas:
+                clave = (fila['id_proyecto'], fila['mes'], categoria or f"gasto_{fila['tipo']}")
+                montos[clave] = montos.get(clave, Decimal('0.00')) + signo * (fila['total'] or 0)
+        return montos
+
+    @classmethod
+    def recalcular(cls, proyecto_id, fecha):
+        """Recalcula todas las categorías de un proyecto en el mes de la fecha indicada"""
+        from django.db import transaction
+
+        mes = _inicio_mes(fecha)
+        with transaction.atomic():
+            # Bloquear el proyecto serializa los recálculos concurrentes del mismo proyecto
+            empresa_ids = list(
+                Proyecto.objects.select_for_update().filter(pk=proyecto_id).values_list('empresa_id', flat=True)
+            )
+            if not empresa_ids:
+                # El proyecto fue eliminado; sus filas se eliminan en cascada
+                return
+            montos = cls.calcular(Proyecto.objects.filter(pk=proyecto_id), desde=mes, hasta=mes)
+            cls.objects.filter(proyecto_id=proyecto_id, mes=mes).delete()
+            cls.objects.bulk_create([
+                cls(empresa_id=empresa_ids[0], proyecto_id=proyecto_id, mes=mes, categoria=categoria, monto=monto)
+                for (_, _, categoria), monto in montos.items()
+                if monto
+            ])
+
+
 class Usuario(AbstractUser):
     """
     Usuario personalizado con roles y permisos específicos para el sistema MultiProject Pro.
@@ -923,6 +1529,18 @@ class Deduccion(models.Model):
         validators=[MinValueValidator(Decimal('0.01'))],
         verbose_name='Monto a Deducir'
     )
+    regla = models.ForeignKey(
+        'ReglaDeduccion',
+        # Una regla con deducciones no se elimina (se desactiva con 'activa'): sin la regla,
+        # sus deducciones parecerían manuales y aplicar_deducciones_ley ya no las reemplazaría
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='deducciones',
+        verbose_name='Regla de Ley',
+        help_text='Regla que generó la deducción; vacío si se ingresó a mano'
+    )
     fecha_creacion = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Fecha de Creación'
@@ -937,6 +1555,102 @@ class Deduccion(models.Model):
         return f"{self.empleado.nombre_completo} - {self.descripcion} - L. {self.monto}"
 
 
+class ReglaDeduccion(models.Model):
+    """
+    Deducción de ley (IHSS, RAP, ISR, etc.) configurada por empresa.
+    El techo, el monto exento, los tramos y el monto máximo están expresados en
+    la periodicidad de la regla (mensual o anual); el cálculo lleva la base del
+    período de la planilla a esa periodicidad y el resultado de vuelta al período.
+    """
+    TIPO_CALCULO_CHOICES = [
+        ('porcentaje', 'Porcentaje fijo'),
+        ('tramos', 'Tramos progresivos'),
+    ]
+    BASE_CHOICES = [
+        ('devengado', 'Salario devengado'),
+        ('bruto', 'Salario devengado + bonificaciones + horas extra'),
+    ]
+    PERIODICIDAD_CHOICES = [
+        ('mensual', 'Mensual'),
+        ('anual', 'Anual'),
+    ]
+
+    empresa = models.ForeignKey('Empresa', on_delete=models.CASCADE, related_name='reglas_deduccion', verbose_name='Empresa')
+    codigo = models.CharField(max_length=20, verbose_name='Código', help_text='Ej: IHSS, RAP, ISR')
+    descripcion = models.CharField(max_length=200, verbose_name='Descripción', help_text='Texto de la deducción en la planilla')
+    tipo_calculo = models.CharField(max_length=20, choices=TIPO_CALCULO_CHOICES, default='porcentaje', verbose_name='Tipo de Cálculo')
+    base = models.CharField(max_length=20, choices=BASE_CHOICES, default='devengado', verbose_name='Base de Cálculo')
+    periodicidad = models.CharField(max_length=10, choices=PERIODICIDAD_CHOICES, default='mensual', verbose_name='Periodicidad')
+    porcentaje = models.DecimalField(
+        max_digits=6, decimal_places=3, null=True, blank=True,
+        validators=[MinValueValidator(Decimal('0')), MaxValueValidator(Decimal('100'))],
+        verbose_name='Porcentaje', help_text='Solo para porcentaje fijo (2.5 = 2.5%)'
+    )
+    techo = models.DecimalField(
+        max_digits=14, decimal_places=2, null=True, blank=True,
+        validators=[MinValueValidator(Decimal('0'))],
+        verbose_name='Techo', help_text='Base máxima sobre la que se calcula (vacío = sin techo)'
+    )
+    exento = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0,
+        validators=[MinValueValidator(Decimal('0'))],
+        verbose_name='Monto Exento', help_text='Parte de la base que no se grava'
+    )
+    monto_maximo = models.DecimalField(
+        max_digits=14, decimal_places=2, null=True, blank=True,
+        validators=[MinValueValidator(Decimal('0'))],
+        verbose_name='Monto Máximo', help_text='Deducción máxima (vacío = sin máximo)'
+    )
+    orden = models.PositiveSmallIntegerField(default=0, verbose_name='Orden')
+    activa = models.BooleanField(
+        default=True,
+        verbose_name='Activa',
+        help_text='Desmarque para dejar de aplicar la regla; una regla que ya generó deducciones no se puede eliminar'
+    )
+
+    class Meta:
+        verbose_name = 'Regla de Deducción de Ley'
+        verbose_name_plural = 'Reglas de Deducciones de Ley'
+        ordering = ['orden', 'codigo']
+        unique_together = ['empresa', 'codigo']
+
+    def __str__(self):
+        return f"{self.codigo} - {self.descripcion}"
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        if self.tipo_calculo == 'porcentaje' and self.porcentaje is None:
+            raise ValidationError({'porcentaje': 'Indique el porcentaje de la deducción.'})
+
+
+class TramoDeduccion(models.Model):
+    """Tramo de una regla progresiva: se aplica el porcentaje a la parte de la base entre desde y hasta"""
+    regla = models.ForeignKey(ReglaDeduccion, on_delete=models.CASCADE, related_name='tramos', verbose_name='Regla')
+    desde = models.DecimalField(max_digits=14, decimal_places=2, validators=[MinValueValidator(Decimal('0'))], verbose_name='Desde')
+    hasta = models.DecimalField(
+        max_digits=14, decimal_places=2, null=True, blank=True,
+        verbose_name='Hasta', help_text='Vacío = en adelante'
+    )
+    porcentaje = models.DecimalField(
+        max_digits=6, decimal_places=3,
+        validators=[MinValueValidator(Decimal('0')), MaxValueValidator(Decimal('100'))],
+        verbose_name='Porcentaje'
+    )
+
+    class Meta:
+        verbose_name = 'Tramo de Deducción'
+        verbose_name_plural = 'Tramos de Deducción'
+        ordering = ['regla', 'desde']
+
+    def __str__(self):
+        return f"{self.regla.codigo}: {self.desde} - {self.hasta or '∞'} ({self.porcentaje}%)"
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        if self.hasta is not None and self.hasta <= self.desde:
+            raise ValidationError({'hasta': 'Debe ser mayor que el inicio del tramo.'})
+
+
 class Bonificacion(models.Model):
     """
     Bonificaciones aplicadas a empleados en una planilla.
@@ -1081,6 +1795,41 @@ class HistorialSalario(models.Model):
         verbose_name = 'Historial de Salario'
         verbose_name_plural = 'Historial de Salarios'
         ordering = ['-fecha_cambio']
+        indexes = [
+            models.Index(fields=['empleado', 'fecha_cambio'], name='hist_salario_emp_fecha_idx'),
+        ]
+
+    @classmethod
+    def salarios_vigentes(cls, empleado_ids, fecha):
+        """
+        Salario base vigente de cada empleado al final del día `fecha`, en una sola
+        consulta: el salario nuevo del último cambio hasta esa fecha; si no hubo
+        ninguno, el salario anterior del primer cambio posterior (o su salario nuevo si
+        es el registro del salario inicial, sin anterior); y si tampoco hay historial,
+        el salario base actual. Retorna {empleado_id: salario}.
+        """
+        from datetime import datetime, time, timedelta
+        from django.conf import settings
+        from django.db.models import OuterRef, Subquery
+        from django.utils import timezone
+
+        # Inicio del día siguiente en la zona horaria local
+        limite = datetime.combine(fecha + timedelta(days=1), time.min)
+        if settings.USE_TZ:
+            limite = timezone.make_aware(limite)
+
+        historial = cls.objects.filter(empleado=OuterRef('pk'))
+        ultimo_hasta_fecha = historial.filter(fecha_cambio__lt=limite).order_by('-fecha_cambio', '-pk')
+        primero_despues = historial.filter(fecha_cambio__gte=limite).order_by('fecha_cambio', 'pk')
+        return dict(
+            Empleado.objects.filter(pk__in=empleado_ids)
+            .annotate(salario_vigente=Coalesce(
+                Subquery(ultimo_hasta_fecha.values('salario_nuevo')[:1]),
+                Subquery(primero_despues.values(salario=Coalesce('salario_anterior', 'salario_nuevo'))[:1]),
+                'salario_base',
+            ))
+            .values_list('pk', 'salario_vigente')
+        )
 
 
 # ====== MODELOS DE MAQUINARIA ======
@@ -1138,9 +1887,40 @@ class Maquinaria(models.Model):
     activo = models.BooleanField(default=True, verbose_name='Activo')
     observaciones = models.TextField(blank=True, null=True, verbose_name='Observaciones')
 
+    # Estado de sus usos, mantenido por UsoMaquinaria.save() y al eliminar un uso (ver signals),
+    # para validar y mostrar el horómetro mínimo sin recorrer el historial de usos
+    ultimo_horometro_final = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Último Horómetro Final'
+    )
+    ultimo_uso = models.ForeignKey(
+        'UsoMaquinaria',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+        verbose_name='Uso con el Último Horómetro Final'
+    )
+    uso_activo = models.ForeignKey(
+        'UsoMaquinaria',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+        verbose_name='Uso Activo'
+    )
+
     fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')
     fecha_modificacion = models.DateTimeField(auto_now=True, verbose_name='Última Modificación')
 
+    CAMPOS_USOS = ['ultimo_horometro_final', 'ultimo_uso', 'uso_activo']
+
     class Meta:
         verbose_name = 'Maquinaria'
         verbose_name_plural = 'Maquinarias'
@@ -1150,6 +1930,28 @@ class Maquinaria(models.Model):
     def __str__(self):
         return f"{self.codigo} - {self.nombre}"
 
+    def save(self, *args, **kwargs):
+        # Los campos de usos solo se escriben con update_fields (UsoMaquinaria.save() y signals):
+        # un guardado completo, como el del formulario, no pisa sus valores con los de una instancia vieja
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_USOS
+            ]
+        super().save(*args, **kwargs)
+
+    def recalcular_usos(self):
+        """
+        Vuelve a calcular desde el historial el último horómetro final (y su uso) y el
+        uso activo, sin guardarlos. Solo hace falta cuando se elimina o se corrige hacia
+        abajo el uso con el último horómetro; el resto lo mantiene UsoMaquinaria.save().
+        """
+        usos = UsoMaquinaria.objects.filter(maquinaria=self)
+        self.ultimo_uso_id, self.ultimo_horometro_final = usos.filter(horometro_final__isnull=False).order_by(
+            '-horometro_final', '-pk'
+        ).values_list('pk', 'horometro_final').first() or (None, None)
+        self.uso_activo_id = usos.filter(fecha_fin__isnull=True).values_list('pk', flat=True).first()
+
 
 class UsoMaquinaria(models.Model):
     """Registro de uso de maquinaria en un proyecto"""
@@ -1194,6 +1996,11 @@ class UsoMaquinaria(models.Model):
         validators=[MinValueValidator(Decimal('0.01'))],
         verbose_name='Tarifa Aplicada (por hora)'
     )
+    tarifa_manual = models.BooleanField(
+        default=False,
+        verbose_name='Tarifa Manual',
+        help_text='La tarifa aplicada se negoció para este uso y no se recalcula con el historial de tarifas'
+    )
 
     # Operador (opcional) - Usuario con rol operador que opera la maquinaria
     operador = models.ForeignKey(
@@ -1213,6 +2020,22 @@ class UsoMaquinaria(models.Model):
     )
     observaciones = models.TextField(blank=True, null=True, verbose_name='Observaciones')
 
+    # Valores calculados al guardar (ver calcular_costos) para poder sumarlos en la base de datos
+    horas_trabajadas = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False,
+        verbose_name='Horas Trabajadas'
+    )
+    costo_total = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False,
+        verbose_name='Costo Total'
+    )
+
     fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')
     fecha_modificacion = models.DateTimeField(auto_now=True, verbose_name='Última Modificación')
 
@@ -1220,51 +2043,115 @@ class UsoMaquinaria(models.Model):
         verbose_name = 'Uso de Maquinaria'
         verbose_name_plural = 'Usos de Maquinaria'
         ordering = ['-fecha_inicio']
+        indexes = [
+            # Permiten sumar costo_total por proyecto o por máquina solo con el índice
+            models.Index(fields=['proyecto', 'costo_total'], name='uso_maq_proyecto_costo_idx'),
+            models.Index(fields=['maquinaria', 'costo_total'], name='uso_maq_maquinaria_costo_idx'),
+        ]
+        constraints = [
+            # Una máquina tiene a lo sumo un uso activo (sin fecha de fin)
+            models.UniqueConstraint(
+                fields=['maquinaria'],
+                condition=models.Q(fecha_fin__isnull=True),
+                name='uso_maq_unico_activo',
+                violation_error_message='La maquinaria ya tiene un uso activo. Debe finalizar ese uso antes de crear uno nuevo.',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.maquinaria.codigo} - {self.proyecto.codigo} ({self.fecha_inicio})"
 
-    @property
-    def horas_trabajadas(self):
-        """Calcula las horas trabajadas"""
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Fin del uso leído de la base de datos: save() y clean() lo comparan sin volver a consultarlo
+        if 'fecha_fin' in field_names and 'horometro_final' in field_names:
+            instance._fin_original = (
+                values[field_names.index('fecha_fin')], values[field_names.index('horometro_final')]
+            )
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or {'fecha_fin', 'horometro_final'} <= set(fields):
+            self._fin_original = (self.fecha_fin, self.horometro_final)
+
+    def fin_original(self):
+        """(fecha_fin, horometro_final) guardados en la base de datos; (None, None) si el uso es nuevo"""
+        if self._state.adding:
+            return (None, None)
+        if not hasattr(self, '_fin_original'):
+            self._fin_original = UsoMaquinaria.objects.filter(pk=self.pk).values_list(
+                'fecha_fin', 'horometro_final'
+            ).first() or (None, None)
+        return self._fin_original
+
+    def tarifa_vigente(self):
+        """Tarifa de la maquinaria vigente en la fecha de inicio del uso (la actual si no tiene historial)"""
+        from .tarifas_maquinaria import historiales_tarifas, tarifa_en_fecha
+
+        historial = historiales_tarifas([self.maquinaria_id]).get(self.maquinaria_id)
+        tarifa = tarifa_en_fecha(historial, self.fecha_inicio) if self.fecha_inicio else None
+        return tarifa if tarifa is not None else self.maquinaria.tarifa_hora
+
+    def calcular_costos(self):
+        """Calcula horas trabajadas y costo total a partir de los horómetros y la tarifa aplicada"""
         if self.horometro_final and self.horometro_inicial:
-            return self.horometro_final - self.horometro_inicial
-        return Decimal('0.00')
-
-    @property
-    def costo_total(self):
-        """Calcula el costo total del uso"""
-        return self.horas_trabajadas * self.tarifa_aplicada
+            self.horas_trabajadas = self.horometro_final - self.horometro_inicial
+        else:
+            self.horas_trabajadas = Decimal('0.00')
+        self.costo_total = (self.horas_trabajadas * self.tarifa_aplicada).quantize(
+            Decimal('0.01'), rounding=ROUND_HALF_UP
+        )
 
     def save(self, *args, **kwargs):
-        # Auto-asignar tarifa si no se especificó
+        # Auto-asignar la tarifa vigente en la fecha de inicio si no se especificó
         if not self.tarifa_aplicada:
-            self.tarifa_aplicada = self.maquinaria.tarifa_hora
-
-        # Gestión automática del estado de la maquinaria
-        is_new = self.pk is None
+            self.tarifa_aplicada = self.tarifa_vigente()
+            self.tarifa_manual = False
 
-        if is_new:
-            # Si es un nuevo uso, marcar la maquinaria como "en_uso"
-            self.maquinaria.estado = 'en_uso'
-            self.maquinaria.save(update_fields=['estado'])
-
-        # Si el uso se finaliza (tiene fecha_fin y horometro_final)
-        if self.fecha_fin and self.horometro_final:
-            # Actualizar horómetro de la maquinaria
-            self.maquinaria.horometro_actual = self.horometro_final
-            # Marcar como disponible si no hay otros usos activos
-            otros_usos_activos = UsoMaquinaria.objects.filter(
-                maquinaria=self.maquinaria,
-                fecha_fin__isnull=True
-            ).exclude(pk=self.pk).exists()
-
-            if not otros_usos_activos:
-                self.maquinaria.estado = 'disponible'
-
-            self.maquinaria.save(update_fields=['horometro_actual', 'estado'])
+        self.calcular_costos()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'horas_trabajadas', 'costo_total'}
 
         super().save(*args, **kwargs)
+        self._fin_original = (self.fecha_fin, self.horometro_final)
+
+        # Gestión automática del estado de la maquinaria (una sola actualización). El uso
+        # activo es el que no tiene fecha de fin y uso_maq_unico_activo garantiza que haya
+        # a lo sumo uno por máquina, así que al finalizarlo no quedan otros usos activos
+        maquinaria = self.maquinaria
+        campos_maquinaria = []
+        if self.fecha_fin is None:
+            if maquinaria.uso_activo_id != self.pk:
+                # Retiro: la maquinaria pasa a estar en uso
+                maquinaria.uso_activo = self
+                maquinaria.estado = 'en_uso'
+                campos_maquinaria += ['uso_activo', 'estado']
+        elif maquinaria.uso_activo_id == self.pk:
+            # Devolución del uso activo: la maquinaria queda disponible
+            maquinaria.uso_activo = None
+            maquinaria.estado = 'disponible'
+            campos_maquinaria += ['uso_activo', 'estado']
+
+        # Si el uso se finaliza (tiene fecha_fin y horometro_final), actualizar el horómetro de la maquinaria
+        if self.fecha_fin and self.horometro_final:
+            maquinaria.horometro_actual = self.horometro_final
+            campos_maquinaria.append('horometro_actual')
+
+        if self.horometro_final and (
+            maquinaria.ultimo_horometro_final is None or self.horometro_final >= maquinaria.ultimo_horometro_final
+        ):
+            maquinaria.ultimo_horometro_final = self.horometro_final
+            maquinaria.ultimo_uso = self
+            campos_maquinaria += ['ultimo_horometro_final', 'ultimo_uso']
+        elif maquinaria.ultimo_uso_id == self.pk:
+            # Se corrigió hacia abajo el último horómetro final: buscar el nuevo máximo
+            maquinaria.recalcular_usos()
+            campos_maquinaria += Maquinaria.CAMPOS_USOS
+
+        if campos_maquinaria:
+            maquinaria.save(update_fields=campos_maquinaria)
 
     def clean(self):
         from django.core.exceptions import ValidationError
@@ -1278,18 +2165,13 @@ class UsoMaquinaria(models.Model):
 
         # Si estamos editando (self.pk existe)
         if self.pk:
-            # Obtener el objeto original de la base de datos
-            try:
-                original = UsoMaquinaria.objects.get(pk=self.pk)
-
-                # Si el uso ya está finalizado, NO permitir edición
-                if original.fecha_fin and original.horometro_final:
-                    raise ValidationError(
-                        'No se puede editar un uso de maquinaria que ya está finalizado. '
-                        'El uso fue completado y cerrado.'
-                    )
-            except UsoMaquinaria.DoesNotExist:
-                pass
+            # Si el uso ya estaba finalizado, NO permitir edición
+            fecha_fin_original, horometro_final_original = self.fin_original()
+            if fecha_fin_original and horometro_final_original:
+                raise ValidationError(
+                    'No se puede editar un uso de maquinaria que ya está finalizado. '
+                    'El uso fue completado y cerrado.'
+                )
 
             # Validar que no afecte registros posteriores
             if self.horometro_final:
@@ -1308,12 +2190,11 @@ class UsoMaquinaria(models.Model):
         # Solo validar horómetro inicial y estado de maquinaria en creación (no en edición)
         if not self.pk:
             # Validar que la maquinaria no esté en uso
-            if self.maquinaria.estado == 'en_uso':
+            if self.maquinaria.uso_activo_id:
                 # Buscar el uso activo
                 uso_activo = UsoMaquinaria.objects.filter(
-                    maquinaria=self.maquinaria,
-                    fecha_fin__isnull=True
-                ).first()
+                    pk=self.maquinaria.uso_activo_id
+                ).select_related('proyecto').first()
 
                 if uso_activo:
                     raise ValidationError({
@@ -1333,19 +2214,17 @@ class UsoMaquinaria(models.Model):
             horometro_minimo = self.maquinaria.horometro_actual
 
             # Validar que el horómetro inicial no sea menor al último horómetro final registrado
-            ultimo_uso = UsoMaquinaria.objects.filter(
-                maquinaria=self.maquinaria
-            ).exclude(pk=self.pk).order_by('-horometro_final').first()
+            ultimo_horometro_final = self.maquinaria.ultimo_horometro_final
 
-            if ultimo_uso and ultimo_uso.horometro_final:
+            if ultimo_horometro_final:
                 # El mínimo es el mayor entre el horómetro actual y el último horómetro final
-                horometro_minimo = max(horometro_minimo, ultimo_uso.horometro_final)
+                horometro_minimo = max(horometro_minimo, ultimo_horometro_final)
 
             # Validar que el horómetro inicial sea mayor o igual al mínimo
             if self.horometro_inicial < horometro_minimo:
-                if ultimo_uso and ultimo_uso.horometro_final:
+                if ultimo_horometro_final:
                     raise ValidationError({
-                        'horometro_inicial': f'El horómetro inicial no puede ser menor al último horómetro final registrado ({ultimo_uso.horometro_final} hrs)'
+                        'horometro_inicial': f'El horómetro inicial no puede ser menor al último horómetro final registrado ({ultimo_horometro_final} hrs)'
                     })
                 else:
                     raise ValidationError({
@@ -1353,6 +2232,100 @@ class UsoMaquinaria(models.Model):
                     })
 
 
+class UsoMaquinariaMensual(models.Model):
+    """
+    Horas, costo y cantidad de usos por maquinaria, proyecto y mes (por fecha de
+    inicio del uso), para servir el reporte de utilización de la flota sin recorrer
+    el historial de usos. Guardar el proyecto permite contar proyectos distintos en
+    cualquier rango de meses.
+
+    Se mantiene al día desde signals recalculando el mes afectado de la maquinaria.
+    Reconstruir/verificar: python manage.py reconstruir_usos_mensuales
+    """
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='usos_maquinaria_mensuales',
+        verbose_name='Empresa',
+        null=True,
+        blank=True
+    )
+    maquinaria = models.ForeignKey(
+        Maquinaria,
+        on_delete=models.CASCADE,
+        related_name='usos_mensuales',
+        verbose_name='Maquinaria'
+    )
+    proyecto = models.ForeignKey(
+        Proyecto,
+        on_delete=models.CASCADE,
+        related_name='usos_maquinaria_mensuales',
+        verbose_name='Proyecto'
+    )
+    mes = models.DateField(verbose_name='Mes', help_text='Primer día del mes')
+    horas = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name='Horas Trabajadas')
+    costo = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name='Costo')
+    cantidad_usos = models.PositiveIntegerField(default=0, verbose_name='Cantidad de Usos')
+
+    class Meta:
+        verbose_name = 'Uso Mensual de Maquinaria'
+        verbose_name_plural = 'Usos Mensuales de Maquinaria'
+        ordering = ['mes', 'maquinaria', 'proyecto']
+        unique_together = ['maquinaria', 'mes', 'proyecto']
+        indexes = [
+            models.Index(fields=['empresa', 'mes'], name='uso_maq_mensual_emp_mes_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.maquinaria_id} - {self.proyecto_id} - {self.mes:%Y-%m}: {self.horas} h"
+
+    @classmethod
+    def calcular(cls, maquinarias, desde=None, hasta=None):
+        """
+        Calcula desde los usos {(maquinaria_id, proyecto_id, mes): (horas, costo, cantidad_usos)}
+        para las maquinarias del queryset, opcionalmente solo de los meses entre desde y
+        hasta (inclusive). Hace una sola consulta agrupada por mes.
+        """
+        from django.db.models.functions import TruncMonth
+
+        usos = UsoMaquinaria.objects.filter(maquinaria__in=maquinarias.values('pk'))
+        if desde:
+            usos = usos.filter(fecha_inicio__gte=desde)
+        if hasta:
+            usos = usos.filter(fecha_inicio__lt=_mes_siguiente(hasta))
+        filas = usos.order_by().values('maquinaria_id', 'proyecto_id', mes=TruncMonth('fecha_inicio')).annotate(
+            horas=models.Sum('horas_trabajadas'), costo=models.Sum('costo_total'), cantidad=models.Count('pk')
+        )
+        return {
+            (fila['maquinaria_id'], fila['proyecto_id'], fila['mes']): (fila['horas'], fila['costo'], fila['cantidad'])
+            for fila in filas
+        }
+
+    @classmethod
+    def recalcular(cls, maquinaria_id, fecha):
+        """Recalcula las filas de una maquinaria en el mes de la fecha indicada"""
+        from django.db import transaction
+
+        mes = _inicio_mes(fecha)
+        with transaction.atomic():
+            # Bloquear la maquinaria serializa los recálculos concurrentes de la misma máquina
+            empresa_ids = list(
+                Maquinaria.objects.select_for_update().filter(pk=maquinaria_id).values_list('empresa_id', flat=True)
+            )
+            if not empresa_ids:
+                # La maquinaria fue eliminada; sus filas se eliminan en cascada
+                return
+            valores = cls.calcular(Maquinaria.objects.filter(pk=maquinaria_id), desde=mes, hasta=mes)
+            cls.objects.filter(maquinaria_id=maquinaria_id, mes=mes).delete()
+            cls.objects.bulk_create([
+                cls(
+                    empresa_id=empresa_ids[0], maquinaria_id=maquinaria_id, proyecto_id=proyecto_id, mes=mes,
+                    horas=horas, costo=costo, cantidad_usos=cantidad
+                )
+                for (_, proyecto_id, _), (horas, costo, cantidad) in valores.items()
+            ])
+
+
 class HistorialTarifaMaquinaria(models.Model):
     """
     Historial de cambios en la tarifa de maquinaria.
@@ -1382,6 +2355,19 @@ class HistorialTarifaMaquinaria(models.Model):
         auto_now_add=True,
         verbose_name='Fecha del Cambio'
     )
+    # Intervalo [vigente_desde, vigente_hasta) en que rige la tarifa nueva; vigente_hasta lo
+    # mantiene actualizar_vigencias() y queda vacío en la tarifa vigente hoy
+    vigente_desde = models.DateField(
+        default=timezone.localdate,
+        verbose_name='Vigente Desde',
+        help_text='Fecha desde la que rige la tarifa nueva (puede ser anterior a la fecha del cambio)'
+    )
+    vigente_hasta = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Vigente Hasta'
+    )
     usuario = models.ForeignKey(
         'Usuario',
         on_delete=models.SET_NULL,
@@ -1401,6 +2387,10 @@ class HistorialTarifaMaquinaria(models.Model):
         verbose_name = 'Historial de Tarifa de Maquinaria'
         verbose_name_plural = 'Historial de Tarifas de Maquinaria'
         ordering = ['-fecha_cambio']
+        indexes = [
+            # Busca la tarifa vigente de una máquina en una fecha (ver anotar_tarifa_vigente)
+            models.Index(fields=['maquinaria', 'vigente_desde', 'vigente_hasta'], name='hist_tarifa_maq_vigencia_idx'),
+        ]
 
     def __str__(self):
         if self.tarifa_anterior:
@@ -1408,6 +2398,58 @@ class HistorialTarifaMaquinaria(models.Model):
         else:
             return f"{self.maquinaria.codigo}: Tarifa inicial L.{self.tarifa_nueva} ({self.fecha_cambio.strftime('%d/%m/%Y')})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if kwargs.get('update_fields') is None or 'vigente_desde' in kwargs['update_fields']:
+            HistorialTarifaMaquinaria.actualizar_vigencias(self.maquinaria_id)
+
+    @classmethod
+    def actualizar_vigencias(cls, maquinaria_id):
+        """
+        Recalcula vigente_hasta en el historial de una maquinaria: cada tarifa rige hasta
+        que empieza la siguiente (por vigente_desde y, en la misma fecha, la registrada
+        después), así que los intervalos no se traslapan y cubren todo desde la primera.
+        """
+        cambios = list(
+            cls.objects.filter(maquinaria_id=maquinaria_id)
+            .order_by('vigente_desde', 'fecha_cambio', 'pk')
+            .only('pk', 'vigente_desde', 'vigente_hasta')
+        )
+        modificados = []
+        for cambio, siguiente in zip(cambios, cambios[1:] + [None]):
+            vigente_hasta = siguiente.vigente_desde if siguiente else None
+            if cambio.vigente_hasta != vigente_hasta:
+                cambio.vigente_hasta = vigente_hasta
+                modificados.append(cambio)
+        cls.objects.bulk_update(modificados, ['vigente_hasta'])
+
+    @classmethod
+    def anotar_tarifa_vigente(cls, usos):
+        """
+        Anota en el queryset de usos la tarifa vigente en su fecha de inicio (tarifa_vigente),
+        con un join contra el intervalo del historial que contiene la fecha. Los usos
+        anteriores a la primera tarifa registrada toman la tarifa con que empezó la máquina
+        (la anterior del primer cambio o, si fue la inicial, esa misma); sin historial, None.
+        """
+        primera = cls.objects.filter(maquinaria=models.OuterRef('maquinaria')).order_by(
+            'vigente_desde', 'fecha_cambio', 'pk'
+        )
+        return usos.annotate(
+            vigencia=models.FilteredRelation(
+                'maquinaria__historial_tarifas',
+                condition=models.Q(maquinaria__historial_tarifas__vigente_desde__lte=models.F('fecha_inicio'))
+                & (
+                    models.Q(maquinaria__historial_tarifas__vigente_hasta__isnull=True)
+                    | models.Q(maquinaria__historial_tarifas__vigente_hasta__gt=models.F('fecha_inicio'))
+                ),
+            ),
+        ).annotate(
+            tarifa_vigente=Coalesce(
+                'vigencia__tarifa_nueva',
+                models.Subquery(primera.values(tarifa=Coalesce('tarifa_anterior', 'tarifa_nueva'))[:1]),
+            ),
+        )
+
 
 def pago_comprobante_upload_path(instance, filename):
     """
@@ -0,0 +1,137 @@
+"""
+Guardado en bloque de los formsets de una planilla.
+
+En lugar de un INSERT/UPDATE/DELETE por fila (formset.save()), se compara lo
+enviado contra lo guardado y se aplican, por cada modelo hijo (DetallePlanilla,
+Bonificacion, Deduccion, HoraExtra), un bulk_create, un bulk_update y un solo
+DELETE. Al final solo se recalculan los totales de los empleados afectados.
+
+Si se indica la versión de la planilla que vio el usuario, el guardado falla con
+ConflictoVersionPlanilla cuando otro usuario la modificó después (control de
+concurrencia optimista sobre Planilla.version).
+"""
+from django.db import transaction
+
+from .cierre_planilla import PlanillaCerrada
+from .signals import programar_recalculo_planilla, recalculos_suspendidos
+
+
+class ConflictoVersionPlanilla(Exception):
+    """La planilla fue modificada por otro usuario desde que se cargó"""
+
+    def __init__(self, version_actual):
+        self.version_actual = version_actual
+        super().__init__(
+            'La planilla fue modificada por otro usuario. Recargue la página para ver los cambios.'
+        )
+
+
+def _cambios_guardables(formset):
+    """
+    Filas editadas con los campos del modelo que cambiaron. Se ignoran los campos
+    que el formulario solo muestra (por ejemplo el salario devengado de solo lectura).
+    """
+    editables = set(formset.form._meta.fields or ())
+    cambios = []
+    for objeto, cambiados in formset.changed_objects:
+        campos = [campo for campo in cambiados if campo in editables]
+        if campos:
+            cambios.append((objeto, campos))
+    return cambios
+
+
+def _empleados_afectados(formset, cambios):
+    """Empleados cuyas filas se agregan, cambian o eliminan (incluye el empleado anterior de una fila editada)"""
+    empleados = set()
+    for objeto in formset.new_objects + formset.deleted_objects:
+        empleados.add(objeto.empleado_id)
+    for objeto, campos in cambios:
+        empleados.add(objeto.empleado_id)
+    empleados_anteriores = {
+        form.instance.pk: form.initial.get('empleado') for form in formset.initial_forms
+    }
+    for objeto, campos in cambios:
+        if 'empleado' in campos and empleados_anteriores.get(objeto.pk):
+            empleados.add(empleados_anteriores[objeto.pk])
+    return empleados
+
+
+def _aplicar_formset(formset, planilla):
+    """
+    Aplica las altas, cambios y bajas de un formset ya validado con operaciones en bloque.
+    Retorna los empleados afectados.
+    """
+    from .models import DetallePlanilla, HistorialSalario
+
+    modelo = formset.model
+    formset.instance = planilla
+    # Con commit=False el formset solo calcula la diferencia (new/changed/deleted_objects)
+    formset.save(commit=False)
+
+    eliminados = [objeto.pk for objeto in formset.deleted_objects if objeto.pk]
+    if eliminados:
+        modelo.objects.filter(planilla=planilla, pk__in=eliminados).delete()
+
+    cambios = _cambios_guardables(formset)
+    if cambios:
+        campos = sorted({campo for _, cambiados in cambios for campo in cambiados})
+        modelo.objects.bulk_update([objeto for objeto, _ in cambios], campos, batch_size=500)
+
+    nuevos = formset.new_objects
+    if nuevos:
+        if modelo is DetallePlanilla:
+            # Lo que DetallePlanilla.save() haría fila por fila: salario del período y total neto
+            salarios = HistorialSalario.salarios_vigentes(
+                {detalle.empleado_id for detalle in nuevos}, planilla.periodo_fin
+            )
+            for detalle in nuevos:
+                if not detalle.salario_devengado:
+                    detalle.salario_devengado = DetallePlanilla.salario_del_periodo(
+                        salarios[detalle.empleado_id], planilla.tipo_planilla
+                    )
+                detalle.actualizar_total_neto()
+        modelo.objects.bulk_create(nuevos, batch_size=500)
+
+    return _empleados_afectados(formset, cambios)
+
+
+def bloquear_planilla(planilla, version=None):
+    """
+    Bloquea la planilla hasta el final de la transacción en curso y comprueba que
+    siga abierta (si no, PlanillaCerrada) y, con version, que nadie la haya
+    modificado desde que se cargó (si no, ConflictoVersionPlanilla).
+    """
+    from .models import Planilla
+
+    version_actual, cerrada = Planilla.objects.select_for_update().filter(pk=planilla.pk).values_list(
+        'version', 'cerrada'
+    ).get()
+    if cerrada:
+        raise PlanillaCerrada()
+    if version is not None and version_actual != version:
+        raise ConflictoVersionPlanilla(version_actual)
+
+
+def guardar_formsets_planilla(planilla, *formsets, version=None):
+    """
+    Guarda en una transacción los formsets (ya validados) de la planilla con
+    operaciones en bloque y recalcula una sola vez los totales de los empleados
+    afectados y el monto total, incrementando la versión de la planilla.
+
+    Bloquea la planilla y lanza PlanillaCerrada si ya se cerró; con version, lanza
+    ConflictoVersionPlanilla si su versión actual es otra.
+    Retorna (líneas recalculadas, empleados afectados).
+    """
+    with transaction.atomic():
+        bloquear_planilla(planilla, version)
+
+        # Las bajas disparan signals por fila; el recálculo se programa una sola vez al final
+        empleados = set()
+        with recalculos_suspendidos():
+            for formset in formsets:
+                empleados |= _aplicar_formset(formset, planilla)
+
+        detalles = planilla.recalcular_totales_empleados(empleados)
+        programar_recalculo_planilla(planilla)
+
+    return detalles, empleados
@@ -0,0 +1,191 @@
+"""
+Portafolio de empresas para superusuarios.
+
+Calcula los KPIs de cada empresa (proyectos activos, empleados activos, gastos
+pendientes y utilidad) con consultas agrupadas por empresa, en lotes que se
+reparten entre varios hilos. El resultado de cada empresa se guarda en cache
+con la misma versión del dashboard, así que los signals que invalidan el
+dashboard también invalidan sus KPIs y solo se recalculan las empresas que
+cambiaron.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q, Sum
+
+from .cache_dashboard import TIMEOUT_PAYLOAD, obtener_versiones
+
+ESTADOS_ACTIVOS = ['planificacion', 'en_progreso']
+
+CAMPOS_KPI = ['proyectos_activos', 'total_proyectos', 'empleados_activos', 'gastos_pendientes',
+              'monto_contratos', 'costos_totales', 'utilidad_total']
+
+
+def _clave_kpis(empresa_id, version):
+    return f'portafolio:kpis:{empresa_id or "sin_empresa"}:{version}'
+
+
+def _filtro_empresas(campo, empresa_ids):
+    """Filtro por las empresas del lote; None representa los registros sin empresa"""
+    filtro = Q(**{f'{campo}__in': [empresa_id for empresa_id in empresa_ids if empresa_id is not None]})
+    if None in empresa_ids:
+        filtro |= Q(**{f'{campo}__isnull': True})
+    return filtro
+
+
+def _kpis_vacios():
+    return {
+        'proyectos_activos': 0,
+        'total_proyectos': 0,
+        'empleados_activos': 0,
+        'gastos_pendientes': Decimal('0.00'),
+        'monto_contratos': Decimal('0.00'),
+        'costos_totales': Decimal('0.00'),
+        'utilidad_total': Decimal('0.00'),
+    }
+
+
+def calcular_kpis_lote(empresa_ids):
+    """
+    Calcula los KPIs de un lote de empresas con una consulta agrupada por tabla
+    (3 consultas en total, sin importar cuántas empresas tenga el lote).
+    Retorna {empresa_id: kpis}.
+    """
+    from .models import Empleado, Gasto, Proyecto
+
+    kpis = {empresa_id: _kpis_vacios() for empresa_id in empresa_ids}
+
+    # Proyectos: conteos y totales financieros leídos del resumen financiero acumulado
+    proyectos = (
+        Proyecto.objects.filter(_filtro_empresas('empresa', empresa_ids))
+        .with_resumen()
+        .order_by()
+        .values('empresa')
+        .annotate(
+            activos=Count('id', filter=Q(estado__in=ESTADOS_ACTIVOS)),
+            total=Count('id'),
+            contratos=Sum('monto_contrato'),
+            costos=Sum('costos_totales'),
+            utilidad=Sum('utilidad_bruta'),
+        )
+    )
+    for fila in proyectos:
+        datos = kpis[fila['empresa']]
+        datos['proyectos_activos'] = fila['activos']
+        datos['total_proyectos'] = fila['total']
+        datos['monto_contratos'] = fila['contratos'] or Decimal('0.00')
+        datos['costos_totales'] = fila['costos'] or Decimal('0.00')
+        datos['utilidad_total'] = fila['utilidad'] or Decimal('0.00')
+
+    empleados = (
+        Empleado.objects.filter(_filtro_empresas('empresa', empresa_ids), activo=True)
+        .order_by()
+        .values('empresa')
+        .annotate(total=Count('id'))
+    )
+    for fila in empleados:
+        kpis[fila['empresa']]['empleados_activos'] = fila['total']
+
+    gastos = (
+        Gasto.objects.filter(_filtro_empresas('proyecto__empresa', empresa_ids), pagado=False)
+        .order_by()
+        .values('proyecto__empresa')
+        .annotate(total=Sum('monto'))
+    )
+    for fila in gastos:
+        kpis[fila['proyecto__empresa']]['gastos_pendientes'] = fila['total'] or Decimal('0.00')
+
+    return kpis
+
+
+def _calcular_kpis_lote_en_hilo(empresa_ids):
+    """Ejecuta calcular_kpis_lote() en un hilo del pool y cierra su conexión al terminar"""
+    try:
+        return calcular_kpis_lote(empresa_ids)
+    finally:
+        connection.close()
+
+
+def _calcular_kpis(empresa_ids):
+    """
+    Calcula los KPIs de las empresas indicadas, dividiéndolas en lotes de
+    PORTAFOLIO_TAMANO_LOTE que se reparten entre PORTAFOLIO_WORKERS hilos.
+    """
+    tamano_lote = max(getattr(settings, 'PORTAFOLIO_TAMANO_LOTE', 50), 1)
+    workers = getattr(settings, 'PORTAFOLIO_WORKERS', 4)
+    lotes = [empresa_ids[i:i + tamano_lote] for i in range(0, len(empresa_ids), tamano_lote)]
+
+    resultado = {}
+    # Dentro de una transacción los hilos (con su propia conexión) no verían los
+    # cambios aún no confirmados, así que en ese caso se calcula en el hilo actual
+    if workers <= 1 or len(lotes) <= 1 or connection.in_atomic_block:
+        for lote in lotes:
+            resultado.update(calcular_kpis_lote(lote))
+        return resultado
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(lotes))) as pool:
+        for kpis in pool.map(_calcular_kpis_lote_en_hilo, lotes):
+            resultado.update(kpis)
+    return resultado
+
+
+def obtener_kpis_empresas(empresa_ids):
+    """
+    Retorna {empresa_id: kpis} para las empresas indicadas.
+    Los KPIs de cada empresa se leen del cache con la versión vigente de su
+    dashboard; solo se calculan las empresas sin entrada en el cache.
+    """
+    empresa_ids = list(empresa_ids)
+    versiones = obtener_versiones(empresa_ids)
+    claves = {empresa_id: _clave_kpis(empresa_id, versiones[empresa_id]) for empresa_id in empresa_ids}
+
+    encontrados = cache.get_many(list(claves.values()))
+    kpis = {
+        empresa_id: encontrados[clave]
+        for empresa_id, clave in claves.items()
+        if clave in encontrados
+    }
+
+    faltantes = [empresa_id for empresa_id in empresa_ids if empresa_id not in kpis]
+    if faltantes:
+        calculados = _calcular_kpis(faltantes)
+        cache.set_many(
+            {claves[empresa_id]: datos for empresa_id, datos in calculados.items()},
+            timeout=TIMEOUT_PAYLOAD,
+        )
+        kpis.update(calculados)
+
+    return kpis
+
+
+def portafolio_empresas(incluir_sin_empresa=False):
+    """
+    Retorna la lista de empresas con sus KPIs (ordenada por nombre) y los
+    totales del portafolio. Con incluir_sin_empresa, los registros que no
+    pertenecen a ninguna empresa se suman en una fila adicional.
+    """
+    from .models import Empresa
+
+    empresas = list(Empresa.objects.order_by('nombre').values('id', 'nombre', 'codigo', 'activa'))
+    empresa_ids = [empresa['id'] for empresa in empresas]
+    if incluir_sin_empresa:
+        empresas.append({'id': None, 'nombre': 'Sin empresa', 'codigo': None, 'activa': True})
+        empresa_ids.append(None)
+
+    kpis = obtener_kpis_empresas(empresa_ids)
+
+    totales = _kpis_vacios()
+    filas = []
+    for empresa in empresas:
+        datos = kpis[empresa['id']]
+        for campo in CAMPOS_KPI:
+            totales[campo] += datos[campo]
+        # La fila sin empresa solo se muestra si hay registros en ella
+        if empresa['id'] is None and not (datos['total_proyectos'] or datos['empleados_activos']):
+            continue
+        filas.append({**empresa, **datos})
+
+    return {'empresas': filas, 'totales': totales}
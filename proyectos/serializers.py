@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from .models import (
     Cliente, Empleado, Proyecto, AsignacionEmpleado, Planilla,
-    DetallePlanilla, Gasto, Pago
+    DetallePlanilla, Gasto, Pago, CostoMensualProyecto, CierrePlanilla, DetalleCierrePlanilla,
+    UsoMaquinaria, UsoMaquinariaMensual
 )
 
 
@@ -29,6 +30,10 @@ class AsignacionEmpleadoSerializer(serializers.ModelSerializer):
 
 
 class DetallePlanillaSerializer(serializers.ModelSerializer):
+    """
+    Los totales de la línea (deducciones, bonificaciones, horas extra y total neto) son
+    los que guarda Planilla.recalcular_totales(); no se consultan por cada línea.
+    """
     empleado_nombre = serializers.CharField(source='empleado.nombre_completo', read_only=True)
     total = serializers.SerializerMethodField()
 
@@ -37,12 +42,28 @@ class DetallePlanillaSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_total(self, obj):
-        return float(obj.calcular_total())
+        return float(obj.total_neto)
+
+
+class DetalleCierrePlanillaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DetalleCierrePlanilla
+        exclude = ['cierre']
+
+
+class CierrePlanillaSerializer(serializers.ModelSerializer):
+    """Montos congelados de una planilla cerrada"""
+    detalles = DetalleCierrePlanillaSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = CierrePlanilla
+        exclude = ['planilla']
 
 
 class PlanillaSerializer(serializers.ModelSerializer):
     proyecto_nombre = serializers.CharField(source='proyecto.nombre', read_only=True)
     detalles = DetallePlanillaSerializer(many=True, read_only=True)
+    cierre = CierrePlanillaSerializer(read_only=True)
     monto_total = serializers.SerializerMethodField()
 
     class Meta:
@@ -70,6 +91,11 @@ class PagoSerializer(serializers.ModelSerializer):
 
 
 class ProyectoSerializer(serializers.ModelSerializer):
+    """
+    Serializer completo de proyecto.
+    Los campos financieros usan las anotaciones de Proyecto.objects.with_financials()
+    cuando el queryset las trae; si no, se calculan con los métodos del modelo.
+    """
     cliente_nombre = serializers.CharField(source='cliente.nombre', read_only=True)
     costos_totales = serializers.SerializerMethodField()
     utilidad_bruta = serializers.SerializerMethodField()
@@ -114,3 +140,38 @@ class ProyectoListSerializer(serializers.ModelSerializer):
 
     def get_margen_utilidad(self, obj):
         return float(obj.calcular_margen_utilidad())
+
+
+class CostoMensualProyectoSerializer(serializers.ModelSerializer):
+    proyecto_nombre = serializers.CharField(source='proyecto.nombre', read_only=True)
+    categoria_display = serializers.CharField(source='get_categoria_display', read_only=True)
+
+    class Meta:
+        model = CostoMensualProyecto
+        fields = ['id', 'proyecto', 'proyecto_nombre', 'mes', 'categoria', 'categoria_display', 'monto']
+
+
+class UsoMaquinariaSerializer(serializers.ModelSerializer):
+    maquinaria_codigo = serializers.CharField(source='maquinaria.codigo', read_only=True)
+    proyecto_codigo = serializers.CharField(source='proyecto.codigo', read_only=True)
+
+    class Meta:
+        model = UsoMaquinaria
+        fields = [
+            'id', 'maquinaria', 'maquinaria_codigo', 'proyecto', 'proyecto_codigo', 'fecha_inicio', 'fecha_fin',
+            'horometro_inicial', 'horometro_final', 'tarifa_aplicada', 'tarifa_manual', 'horas_trabajadas',
+            'costo_total', 'operador', 'descripcion_trabajo', 'observaciones'
+        ]
+        read_only_fields = fields
+
+
+class UsoMaquinariaMensualSerializer(serializers.ModelSerializer):
+    maquinaria_codigo = serializers.CharField(source='maquinaria.codigo', read_only=True)
+    proyecto_nombre = serializers.CharField(source='proyecto.nombre', read_only=True)
+
+    class Meta:
+        model = UsoMaquinariaMensual
+        fields = [
+            'id', 'maquinaria', 'maquinaria_codigo', 'proyecto', 'proyecto_nombre', 'mes',
+            'horas', 'costo', 'cantidad_usos'
+        ]
@@ -1,6 +1,18 @@
-from django.db.models.signals import pre_save, post_save
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import Empleado, HistorialSalario, Maquinaria, HistorialTarifaMaquinaria
+from django.utils.dateparse import parse_date
+from .models import (
+    Empleado, HistorialSalario, Maquinaria, HistorialTarifaMaquinaria,
+    Proyecto, ProyectoResumenFinanciero, Planilla, DetallePlanilla, Deduccion,
+    Bonificacion, HoraExtra, Gasto, Pago, OrdenCambio, UsoMaquinaria, Cliente,
+    CostoMensualProyecto, AsignacionEmpleado, UsoMaquinariaMensual
+)
+from .cache_dashboard import invalidar_dashboard
+from .cache_empleados import invalidar_empleados
 
 
 @receiver(pre_save, sender=Empleado)
@@ -8,27 +20,27 @@ def crear_historial_salario(sender, instance, **kwargs):
     """
     Signal que se ejecuta antes de guardar un empleado.
     Si el salario_base ha cambiado, crea un registro en HistorialSalario.
+    El salario anterior es el que se leyó de la base de datos al cargar el empleado
+    (Empleado.from_db); solo se consulta si la instancia no se cargó de la base de datos.
     """
     # Solo procesar si el empleado ya existe (no es nuevo)
     if instance.pk:
-        try:
-            # Obtener el empleado original de la base de datos
-            empleado_anterior = Empleado.objects.get(pk=instance.pk)
-
-            # Verificar si el salario ha cambiado
-            if empleado_anterior.salario_base != instance.salario_base:
-                # Crear registro en el historial
-                # Nota: No podemos obtener el usuario aquí directamente,
-                # por lo que se debe establecer en el admin o view si es necesario
-                HistorialSalario.objects.create(
-                    empleado=instance,
-                    salario_anterior=empleado_anterior.salario_base,
-                    salario_nuevo=instance.salario_base,
-                    motivo='Cambio de salario base'
-                )
-        except Empleado.DoesNotExist:
-            # El empleado no existía antes, es nuevo
-            pass
+        if hasattr(instance, '_salario_base_original'):
+            salario_anterior = instance._salario_base_original
+        else:
+            salario_anterior = Empleado.objects.filter(pk=instance.pk).values_list('salario_base', flat=True).first()
+
+        # Verificar si el salario ha cambiado (None: el empleado no existía antes)
+        if salario_anterior is not None and salario_anterior != instance.salario_base:
+            # Crear registro en el historial
+            # Nota: No podemos obtener el usuario aquí directamente,
+            # por lo que se debe establecer en el admin o view si es necesario
+            HistorialSalario.objects.create(
+                empleado=instance,
+                salario_anterior=salario_anterior,
+                salario_nuevo=instance.salario_base,
+                motivo='Cambio de salario base'
+            )
     else:
         # Es un nuevo empleado, crear el primer registro de historial
         # Esto se hará en post_save para asegurarnos de que tenga pk
@@ -58,6 +70,8 @@ def crear_historial_inicial_empleado(sender, instance, created, **kwargs):
             salario_nuevo=instance.salario_base,
             motivo='Salario inicial al crear empleado'
         )
+    # El salario guardado pasa a ser el original para el próximo save() de esta instancia
+    instance._salario_base_original = instance.salario_base
 
 
 # ====== SIGNALS PARA MAQUINARIA ======
@@ -67,6 +81,10 @@ def crear_historial_tarifa_maquinaria(sender, instance, **kwargs):
     """
     Crea un registro en el historial cuando cambia la tarifa_hora de una maquinaria
     """
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'tarifa_hora' not in update_fields:
+        # Guardados parciales que no tocan la tarifa (por ejemplo, el estado desde UsoMaquinaria.save())
+        return
     if instance.pk:  # Solo si la maquinaria ya existe
         try:
             maquinaria_anterior = Maquinaria.objects.get(pk=instance.pk)
@@ -95,3 +113,326 @@ def crear_historial_tarifa_inicial(sender, instance, created, **kwargs):
             tarifa_nueva=instance.tarifa_hora,
             motivo='Tarifa inicial'
         )
+
+
+@receiver(post_delete, sender=HistorialTarifaMaquinaria)
+def actualizar_vigencias_al_eliminar_tarifa(sender, instance, **kwargs):
+    """La tarifa anterior a la eliminada pasa a regir también en su intervalo"""
+    HistorialTarifaMaquinaria.actualizar_vigencias(instance.maquinaria_id)
+
+
+@receiver(post_delete, sender=UsoMaquinaria)
+def actualizar_maquinaria_al_eliminar_uso(sender, instance, **kwargs):
+    """
+    Recalcula el último horómetro final y el uso activo de la maquinaria del uso
+    eliminado; si era su uso activo, la maquinaria queda disponible
+    """
+    maquinaria = Maquinaria.objects.filter(pk=instance.maquinaria_id).first()
+    if maquinaria is None:
+        return
+    maquinaria.recalcular_usos()
+    campos = list(Maquinaria.CAMPOS_USOS)
+    if instance.fecha_fin is None and maquinaria.uso_activo_id is None and maquinaria.estado == 'en_uso':
+        maquinaria.estado = 'disponible'
+        campos.append('estado')
+    maquinaria.save(update_fields=campos)
+
+
+# ====== SIGNALS PARA RESUMEN FINANCIERO DE PROYECTOS ======
+
+# Modelos que alimentan ProyectoResumenFinanciero y la ruta hacia su proyecto
+MODELOS_RESUMEN_FINANCIERO = {
+    Gasto: 'proyecto',
+    Pago: 'proyecto',
+    OrdenCambio: 'proyecto',
+    UsoMaquinaria: 'proyecto',
+    Planilla: 'proyecto',
+    DetallePlanilla: 'planilla__proyecto',
+    Deduccion: 'planilla__proyecto',
+    Bonificacion: 'planilla__proyecto',
+    HoraExtra: 'planilla__proyecto',
+}
+
+
+def _proyecto_id_de(instance):
+    """Obtiene el proyecto afectado por un registro (directo o a través de su planilla)"""
+    if hasattr(instance, 'proyecto_id'):
+        return instance.proyecto_id
+    if 'planilla' in instance._state.fields_cache:
+        return instance.planilla.proyecto_id
+    # Consultar solo el id: la planilla puede estar eliminándose en cascada
+    return Planilla.objects.filter(pk=instance.planilla_id).values_list('proyecto_id', flat=True).first()
+
+
+# Marca por hilo para suspender los recálculos programados por los signals
+_estado_recalculos = threading.local()
+
+
+@contextmanager
+def recalculos_suspendidos():
+    """
+    Dentro del bloque, los signals no programan recálculos del resumen financiero
+    ni de los costos mensuales (de proyectos y de maquinaria). Sirve para operaciones en bloque sobre una planilla:
+    quien lo usa debe programar el recálculo al final (programar_recalculo_planilla).
+    """
+    anterior = getattr(_estado_recalculos, 'suspendidos', False)
+    _estado_recalculos.suspendidos = True
+    try:
+        yield
+    finally:
+        _estado_recalculos.suspendidos = anterior
+
+
+def _recalculos_suspendidos():
+    return getattr(_estado_recalculos, 'suspendidos', False)
+
+
+def programar_recalculo_planilla(planilla):
+    """Programa el recálculo del resumen y de los costos mensuales del proyecto de la planilla"""
+    _programar_recalculo_resumen(planilla.proyecto_id)
+    _programar_recalculo_costos_mensuales((planilla.proyecto_id, planilla.fecha_pago))
+
+
+def _programar_recalculo_resumen(*proyecto_ids):
+    """Recalcula el resumen de los proyectos al confirmar la transacción"""
+    for proyecto_id in set(proyecto_ids):
+        if proyecto_id:
+            transaction.on_commit(lambda pid=proyecto_id: ProyectoResumenFinanciero.recalcular(pid))
+
+
+def actualizar_resumen_al_guardar(sender, instance, raw=False, **kwargs):
+    """Mantiene al día el resumen financiero del proyecto al guardar un registro"""
+    if raw or _recalculos_suspendidos():
+        return
+    _programar_recalculo_resumen(_proyecto_id_de(instance), getattr(instance, '_proyecto_anterior_id', None))
+
+
+def actualizar_resumen_al_eliminar(sender, instance, **kwargs):
+    """Mantiene al día el resumen financiero del proyecto al eliminar un registro"""
+    if _recalculos_suspendidos():
+        return
+    _programar_recalculo_resumen(_proyecto_id_de(instance))
+
+
+for _modelo in MODELOS_RESUMEN_FINANCIERO:
+    post_save.connect(actualizar_resumen_al_guardar, sender=_modelo, dispatch_uid=f'resumen_post_save_{_modelo.__name__}')
+    post_delete.connect(actualizar_resumen_al_eliminar, sender=_modelo, dispatch_uid=f'resumen_post_delete_{_modelo.__name__}')
+
+
+@receiver(post_save, sender=Proyecto)
+def crear_resumen_financiero_proyecto(sender, instance, created, raw=False, **kwargs):
+    """Crea el resumen financiero (en cero) al crear un proyecto"""
+    if created and not raw:
+        ProyectoResumenFinanciero.objects.get_or_create(proyecto=instance)
+
+
+# ====== SIGNALS PARA CACHE DEL DASHBOARD ======
+
+# Modelos cuyos datos muestra el dashboard.
+# Planillas, pagos, órdenes de cambio y maquinaria llegan al dashboard a través
+# de ProyectoResumenFinanciero, que se guarda cada vez que alguno de ellos cambia.
+MODELOS_DASHBOARD = [Proyecto, Cliente, Empleado, Gasto, ProyectoResumenFinanciero]
+
+
+def _empresa_id_de(instance):
+    """Obtiene la empresa de un registro (directa o a través de su proyecto)"""
+    if hasattr(instance, 'empresa_id'):
+        return instance.empresa_id
+    if 'proyecto' in instance._state.fields_cache:
+        return instance.proyecto.empresa_id
+    # Consultar solo el id: el proyecto puede estar eliminándose en cascada
+    return Proyecto.objects.filter(pk=instance.proyecto_id).values_list('empresa_id', flat=True).first()
+
+
+def invalidar_dashboard_empresa(sender, instance, raw=False, **kwargs):
+    """
+    Cambia la versión del dashboard de la empresa al confirmar la transacción,
+    para que la siguiente visita lo recalcule con los datos ya guardados.
+    """
+    if raw:
+        return
+    empresa_id = _empresa_id_de(instance)
+    transaction.on_commit(lambda: invalidar_dashboard(empresa_id))
+
+
+for _modelo in MODELOS_DASHBOARD:
+    post_save.connect(invalidar_dashboard_empresa, sender=_modelo, dispatch_uid=f'dashboard_post_save_{_modelo.__name__}')
+    post_delete.connect(invalidar_dashboard_empresa, sender=_modelo, dispatch_uid=f'dashboard_post_delete_{_modelo.__name__}')
+
+
+# ====== SIGNALS PARA EL CACHE DE EMPLEADOS ======
+
+# Modelos que alimentan el catálogo de empleados y la nómina de cada proyecto
+MODELOS_CACHE_EMPLEADOS = [Empleado, AsignacionEmpleado]
+
+
+def invalidar_cache_empleados(sender, instance, raw=False, **kwargs):
+    """Cambia la versión de empleados de la empresa al confirmar la transacción"""
+    if raw:
+        return
+    empresa_id = _empresa_id_de(instance)
+    transaction.on_commit(lambda: invalidar_empleados(empresa_id))
+
+
+for _modelo in MODELOS_CACHE_EMPLEADOS:
+    post_save.connect(invalidar_cache_empleados, sender=_modelo, dispatch_uid=f'empleados_post_save_{_modelo.__name__}')
+    post_delete.connect(invalidar_cache_empleados, sender=_modelo, dispatch_uid=f'empleados_post_delete_{_modelo.__name__}')
+
+
+# ====== SIGNALS PARA COSTOS MENSUALES DE PROYECTOS ======
+
+# Modelos que alimentan CostoMensualProyecto: (ruta al proyecto, ruta a la fecha que define el mes)
+MODELOS_COSTOS_MENSUALES = {
+    Gasto: ('proyecto', 'fecha_gasto'),
+    Pago: ('proyecto', 'fecha_pago'),
+    UsoMaquinaria: ('proyecto', 'fecha_inicio'),
+    Planilla: ('proyecto', 'fecha_pago'),
+    DetallePlanilla: ('planilla__proyecto', 'planilla__fecha_pago'),
+    Deduccion: ('planilla__proyecto', 'planilla__fecha_pago'),
+    Bonificacion: ('planilla__proyecto', 'planilla__fecha_pago'),
+    HoraExtra: ('planilla__proyecto', 'planilla__fecha_pago'),
+}
+
+
+def _mes_costo_de(sender, instance):
+    """Obtiene (proyecto_id, fecha) del registro (directo o a través de su planilla)"""
+    ruta_proyecto, ruta_fecha = MODELOS_COSTOS_MENSUALES[sender]
+    if ruta_proyecto == 'proyecto':
+        fecha = getattr(instance, ruta_fecha)
+        if isinstance(fecha, str):
+            fecha = parse_date(fecha)
+        return instance.proyecto_id, fecha
+    if 'planilla' in instance._state.fields_cache:
+        return instance.planilla.proyecto_id, instance.planilla.fecha_pago
+    # Consultar solo los valores: la planilla puede estar eliminándose en cascada
+    return Planilla.objects.filter(pk=instance.planilla_id).values_list('proyecto_id', 'fecha_pago').first()
+
+
+def _programar_recalculo_costos_mensuales(*meses):
+    """Recalcula los meses (proyecto_id, fecha) afectados al confirmar la transacción"""
+    pendientes = {
+        (proyecto_id, fecha.replace(day=1))
+        for proyecto_id, fecha in filter(None, meses)
+        if proyecto_id and fecha
+    }
+    for proyecto_id, mes in pendientes:
+        transaction.on_commit(lambda pid=proyecto_id, m=mes: CostoMensualProyecto.recalcular(pid, m))
+
+
+def actualizar_costos_mensuales_al_guardar(sender, instance, raw=False, **kwargs):
+    """Mantiene al día los costos mensuales del proyecto al guardar un registro"""
+    if raw or _recalculos_suspendidos():
+        return
+    _programar_recalculo_costos_mensuales(
+        _mes_costo_de(sender, instance), getattr(instance, '_mes_costo_anterior', None)
+    )
+
+
+def actualizar_costos_mensuales_al_eliminar(sender, instance, **kwargs):
+    """Mantiene al día los costos mensuales del proyecto al eliminar un registro"""
+    if _recalculos_suspendidos():
+        return
+    _programar_recalculo_costos_mensuales(_mes_costo_de(sender, instance))
+
+
+for _modelo in MODELOS_COSTOS_MENSUALES:
+    post_save.connect(actualizar_costos_mensuales_al_guardar, sender=_modelo, dispatch_uid=f'costos_mensuales_post_save_{_modelo.__name__}')
+    post_delete.connect(actualizar_costos_mensuales_al_eliminar, sender=_modelo, dispatch_uid=f'costos_mensuales_post_delete_{_modelo.__name__}')
+
+
+@receiver(post_save, sender=Proyecto)
+def actualizar_empresa_costos_mensuales(sender, instance, created, raw=False, **kwargs):
+    """Si el proyecto cambia de empresa, mueve sus costos mensuales a la nueva empresa"""
+    if created or raw:
+        return
+    CostoMensualProyecto.objects.filter(proyecto=instance).exclude(
+        empresa_id=instance.empresa_id
+    ).update(empresa_id=instance.empresa_id)
+
+
+# ====== SIGNALS PARA USOS MENSUALES DE MAQUINARIA ======
+
+def programar_recalculo_usos_mensuales(*meses):
+    """Recalcula los meses (maquinaria_id, fecha) afectados al confirmar la transacción"""
+    pendientes = {
+        (maquinaria_id, fecha.replace(day=1))
+        for maquinaria_id, fecha in filter(None, meses)
+        if maquinaria_id and fecha
+    }
+    for maquinaria_id, mes in pendientes:
+        transaction.on_commit(lambda mid=maquinaria_id, m=mes: UsoMaquinariaMensual.recalcular(mid, m))
+
+
+def programar_recalculo_usos(usos):
+    """
+    Programa el recálculo del resumen, los costos mensuales de los proyectos y los usos
+    mensuales de las maquinarias de usos guardados en bloque (sin signals)
+    """
+    _programar_recalculo_resumen(*(uso.proyecto_id for uso in usos))
+    _programar_recalculo_costos_mensuales(*((uso.proyecto_id, uso.fecha_inicio) for uso in usos))
+    programar_recalculo_usos_mensuales(*((uso.maquinaria_id, uso.fecha_inicio) for uso in usos))
+
+
+def _mes_uso_de(instance):
+    """Obtiene (maquinaria_id, fecha) del uso"""
+    fecha = instance.fecha_inicio
+    if isinstance(fecha, str):
+        fecha = parse_date(fecha)
+    return instance.maquinaria_id, fecha
+
+
+@receiver(post_save, sender=UsoMaquinaria)
+def actualizar_usos_mensuales_al_guardar(sender, instance, raw=False, **kwargs):
+    """Mantiene al día los usos mensuales de la maquinaria al guardar un uso"""
+    if raw or _recalculos_suspendidos():
+        return
+    programar_recalculo_usos_mensuales(_mes_uso_de(instance), getattr(instance, '_mes_uso_anterior', None))
+
+
+@receiver(post_delete, sender=UsoMaquinaria)
+def actualizar_usos_mensuales_al_eliminar(sender, instance, **kwargs):
+    """Mantiene al día los usos mensuales de la maquinaria al eliminar un uso"""
+    if _recalculos_suspendidos():
+        return
+    programar_recalculo_usos_mensuales(_mes_uso_de(instance))
+
+
+# ====== VALORES ANTERIORES DE LOS REGISTROS EDITADOS ======
+
+def _campos_anteriores(modelo):
+    """Campos del registro guardado que necesitan los recálculos al editarlo"""
+    campos = []
+    if modelo in MODELOS_RESUMEN_FINANCIERO:
+        campos.append(MODELOS_RESUMEN_FINANCIERO[modelo])
+    if modelo in MODELOS_COSTOS_MENSUALES:
+        campos.extend(MODELOS_COSTOS_MENSUALES[modelo])
+    if modelo is UsoMaquinaria:
+        campos.extend(['maquinaria', 'fecha_inicio'])
+    return list(dict.fromkeys(campos))
+
+
+CAMPOS_ANTERIORES = {
+    modelo: _campos_anteriores(modelo)
+    for modelo in {**MODELOS_RESUMEN_FINANCIERO, **MODELOS_COSTOS_MENSUALES}
+}
+
+
+def guardar_valores_anteriores(sender, instance, raw=False, **kwargs):
+    """
+    Antes de editar un registro, recuerda en una sola consulta su proyecto, su mes y,
+    en los usos, su maquinaria anteriores, para corregir también el resumen financiero,
+    los costos mensuales y los usos mensuales de donde se movió.
+    """
+    if raw or instance._state.adding or not instance.pk or _recalculos_suspendidos():
+        return
+    valores = sender.objects.filter(pk=instance.pk).values(*CAMPOS_ANTERIORES[sender]).first()
+    if sender in MODELOS_RESUMEN_FINANCIERO:
+        instance._proyecto_anterior_id = valores and valores[MODELOS_RESUMEN_FINANCIERO[sender]]
+    if sender in MODELOS_COSTOS_MENSUALES:
+        instance._mes_costo_anterior = valores and tuple(valores[campo] for campo in MODELOS_COSTOS_MENSUALES[sender])
+    if sender is UsoMaquinaria:
+        instance._mes_uso_anterior = valores and (valores['maquinaria'], valores['fecha_inicio'])
+
+
+for _modelo in CAMPOS_ANTERIORES:
+    pre_save.connect(guardar_valores_anteriores, sender=_modelo, dispatch_uid=f'valores_anteriores_pre_save_{_modelo.__name__}')
@@ -0,0 +1,160 @@
+"""
+Tarifas de maquinaria con vigencia.
+
+Cada cambio de HistorialTarifaMaquinaria rige en el intervalo [vigente_desde,
+vigente_hasta). El recálculo resuelve la tarifa vigente en la fecha de inicio de
+todos los usos de un queryset con un solo join contra ese intervalo (ver
+HistorialTarifaMaquinaria.anotar_tarifa_vigente), guarda la tarifa aplicada y el
+costo de los usos que cambian con un bulk_update y recalcula una sola vez los
+resúmenes y montos mensuales afectados. Así, una corrección retroactiva de
+tarifa (registrar_tarifa) ya no obliga a editar los usos uno por uno.
+
+Los usos con tarifa_manual (una tarifa negociada, distinta de la del historial en su
+fecha) no se recalculan salvo que se pida explícitamente con incluir_manuales.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+
+from .signals import programar_recalculo_usos
+
+
+class ResultadoRecalculoTarifas:
+    """Resumen de un recálculo: usos revisados y actualizados, y costo antes y después"""
+
+    def __init__(self):
+        self.revisados = 0
+        self.actualizados = 0
+        self.manuales = 0
+        self.costo_anterior = Decimal('0.00')
+        self.costo_nuevo = Decimal('0.00')
+
+    @property
+    def diferencia(self):
+        return self.costo_nuevo - self.costo_anterior
+
+
+def recalcular_tarifas_usos(usos, solo_verificar=False, incluir_manuales=False):
+    """
+    Aplica a los usos del queryset la tarifa vigente en su fecha de inicio y recalcula
+    su costo. Los usos de máquinas sin historial de tarifas no se tocan, ni los de
+    tarifa manual salvo con incluir_manuales (que los vuelve a la tarifa del
+    historial). Con solo_verificar no guarda nada. Retorna un ResultadoRecalculoTarifas.
+    """
+    from .models import HistorialTarifaMaquinaria, Maquinaria, UsoMaquinaria
+
+    resultado = ResultadoRecalculoTarifas()
+    with transaction.atomic():
+        # Bloquear las máquinas serializa el recálculo con los retiros y devoluciones (ver uso_maquinaria)
+        list(
+            Maquinaria.objects.select_for_update()
+            .filter(pk__in=usos.order_by().values('maquinaria_id'))
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        filas = HistorialTarifaMaquinaria.anotar_tarifa_vigente(usos.order_by()).values_list(
+            'pk', 'maquinaria_id', 'proyecto_id', 'fecha_inicio', 'horas_trabajadas', 'tarifa_aplicada', 'costo_total',
+            'tarifa_manual', 'tarifa_vigente',
+        )
+
+        cambios = []
+        for pk, maquinaria_id, proyecto_id, fecha_inicio, horas, tarifa, costo, manual, tarifa_vigente in filas.iterator(
+            chunk_size=2000
+        ):
+            resultado.revisados += 1
+            if tarifa_vigente is None or tarifa_vigente == tarifa:
+                continue
+            if manual and not incluir_manuales:
+                resultado.manuales += 1
+                continue
+            # Igual que UsoMaquinaria.calcular_costos()
+            costo_nuevo = (horas * tarifa_vigente).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            resultado.costo_anterior += costo
+            resultado.costo_nuevo += costo_nuevo
+            cambios.append(UsoMaquinaria(
+                pk=pk, maquinaria_id=maquinaria_id, proyecto_id=proyecto_id, fecha_inicio=fecha_inicio,
+                tarifa_aplicada=tarifa_vigente, tarifa_manual=False, costo_total=costo_nuevo,
+            ))
+        resultado.actualizados = len(cambios)
+
+        if not solo_verificar and cambios:
+            UsoMaquinaria.objects.bulk_update(
+                cambios, ['tarifa_aplicada', 'tarifa_manual', 'costo_total'], batch_size=500
+            )
+            # bulk_update no dispara los signals que mantienen los resúmenes y los montos mensuales
+            programar_recalculo_usos(cambios)
+
+    return resultado
+
+
+def registrar_tarifa(maquinaria, tarifa, vigente_desde, motivo='', usuario=None):
+    """
+    Registra una tarifa que rige desde vigente_desde (hoy o una fecha pasada, como
+    corrección retroactiva) y recalcula los usos de la máquina que caen en su
+    vigencia, salvo los de tarifa manual. Si es la tarifa vigente hoy, también pasa a ser la tarifa actual de la
+    máquina. Retorna (cambio del historial, ResultadoRecalculoTarifas).
+    """
+    from .models import HistorialTarifaMaquinaria, Maquinaria, UsoMaquinaria
+
+    with transaction.atomic():
+        maquinaria = Maquinaria.objects.select_for_update().get(pk=maquinaria.pk)
+        tarifa_anterior = HistorialTarifaMaquinaria.objects.filter(
+            maquinaria=maquinaria, vigente_desde__lte=vigente_desde
+        ).order_by('-vigente_desde', '-fecha_cambio', '-pk').values_list('tarifa_nueva', flat=True).first()
+        cambio = HistorialTarifaMaquinaria.objects.create(
+            maquinaria=maquinaria,
+            tarifa_anterior=tarifa_anterior,
+            tarifa_nueva=tarifa,
+            vigente_desde=vigente_desde,
+            usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+            motivo=motivo or 'Corrección de tarifa',
+        )
+        # save() del historial calculó la vigencia de todos los cambios de la máquina
+        cambio.refresh_from_db(fields=['vigente_hasta'])
+
+        if cambio.vigente_hasta is None and maquinaria.tarifa_hora != tarifa:
+            # update() evita el signal que registraría el cambio por segunda vez
+            Maquinaria.objects.filter(pk=maquinaria.pk).update(tarifa_hora=tarifa)
+
+        usos = UsoMaquinaria.objects.filter(maquinaria=maquinaria, fecha_inicio__gte=vigente_desde)
+        if cambio.vigente_hasta:
+            usos = usos.filter(fecha_inicio__lt=cambio.vigente_hasta)
+        resultado = recalcular_tarifas_usos(usos)
+
+    return cambio, resultado
+
+
+def historiales_tarifas(maquinaria_ids):
+    """
+    Historial de tarifas de varias maquinarias en una consulta, para resolver la tarifa
+    vigente de usos que aún no están guardados (ver tarifa_en_fecha):
+    {maquinaria_id: [(vigente_desde, tarifa_anterior, tarifa_nueva), ...]} en orden de vigencia.
+    """
+    from .models import HistorialTarifaMaquinaria
+
+    historiales = {}
+    for maquinaria_id, vigente_desde, tarifa_anterior, tarifa_nueva in (
+        HistorialTarifaMaquinaria.objects.filter(maquinaria_id__in=maquinaria_ids)
+        .order_by('maquinaria_id', 'vigente_desde', 'fecha_cambio', 'pk')
+        .values_list('maquinaria_id', 'vigente_desde', 'tarifa_anterior', 'tarifa_nueva')
+    ):
+        historiales.setdefault(maquinaria_id, []).append((vigente_desde, tarifa_anterior, tarifa_nueva))
+    return historiales
+
+
+def tarifa_en_fecha(historial, fecha):
+    """
+    Tarifa vigente en la fecha según un historial de historiales_tarifas(), con la misma
+    regla que HistorialTarifaMaquinaria.anotar_tarifa_vigente. None si no hay historial.
+    """
+    if not historial:
+        return None
+    tarifa = None
+    for vigente_desde, _, tarifa_nueva in historial:
+        if vigente_desde > fecha:
+            break
+        tarifa = tarifa_nueva
+    if tarifa is None:
+        # Antes del primer cambio rige la tarifa con que empezó la máquina
+        _, tarifa_anterior, tarifa_nueva = historial[0]
+        tarifa = tarifa_anterior if tarifa_anterior is not None else tarifa_nueva
+    return tarifa
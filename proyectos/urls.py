@@ -13,11 +13,15 @@ router.register(r'planillas', views.PlanillaViewSet, basename='planilla')
 router.register(r'detalle-planillas', views.DetallePlanillaViewSet, basename='detalle-planilla')
 router.register(r'gastos', views.GastoViewSet, basename='gasto')
 router.register(r'pagos', views.PagoViewSet, basename='pago')
+router.register(r'costos-mensuales', views.CostoMensualProyectoViewSet, basename='costo-mensual')
+router.register(r'usos-maquinaria', views.UsoMaquinariaViewSet, basename='uso-maquinaria')
+router.register(r'usos-maquinaria-mensuales', views.UsoMaquinariaMensualViewSet, basename='uso-maquinaria-mensual')
 
 urlpatterns = [
     # Vistas HTML - Dashboard
     path('', views.dashboard, name='dashboard'),
     path('dashboard/', views.dashboard, name='dashboard_alt'),
+    path('dashboard/cache/', views.dashboard_cache_estadisticas, name='dashboard_cache_estadisticas'),
 
     # Clientes - CRUD
     path('clientes/', views.clientes_list, name='clientes_list'),
@@ -41,6 +45,7 @@ urlpatterns = [
     # Empleados - CRUD
     path('empleados/', views.empleados_list, name='empleados_list'),
     path('empleados/nuevo/', views.empleado_create, name='empleado_create'),
+    path('empleados/ajuste-salarial/', views.empleados_ajuste_salarial, name='empleados_ajuste_salarial'),
     path('empleados/<int:pk>/editar/', views.empleado_update, name='empleado_update'),
     path('empleados/<int:pk>/eliminar/', views.empleado_delete, name='empleado_delete'),
 
@@ -53,8 +58,14 @@ urlpatterns = [
     # Planillas - CRUD
     path('planillas/', views.planillas_list, name='planillas_list'),
     path('planillas/nueva/', views.planilla_create, name='planilla_create'),
+    path('planillas/generar/', views.planilla_generar, name='planilla_generar'),
+    path('planillas/exportar/', views.planillas_exportar, name='planillas_exportar'),
     path('planillas/<int:pk>/editar/', views.planilla_update, name='planilla_update'),
     path('planillas/<int:pk>/eliminar/', views.planilla_delete, name='planilla_delete'),
+    path('planillas/<int:pk>/importar/', views.planilla_importar, name='planilla_importar'),
+    path('planillas/<int:pk>/cierre/', views.planilla_cierre, name='planilla_cierre'),
+    path('planillas/<int:pk>/recalcular-salarios/', views.planilla_recalcular_salarios, name='planilla_recalcular_salarios'),
+    path('planillas/<int:pk>/deducciones-ley/', views.planilla_deducciones_ley, name='planilla_deducciones_ley'),
 
     # AJAX - Obtener empleados de un proyecto
     path('proyectos/<int:proyecto_id>/empleados/', views.get_empleados_proyecto, name='get_empleados_proyecto'),
@@ -84,6 +95,8 @@ urlpatterns = [
 
     # Empresas - CRUD (Solo Superusuarios)
     path('empresas/', views.empresas_list, name='empresas_list'),
+    path('portafolio/', views.portafolio, name='portafolio'),
+    path('portafolio/kpis/', views.portafolio_kpis, name='portafolio_kpis'),
     path('empresas/nueva/', views.empresa_create, name='empresa_create'),
     path('empresas/<int:pk>/editar/', views.empresa_update, name='empresa_update'),
     path('empresas/<int:pk>/eliminar/', views.empresa_delete, name='empresa_delete'),
@@ -104,6 +117,10 @@ urlpatterns = [
     path('maquinarias/<int:pk>/editar/', views.maquinaria_update, name='maquinaria_update'),
     path('maquinarias/<int:pk>/eliminar/', views.maquinaria_delete, name='maquinaria_delete'),
     path('maquinarias/<int:pk>/historial-tarifas/', views.maquinaria_historial_tarifas, name='maquinaria_historial_tarifas'),
+    path('maquinarias/<int:pk>/recalcular-tarifas/', views.maquinaria_recalcular_tarifas, name='maquinaria_recalcular_tarifas'),
+
+    # Utilización de la flota (reporte y exportación CSV)
+    path('utilizacion-flota/', views.maquinaria_utilizacion, name='maquinaria_utilizacion'),
 
     # AJAX endpoints
     path('api/maquinaria/<int:pk>/datos/', views.get_maquinaria_datos, name='get_maquinaria_datos'),
@@ -111,6 +128,7 @@ urlpatterns = [
     # Uso de Maquinaria - CRUD
     path('usos-maquinaria/', views.usos_maquinaria_list, name='usos_maquinaria_list'),
     path('usos-maquinaria/nuevo/', views.uso_maquinaria_create, name='uso_maquinaria_create'),
+    path('usos-maquinaria/importar/', views.usos_maquinaria_importar, name='usos_maquinaria_importar'),
     path('usos-maquinaria/<int:pk>/editar/', views.uso_maquinaria_update, name='uso_maquinaria_update'),
     path('usos-maquinaria/<int:pk>/eliminar/', views.uso_maquinaria_delete, name='uso_maquinaria_delete'),
 
@@ -0,0 +1,49 @@
+"""
+Retiro y devolución de maquinaria.
+
+Todos los cambios a los usos de una máquina pasan por aquí y bloquean primero
+la fila de la máquina (select_for_update), así que dos operadores no pueden
+retirar la misma máquina a la vez: el segundo espera al primero y encuentra la
+máquina ya en uso. Además la base de datos solo admite un uso activo (sin
+fecha de fin) por máquina (restricción uso_maq_unico_activo).
+"""
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+MENSAJE_EN_USO = 'La maquinaria ya tiene un uso activo. Debe finalizar ese uso antes de crear uno nuevo.'
+
+
+def _bloquear_maquinaria(maquinaria_id):
+    from .models import Maquinaria
+    return Maquinaria.objects.select_for_update().get(pk=maquinaria_id)
+
+
+def guardar_uso(uso):
+    """
+    Valida y guarda un uso de maquinaria: el retiro (uso nuevo, la máquina pasa a
+    en uso) o su edición y devolución (con fecha de fin y horómetro final, la
+    máquina vuelve a estar disponible). Lanza ValidationError como full_clean().
+    """
+    with transaction.atomic():
+        # Las validaciones usan el estado y el horómetro de la máquina bloqueada
+        uso.maquinaria = _bloquear_maquinaria(uso.maquinaria_id)
+        # Con la máquina bloqueada su uso_activo basta para detectar un uso activo; la
+        # restricción única queda como respaldo en la base de datos
+        uso.full_clean(validate_constraints=False)
+        try:
+            with transaction.atomic():
+                uso.save()
+        except IntegrityError:
+            # Solo si se saltó el bloqueo (por ejemplo, un uso guardado fuera de este módulo)
+            raise ValidationError({'maquinaria': MENSAJE_EN_USO})
+    return uso
+
+
+def eliminar_uso(uso):
+    """
+    Elimina un uso con la máquina bloqueada; el signal post_delete recalcula su
+    último horómetro y, si era el uso activo, la deja disponible.
+    """
+    with transaction.atomic():
+        _bloquear_maquinaria(uso.maquinaria_id)
+        uso.delete()
@@ -0,0 +1,166 @@
+"""
+Utilización de la flota de maquinaria.
+
+El reporte se arma desde la tabla UsoMaquinariaMensual (horas, costo y usos por
+maquinaria, proyecto y mes), no desde el historial de usos: el resumen por máquina
+es una sola consulta agrupada sobre las filas mensuales del rango, así que su costo
+depende de la cantidad de máquinas y meses, no de los años de usos registrados.
+"""
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import Count, DecimalField, FilteredRelation, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+# Horas que una máquina puede trabajar en un mes (26 días de 8 horas), base del porcentaje de utilización
+HORAS_DISPONIBLES_MES = Decimal('208')
+
+ENCABEZADOS_UTILIZACION = [
+    'Código', 'Nombre', 'Tipo', 'Estado', 'Horas', 'Costo', 'Usos', 'Proyectos',
+    'Meses con uso', 'Utilización %', 'Costo por hora',
+]
+
+_CERO = Value(Decimal('0.00'), output_field=DecimalField(max_digits=18, decimal_places=2))
+
+
+def parsear_mes(valor):
+    """Convierte 'AAAA-MM' en el primer día del mes (None si el valor no es válido)"""
+    try:
+        return datetime.strptime(valor, '%Y-%m').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def sumar_meses(mes, cantidad):
+    """Primer día del mes que está cantidad meses después (o antes, si es negativa)"""
+    indice = mes.year * 12 + mes.month - 1 + cantidad
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def rango_meses(desde, hasta):
+    """
+    (desde, hasta) como primeros días de mes a partir de textos 'AAAA-MM'; por defecto
+    los últimos 12 meses. Retorna None si el rango no es válido.
+    """
+    hasta = parsear_mes(hasta) if hasta else date.today().replace(day=1)
+    if desde:
+        desde = parsear_mes(desde)
+    else:
+        desde = sumar_meses(hasta, -11) if hasta else None
+    if not desde or not hasta or desde > hasta:
+        return None
+    return desde, hasta
+
+
+def cantidad_meses(desde, hasta):
+    return (hasta.year - desde.year) * 12 + hasta.month - desde.month + 1
+
+
+def maquinarias_utilizacion(empresa, desde, hasta, tipo=None, estado=None):
+    """
+    Maquinarias de la empresa (filtradas por tipo y estado) anotadas con sus horas,
+    costo, usos, proyectos distintos y meses con uso entre desde y hasta. Las máquinas
+    sin usos en el rango (ociosas) se incluyen con ceros.
+    """
+    from .models import Maquinaria
+
+    maquinarias = Maquinaria.objects.filter(empresa=empresa)
+    if tipo:
+        maquinarias = maquinarias.filter(tipo=tipo)
+    if estado:
+        maquinarias = maquinarias.filter(estado=estado)
+
+    return maquinarias.annotate(
+        periodo=FilteredRelation('usos_mensuales', condition=Q(usos_mensuales__mes__range=(desde, hasta))),
+    ).annotate(
+        total_horas=Coalesce(Sum('periodo__horas'), _CERO),
+        total_costo=Coalesce(Sum('periodo__costo'), _CERO),
+        cantidad_usos=Coalesce(Sum('periodo__cantidad_usos'), 0),
+        cantidad_proyectos=Count('periodo__proyecto', distinct=True),
+        meses_con_uso=Count('periodo__mes', distinct=True),
+    ).only('codigo', 'nombre', 'tipo', 'estado').order_by('codigo')
+
+
+def fila_utilizacion(maquinaria, meses):
+    """Datos de una maquinaria anotada por maquinarias_utilizacion() para el reporte"""
+    horas_disponibles = HORAS_DISPONIBLES_MES * meses
+    return {
+        'id': maquinaria.pk,
+        'codigo': maquinaria.codigo,
+        'nombre': maquinaria.nombre,
+        'tipo': maquinaria.tipo,
+        'tipo_display': maquinaria.get_tipo_display(),
+        'estado': maquinaria.estado,
+        'estado_display': maquinaria.get_estado_display(),
+        'horas': maquinaria.total_horas,
+        'costo': maquinaria.total_costo,
+        'usos': maquinaria.cantidad_usos,
+        'proyectos': maquinaria.cantidad_proyectos,
+        'meses_con_uso': maquinaria.meses_con_uso,
+        'utilizacion': (maquinaria.total_horas * 100 / horas_disponibles).quantize(
+            Decimal('0.01'), rounding=ROUND_HALF_UP
+        ),
+        'costo_por_hora': (
+            (maquinaria.total_costo / maquinaria.total_horas).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            if maquinaria.total_horas else None
+        ),
+    }
+
+
+def totales_utilizacion(filas, meses):
+    """Totales de la flota a partir de las filas del reporte"""
+    cantidad = len(filas)
+    horas = sum((fila['horas'] for fila in filas), Decimal('0.00'))
+    costo = sum((fila['costo'] for fila in filas), Decimal('0.00'))
+    horas_disponibles = HORAS_DISPONIBLES_MES * meses * cantidad
+    return {
+        'maquinarias': cantidad,
+        'ociosas': sum(1 for fila in filas if not fila['usos']),
+        'horas': horas,
+        'costo': costo,
+        'usos': sum(fila['usos'] for fila in filas),
+        'utilizacion': (
+            (horas * 100 / horas_disponibles).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            if horas_disponibles else Decimal('0.00')
+        ),
+        'costo_por_hora': (costo / horas).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if horas else None,
+    }
+
+
+def serie_mensual_flota(empresa, desde, hasta, tipo=None, estado=None):
+    """Horas, costo y máquinas con uso de la flota en cada mes del rango (meses sin uso en cero)"""
+    from .models import UsoMaquinariaMensual
+
+    filas = UsoMaquinariaMensual.objects.filter(empresa=empresa, mes__range=(desde, hasta))
+    if tipo:
+        filas = filas.filter(maquinaria__tipo=tipo)
+    if estado:
+        filas = filas.filter(maquinaria__estado=estado)
+    por_mes = {
+        fila['mes']: fila
+        for fila in filas.order_by().values('mes').annotate(
+            horas=Sum('horas'), costo=Sum('costo'), maquinarias=Count('maquinaria', distinct=True)
+        )
+    }
+
+    serie = []
+    for i in range(cantidad_meses(desde, hasta)):
+        mes = sumar_meses(desde, i)
+        fila = por_mes.get(mes, {})
+        serie.append({
+            'mes': mes,
+            'horas': fila.get('horas') or Decimal('0.00'),
+            'costo': fila.get('costo') or Decimal('0.00'),
+            'maquinarias': fila.get('maquinarias', 0),
+        })
+    return serie
+
+
+def filas_csv_utilizacion(filas):
+    """Filas del reporte en el orden de ENCABEZADOS_UTILIZACION"""
+    for fila in filas:
+        yield [
+            fila['codigo'], fila['nombre'], fila['tipo_display'], fila['estado_display'], fila['horas'],
+            fila['costo'], fila['usos'], fila['proyectos'], fila['meses_con_uso'], fila['utilizacion'],
+            fila['costo_por_hora'] if fila['costo_por_hora'] is not None else '',
+        ]
@@ -4,6 +4,8 @@ from django.contrib.auth import authenticate, login as auth_login, logout as aut
 from django.contrib.auth.views import LoginView
 from django.db.models import Sum, Count
 from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from rest_framework import viewsets, permissions, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -11,12 +13,14 @@ from django_filters.rest_framework import DjangoFilterBackend
 from .models import (
     Cliente, Proveedor, Empleado, Proyecto, AsignacionEmpleado, Planilla,
     DetallePlanilla, Gasto, Pago, Usuario, OrdenCambio, Deduccion, Empresa,
-    RegistroTrial, PagoRecibido
+    RegistroTrial, PagoRecibido, CostoMensualProyecto, ProyectoFinancialSnapshot, CierrePlanilla,
+    DetalleCierrePlanilla, HistorialSalario, UsoMaquinaria, UsoMaquinariaMensual
 )
 from .serializers import (
     ClienteSerializer, EmpleadoSerializer, ProyectoSerializer, ProyectoListSerializer,
     AsignacionEmpleadoSerializer, PlanillaSerializer, DetallePlanillaSerializer,
-    GastoSerializer, PagoSerializer
+    GastoSerializer, PagoSerializer, CostoMensualProyectoSerializer, UsoMaquinariaSerializer,
+    UsoMaquinariaMensualSerializer
 )
 from .forms import (
     ClienteForm, ProveedorForm, EmpleadoForm, ProyectoForm, GastoForm, PlanillaForm,
@@ -24,6 +28,7 @@ from .forms import (
     UsuarioCreationForm, UsuarioUpdateForm, RegistroPublicoForm
 )
 from .decorators import rol_requerido, permiso_escritura_requerido, permiso_financiero_requerido
+from .persistencia_planilla import guardar_formsets_planilla
 from django.contrib import messages
 import logging
 
@@ -92,24 +97,24 @@ def seleccionar_empresa(request):
         'empresas': empresas,
     })
 
-@login_required
-def dashboard(request, empresa_codigo=None):
-    empresa = get_empresa_from_request(request)
 
-    # Filtrar proyectos por empresa
+# Proyectos que muestra el dashboard global (superusuario sin empresa); el detalle
+# por empresa está en el portafolio
+LIMITE_PROYECTOS_DASHBOARD_GLOBAL = 50
+
+
+def _calcular_dashboard(empresa):
+    """Calcula los proyectos y estadísticas del dashboard (el payload que se guarda en cache)"""
+    # Filtrar proyectos por empresa (costos y utilidades leídos del resumen financiero acumulado)
     if empresa:
-        proyectos = Proyecto.objects.filter(empresa=empresa).select_related('cliente')
+        proyectos = Proyecto.objects.filter(empresa=empresa).select_related('cliente').with_resumen()
     else:
-        proyectos = Proyecto.objects.select_related('cliente').all()
+        proyectos = Proyecto.objects.select_related('cliente').with_resumen()[:LIMITE_PROYECTOS_DASHBOARD_GLOBAL]
 
     proyectos_data = []
 
     utilidad_total = 0
     for proyecto in proyectos:
-        costos = proyecto.calcular_costos_totales()
-        utilidad = proyecto.calcular_utilidad_bruta()
-        margen = proyecto.calcular_margen_utilidad()
-
         proyectos_data.append({
             'id': proyecto.id,
             'codigo': proyecto.codigo,
@@ -117,12 +122,12 @@ def dashboard(request, empresa_codigo=None):
             'cliente': proyecto.cliente.nombre if proyecto.cliente else 'Sin Cliente',
             'estado': proyecto.estado,
             'monto_contrato': proyecto.monto_contrato,
-            'costos_totales': costos,
-            'utilidad_bruta': utilidad,
-            'margen_utilidad': margen,
+            'costos_totales': proyecto.costos_totales,
+            'utilidad_bruta': proyecto.utilidad_bruta,
+            'margen_utilidad': proyecto.margen_utilidad,
             'get_estado_display': proyecto.get_estado_display(),
         })
-        utilidad_total += utilidad
+        utilidad_total += proyecto.utilidad_bruta
 
     # Calcular estadísticas filtradas por empresa
     if empresa:
@@ -133,14 +138,30 @@ def dashboard(request, empresa_codigo=None):
             'utilidad_total': utilidad_total,
         }
     else:
+        # Totales de todas las empresas desde los KPIs del portafolio (cacheados por empresa)
+        from .portafolio import portafolio_empresas
+
+        totales = portafolio_empresas(incluir_sin_empresa=True)['totales']
         stats = {
-            'proyectos_activos': Proyecto.objects.filter(estado__in=['planificacion', 'en_progreso']).count(),
-            'empleados_activos': Empleado.objects.filter(activo=True).count(),
-            'gastos_pendientes': Gasto.objects.filter(pagado=False).aggregate(total=Sum('monto'))['total'] or 0,
-            'utilidad_total': utilidad_total,
+            'proyectos_activos': totales['proyectos_activos'],
+            'empleados_activos': totales['empleados_activos'],
+            'gastos_pendientes': totales['gastos_pendientes'],
+            'utilidad_total': totales['utilidad_total'],
         }
 
-    # Calcular alertas de suscripción
+    return {'stats': stats, 'proyectos': proyectos_data}
+
+
+@login_required
+def dashboard(request, empresa_codigo=None):
+    from .cache_dashboard import obtener_dashboard
+
+    empresa = get_empresa_from_request(request)
+
+    # Proyectos y estadísticas desde el cache versionado de la empresa
+    datos = obtener_dashboard(empresa.pk if empresa else None, lambda: _calcular_dashboard(empresa))
+
+    # Calcular alertas de suscripción (dependen de la fecha actual, no se guardan en cache)
     from datetime import date
     alerta_suscripcion = None
 
@@ -217,9 +238,67 @@ def dashboard(request, empresa_codigo=None):
                 }
 
     return render(request, 'proyectos/dashboard.html', {
-        'stats': stats,
-        'proyectos': proyectos_data,
+        'stats': datos['stats'],
+        'proyectos': datos['proyectos'],
         'alerta_suscripcion': alerta_suscripcion,
+        'limite_proyectos': None if empresa else LIMITE_PROYECTOS_DASHBOARD_GLOBAL,
+    })
+
+
+@login_required
+def dashboard_cache_estadisticas(request, empresa_codigo=None):
+    """Aciertos y fallos del cache del dashboard en formato JSON - Solo para superusuarios"""
+    if not request.user.is_superuser:
+        return JsonResponse({'error': 'No tienes permisos para acceder a esta sección.'}, status=403)
+
+    from .cache_dashboard import estadisticas_cache_dashboard
+
+    empresa = get_empresa_from_request(request)
+    return JsonResponse({
+        'total': estadisticas_cache_dashboard(),
+        'empresa': estadisticas_cache_dashboard(empresa.pk) if empresa else None,
+    })
+
+
+@login_required
+def portafolio(request, empresa_codigo=None):
+    """Vista de KPIs de todas las empresas - Solo para superusuarios"""
+    if not request.user.is_superuser:
+        messages.error(request, 'No tienes permisos para acceder a esta sección.')
+        return redirect('dashboard', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+
+    from .portafolio import portafolio_empresas
+
+    datos = portafolio_empresas(incluir_sin_empresa=True)
+
+    # Orden opcional por un KPI (de mayor a menor)
+    orden = request.GET.get('orden')
+    if orden in ('proyectos_activos', 'empleados_activos', 'gastos_pendientes', 'utilidad_total'):
+        datos['empresas'].sort(key=lambda fila: fila[orden], reverse=True)
+
+    return render(request, 'proyectos/portafolio.html', {
+        'empresas': datos['empresas'],
+        'totales': datos['totales'],
+        'orden': orden,
+    })
+
+
+@login_required
+def portafolio_kpis(request, empresa_codigo=None):
+    """KPIs de todas las empresas en formato JSON - Solo para superusuarios"""
+    if not request.user.is_superuser:
+        return JsonResponse({'error': 'No tienes permisos para acceder a esta sección.'}, status=403)
+
+    from decimal import Decimal
+    from .portafolio import portafolio_empresas
+
+    datos = portafolio_empresas(incluir_sin_empresa=True)
+    return JsonResponse({
+        'empresas': [
+            {campo: float(valor) if isinstance(valor, Decimal) else valor for campo, valor in fila.items()}
+            for fila in datos['empresas']
+        ],
+        'totales': {campo: float(valor) if isinstance(valor, Decimal) else valor for campo, valor in datos['totales'].items()},
     })
 
 
@@ -245,6 +324,8 @@ def proyectos_list(request, empresa_codigo=None):
     if cliente_id:
         proyectos = proyectos.filter(cliente_id=cliente_id)
 
+    proyectos = proyectos.with_resumen()
+
     proyectos_data = []
     for proyecto in proyectos:
         proyectos_data.append({
@@ -254,9 +335,9 @@ def proyectos_list(request, empresa_codigo=None):
             'cliente': proyecto.cliente,
             'estado': proyecto.estado,
             'monto_contrato': proyecto.monto_contrato,
-            'costos_totales': proyecto.calcular_costos_totales(),
-            'utilidad_bruta': proyecto.calcular_utilidad_bruta(),
-            'margen_utilidad': proyecto.calcular_margen_utilidad(),
+            'costos_totales': proyecto.costos_totales,
+            'utilidad_bruta': proyecto.utilidad_bruta,
+            'margen_utilidad': proyecto.margen_utilidad,
             'get_estado_display': proyecto.get_estado_display(),
         })
 
@@ -283,48 +364,34 @@ def proyectos_list(request, empresa_codigo=None):
 
 @login_required
 def proyecto_detail(request, pk, empresa_codigo=None):
-    proyecto = get_object_or_404(Proyecto, pk=pk)
-
-    # Cálculos de costos
-    costos_totales = proyecto.calcular_costos_totales()
-    total_planillas = sum(p.monto_total for p in proyecto.planillas.all())
-    total_gastos = sum(g.monto for g in proyecto.gastos.all())
-    total_maquinaria = proyecto.calcular_costo_maquinaria()
-
-    # Cálculos de ingresos
-    monto_contrato_original = proyecto.monto_contrato
-    total_ordenes_cambio = proyecto.calcular_total_ordenes_cambio()
-    monto_total_proyecto = proyecto.calcular_monto_total_proyecto()
+    # Proyecto con todos sus totales anotados en una sola consulta
+    proyecto = get_object_or_404(Proyecto.objects.select_related('cliente').with_financials(), pk=pk)
+    finanzas = ProyectoFinancialSnapshot.de_proyecto(proyecto)
 
-    # Cálculos de pagos del cliente
-    total_pagado = proyecto.calcular_total_pagado()
-    saldo_pendiente = proyecto.calcular_saldo_pendiente()
-    porcentaje_pagado = proyecto.calcular_porcentaje_pagado()
-
-    # Utilidad
-    utilidad_bruta = proyecto.calcular_utilidad_bruta()
-    margen_utilidad = proyecto.calcular_margen_utilidad()
-
-    # Obtener desembolsos y órdenes de cambio
+    # Obtener desembolsos, órdenes de cambio, asignaciones y últimos gastos
     desembolsos = proyecto.pagos.all().order_by('-fecha_pago')
     ordenes_cambio = proyecto.ordenes_cambio.all().order_by('-fecha_solicitud')
+    asignaciones = proyecto.asignaciones.select_related('empleado')
+    gastos_recientes = proyecto.gastos.all()[:10]
 
     return render(request, 'proyectos/proyecto_detail.html', {
         'proyecto': proyecto,
-        'costos_totales': costos_totales,
-        'total_planillas': total_planillas,
-        'total_gastos': total_gastos,
-        'total_maquinaria': total_maquinaria,
-        'monto_contrato_original': monto_contrato_original,
-        'total_ordenes_cambio': total_ordenes_cambio,
-        'monto_total_proyecto': monto_total_proyecto,
-        'total_pagado': total_pagado,
-        'saldo_pendiente': saldo_pendiente,
-        'porcentaje_pagado': porcentaje_pagado,
-        'utilidad_bruta': utilidad_bruta,
-        'margen_utilidad': margen_utilidad,
+        'costos_totales': finanzas.costos_totales,
+        'total_planillas': finanzas.total_planillas,
+        'total_gastos': finanzas.total_gastos,
+        'total_maquinaria': finanzas.total_maquinaria,
+        'monto_contrato_original': finanzas.monto_contrato,
+        'total_ordenes_cambio': finanzas.total_ordenes_cambio,
+        'monto_total_proyecto': finanzas.monto_total_proyecto,
+        'total_pagado': finanzas.total_pagado,
+        'saldo_pendiente': finanzas.saldo_pendiente,
+        'porcentaje_pagado': finanzas.porcentaje_pagado,
+        'utilidad_bruta': finanzas.utilidad_bruta,
+        'margen_utilidad': finanzas.margen_utilidad,
         'desembolsos': desembolsos,
         'ordenes_cambio': ordenes_cambio,
+        'asignaciones': asignaciones,
+        'gastos_recientes': gastos_recientes,
         'empresa_codigo': empresa_codigo,
     })
 
@@ -376,33 +443,57 @@ def empleados_list(request, empresa_codigo=None):
     })
 
 
-@login_required
-def planillas_list(request, empresa_codigo=None):
-    empresa = get_empresa_from_request(request)
-
+def _filtrar_planillas(request, empresa):
+    """Planillas de la empresa con los filtros de la lista (proyecto, tipo, estado de pago y fechas de pago)"""
     # Filtrar planillas por empresa (a través de proyecto)
     if empresa:
         planillas = Planilla.objects.filter(proyecto__empresa=empresa).select_related('proyecto')
     else:
         planillas = Planilla.objects.select_related('proyecto').all()
 
-    # Filtros
     proyecto_id = request.GET.get('proyecto')
     tipo_planilla = request.GET.get('tipo_planilla')
     pagada = request.GET.get('pagada')
     fecha_desde = request.GET.get('fecha_desde')
     fecha_hasta = request.GET.get('fecha_hasta')
 
-    if proyecto_id:
+    # Los valores que no son un id o una fecha válidos se ignoran (la exportación los recibe de la URL)
+    if proyecto_id and proyecto_id.isdigit():
         planillas = planillas.filter(proyecto_id=proyecto_id)
     if tipo_planilla:
         planillas = planillas.filter(tipo_planilla=tipo_planilla)
     if pagada:
         planillas = planillas.filter(pagada=pagada == '1')
+    fecha_desde = _parsear_fecha(fecha_desde)
     if fecha_desde:
         planillas = planillas.filter(fecha_pago__gte=fecha_desde)
+    fecha_hasta = _parsear_fecha(fecha_hasta)
     if fecha_hasta:
         planillas = planillas.filter(fecha_pago__lte=fecha_hasta)
+    return planillas
+
+
+def _parsear_fecha(valor):
+    """Fecha 'AAAA-MM-DD' de un parámetro GET; None si falta o no es válida"""
+    from django.utils.dateparse import parse_date
+
+    try:
+        return parse_date(valor or '')
+    except ValueError:
+        return None
+
+
+@login_required
+def planillas_list(request, empresa_codigo=None):
+    empresa = get_empresa_from_request(request)
+
+    # Filtros
+    planillas = _filtrar_planillas(request, empresa)
+    proyecto_id = request.GET.get('proyecto')
+    tipo_planilla = request.GET.get('tipo_planilla')
+    pagada = request.GET.get('pagada')
+    fecha_desde = request.GET.get('fecha_desde')
+    fecha_hasta = request.GET.get('fecha_hasta')
 
     # Datos para filtros (filtrados por empresa)
     if empresa:
@@ -424,6 +515,128 @@ def planillas_list(request, empresa_codigo=None):
     })
 
 
+ENCABEZADOS_EXPORTACION_PLANILLA = [
+    'Proyecto', 'Período Inicio', 'Período Fin', 'Fecha Pago', 'Código', 'Empleado', 'DNI',
+    'Salario Devengado', 'Bonificaciones', 'Horas Extra', 'Monto Horas Extra', 'Deducciones', 'Total Neto',
+]
+
+# Columnas sumadas en los subtotales y el total de la exportación
+_MONTOS_EXPORTACION_PLANILLA = [
+    'salario_devengado', 'total_bonificaciones', 'total_horas_extra',
+    'monto_horas_extra', 'total_deducciones', 'total_neto',
+]
+
+
+def _filas_exportacion_planillas(planillas):
+    """
+    Filas de la exportación: una por línea de planilla, leídas con un cursor por bloques,
+    un subtotal por planilla (si hay varias) y el total general.
+
+    Las planillas cerradas se leen de su cierre (líneas y totales congelados, sin
+    agregar nada); las abiertas, de los totales guardados en sus líneas, con los
+    subtotales de una sola consulta agrupada por planilla.
+    """
+    from decimal import Decimal
+    from itertools import chain
+    from django.db.models import F
+
+    abiertas = planillas.filter(cerrada=False).values('pk')
+    cerradas = planillas.filter(cerrada=True).values('pk')
+
+    detalles = DetallePlanilla.objects.filter(planilla__in=abiertas)
+    subtotales = {
+        fila['planilla_id']: fila
+        for fila in detalles.order_by().values('planilla_id').annotate(
+            **{campo: Sum(campo) for campo in _MONTOS_EXPORTACION_PLANILLA}
+        )
+    }
+    subtotales.update(
+        (fila['planilla_id'], fila)
+        for fila in CierrePlanilla.objects.filter(planilla__in=cerradas).values(
+            'planilla_id', 'total_bonificaciones', 'total_horas_extra', 'monto_horas_extra', 'total_deducciones',
+            salario_devengado=F('total_devengado'), total_neto=F('monto_total'),
+        )
+    )
+    varias = len(subtotales) > 1
+    total = dict.fromkeys(_MONTOS_EXPORTACION_PLANILLA, Decimal('0'))
+
+    def fila_total(etiqueta, montos):
+        return [etiqueta, '', '', '', '', '', ''] + [montos[campo] for campo in _MONTOS_EXPORTACION_PLANILLA]
+
+    lineas_cerradas = DetalleCierrePlanilla.objects.filter(cierre__planilla__in=cerradas).order_by(
+        'cierre__planilla__fecha_pago', 'cierre__planilla_id', 'empleado_nombre', 'pk'
+    ).values_list(
+        'cierre__planilla_id', 'cierre__planilla__proyecto__codigo', 'cierre__planilla__periodo_inicio',
+        'cierre__planilla__periodo_fin', 'cierre__planilla__fecha_pago',
+        'empleado_codigo', 'empleado_nombre', 'empleado_dni', *_MONTOS_EXPORTACION_PLANILLA,
+    )
+    lineas_abiertas = detalles.order_by(
+        'planilla__fecha_pago', 'planilla_id', 'empleado__apellidos', 'empleado__nombres', 'pk'
+    ).values_list(
+        'planilla_id', 'planilla__proyecto__codigo', 'planilla__periodo_inicio', 'planilla__periodo_fin',
+        'planilla__fecha_pago', 'empleado__codigo', 'empleado__nombres', 'empleado__apellidos', 'empleado__dni',
+        *_MONTOS_EXPORTACION_PLANILLA,
+    )
+    lineas = chain(
+        lineas_cerradas.iterator(chunk_size=2000),
+        (
+            (planilla_id, proyecto, inicio, fin, fecha_pago, codigo, f'{nombres} {apellidos}', dni, *montos)
+            for planilla_id, proyecto, inicio, fin, fecha_pago, codigo, nombres, apellidos, dni, *montos
+            in lineas_abiertas.iterator(chunk_size=2000)
+        ),
+    )
+
+    planilla_actual = None
+    for planilla_id, *fila in lineas:
+        if planilla_id != planilla_actual:
+            if varias and planilla_actual is not None:
+                yield fila_total(f'Subtotal planilla {planilla_actual}', subtotales[planilla_actual])
+            planilla_actual = planilla_id
+        yield fila
+
+    if varias and planilla_actual is not None:
+        yield fila_total(f'Subtotal planilla {planilla_actual}', subtotales[planilla_actual])
+    for montos in subtotales.values():
+        for campo in _MONTOS_EXPORTACION_PLANILLA:
+            total[campo] += montos[campo] or 0
+    yield fila_total('TOTAL', total)
+
+
+@login_required
+def planillas_exportar(request, empresa_codigo=None):
+    """
+    Exporta en streaming (CSV o XLSX) las líneas de una planilla (?planilla=<id>) o de
+    las planillas que cumplen los filtros de la lista, para el pago al banco y la
+    declaración de impuestos.
+    """
+    from .exportacion import respuesta_csv_streaming, respuesta_xlsx_streaming
+
+    empresa = get_empresa_from_request(request)
+    formato = request.GET.get('formato', 'csv')
+    if formato not in ('csv', 'xlsx'):
+        messages.error(request, 'Formato de exportación no soportado.')
+        return redirect('planillas_list', empresa_codigo=empresa_codigo)
+
+    planilla_id = request.GET.get('planilla')
+    if planilla_id:
+        planillas = _filtrar_planillas(request, empresa).filter(pk=planilla_id if planilla_id.isdigit() else None)
+        # exists() no carga las planillas antes de la exportación en streaming
+        if not planillas.exists():
+            messages.error(request, 'La planilla no existe.')
+            return redirect('planillas_list', empresa_codigo=empresa_codigo)
+        nombre = f'planilla_{planilla_id}'
+    else:
+        planillas = _filtrar_planillas(request, empresa)
+        fecha_desde = request.GET.get('fecha_desde')
+        fecha_hasta = request.GET.get('fecha_hasta')
+        nombre = '_'.join(['planillas'] + [fecha for fecha in (fecha_desde, fecha_hasta) if fecha])
+
+    filas = _filas_exportacion_planillas(planillas)
+    if formato == 'xlsx':
+        return respuesta_xlsx_streaming(f'{nombre}.xlsx', ENCABEZADOS_EXPORTACION_PLANILLA, filas, nombre_hoja='Planilla')
+    return respuesta_csv_streaming(f'{nombre}.csv', ENCABEZADOS_EXPORTACION_PLANILLA, filas)
+
+
 @login_required
 def gastos_list(request, empresa_codigo=None):
     # Verificar permisos: solo admin, gerente y operador
@@ -738,6 +951,48 @@ def empleado_delete(request, pk, empresa_codigo=None):
     return render(request, 'proyectos/confirm_delete.html', {'object': empleado, 'tipo': 'empleado'})
 
 
+@login_required
+def empleados_ajuste_salarial(request, empresa_codigo=None):
+    """Aumenta o rebaja en bloque el salario base de los empleados activos"""
+    from .ajuste_salarios import ajustar_salarios
+    from .forms import AjusteSalarialForm
+
+    empresa = get_empresa_from_request(request)
+
+    if request.method == 'POST':
+        form = AjusteSalarialForm(request.POST, empresa=empresa)
+        if form.is_valid():
+            datos = form.cleaned_data
+            try:
+                resultado = ajustar_salarios(
+                    empresa,
+                    datos['tipo_ajuste'],
+                    datos['valor'],
+                    cargo=datos['cargo'] or None,
+                    tipo_contrato=datos['tipo_contrato'] or None,
+                    motivo=datos['motivo'],
+                    usuario=request.user,
+                )
+            except ValueError as error:
+                form.add_error('valor', str(error))
+            else:
+                if resultado.cantidad:
+                    messages.success(
+                        request,
+                        f'Salario ajustado a {resultado.cantidad} empleados. '
+                        f'Planilla mensual: ${resultado.total_anterior:,.2f} → ${resultado.total_nuevo:,.2f}.'
+                    )
+                else:
+                    messages.warning(request, 'Ningún empleado activo coincide con los filtros.')
+                return redirect('empleados_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+    else:
+        form = AjusteSalarialForm(empresa=empresa)
+
+    return render(request, 'proyectos/empleados_ajuste_salarial.html', {
+        'form': form,
+    })
+
+
 # ====== ASIGNACIONES DE EMPLEADOS ======
 
 @login_required
@@ -879,6 +1134,31 @@ def gasto_delete(request, pk, empresa_codigo=None):
     return render(request, 'proyectos/confirm_delete.html', {'object': gasto, 'tipo': 'gasto'})
 
 
+def _catalogo_empleados_planilla(empresa, *formsets):
+    """
+    Retorna el catálogo de empleados activos de la empresa (un solo payload cacheado)
+    y lo usa como opciones del select de empleado de cada fila de los formsets, en
+    lugar de que cada select consulte los empleados por su cuenta. Los empleados ya
+    asignados a una fila que no están en el catálogo (inactivos) se agregan a las opciones.
+    """
+    from .cache_empleados import catalogo_empleados
+
+    catalogo = catalogo_empleados(empresa)
+    opciones = [('', '---------')] + [
+        (empleado['id'], f"{empleado['codigo']} - {empleado['nombre_completo']}") for empleado in catalogo
+    ]
+    en_catalogo = {empleado['id'] for empleado in catalogo}
+    formularios = [form for formset in formsets for form in formset.forms]
+
+    faltantes = {form.instance.empleado_id for form in formularios if form.instance.pk} - en_catalogo
+    if faltantes:
+        opciones += [(empleado.pk, str(empleado)) for empleado in Empleado.objects.filter(pk__in=faltantes)]
+
+    for form in formularios:
+        form.fields['empleado'].choices = opciones
+    return catalogo
+
+
 @login_required
 def planilla_create(request, empresa_codigo=None):
     empresa = get_empresa_from_request(request)
@@ -891,15 +1171,12 @@ def planilla_create(request, empresa_codigo=None):
         deduccion_formset = DeduccionFormSet(request.POST)
 
         if form.is_valid() and formset.is_valid() and bonificacion_formset.is_valid() and horaextra_formset.is_valid() and deduccion_formset.is_valid():
-            planilla = form.save()
-            formset.instance = planilla
-            bonificacion_formset.instance = planilla
-            horaextra_formset.instance = planilla
-            deduccion_formset.instance = planilla
-            formset.save()
-            bonificacion_formset.save()
-            horaextra_formset.save()
-            deduccion_formset.save()
+            from django.db import transaction
+
+            # Líneas, bonificaciones, horas extra y deducciones se insertan en bloque
+            with transaction.atomic():
+                planilla = form.save()
+                guardar_formsets_planilla(planilla, formset, bonificacion_formset, horaextra_formset, deduccion_formset)
             messages.success(request, 'Planilla creada exitosamente.')
             return redirect('planillas_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
     else:
@@ -909,12 +1186,11 @@ def planilla_create(request, empresa_codigo=None):
         horaextra_formset = HoraExtraFormSet()
         deduccion_formset = DeduccionFormSet()
 
-    # Obtener todos los empleados con su salario para JavaScript (filtrado por empresa)
-    empleados = Empleado.objects.filter(empresa=empresa, activo=True).values('id', 'salario_base')
-    empleados_salarios = {emp['id']: float(emp['salario_base']) for emp in empleados}
-
-    # Obtener lista completa de empleados para los selects (filtrado por empresa)
-    empleados_list = Empleado.objects.filter(empresa=empresa, activo=True).order_by('apellidos', 'nombres')
+    # Catálogo de empleados compartido por los selects y el JavaScript (cacheado por empresa)
+    empleados_list = _catalogo_empleados_planilla(
+        empresa, formset, bonificacion_formset, horaextra_formset, deduccion_formset
+    )
+    empleados_salarios = {empleado['id']: empleado['salario_base'] for empleado in empleados_list}
 
     return render(request, 'proyectos/planilla_form.html', {
         'form': form,
@@ -927,11 +1203,110 @@ def planilla_create(request, empresa_codigo=None):
     })
 
 
+@login_required
+def planilla_generar(request, empresa_codigo=None):
+    """Genera en bloque las planillas de un período para los proyectos en progreso de la empresa"""
+    from .forms import GenerarPlanillasForm
+    from .generacion_planillas import generar_planillas
+
+    empresa = get_empresa_from_request(request)
+
+    if request.method == 'POST':
+        form = GenerarPlanillasForm(request.POST, empresa=empresa)
+        if form.is_valid():
+            datos = form.cleaned_data
+            resultado = generar_planillas(
+                empresa,
+                datos['periodo_inicio'],
+                datos['periodo_fin'],
+                datos['tipo_planilla'],
+                datos['fecha_pago'],
+                proyectos=datos['proyectos'] or None,
+                observaciones=datos['observaciones'] or None,
+            )
+            if resultado.planillas:
+                messages.success(
+                    request,
+                    f'{len(resultado.planillas)} planillas generadas con {resultado.total_detalles} empleados '
+                    f'(total ${resultado.monto_total:,.2f}).'
+                )
+            for proyecto, motivo in resultado.omitidos:
+                messages.warning(request, f'{proyecto.codigo} - {proyecto.nombre}: {motivo}.')
+            if not resultado.planillas and not resultado.omitidos:
+                messages.warning(request, 'No hay proyectos en progreso para generar planillas.')
+            return redirect('planillas_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+    else:
+        form = GenerarPlanillasForm(empresa=empresa)
+
+    return render(request, 'proyectos/planilla_generar.html', {
+        'form': form,
+    })
+
+
+@login_required
+def planilla_importar(request, pk, empresa_codigo=None):
+    """Importa desde un CSV o XLSX las horas extra, bonificaciones y deducciones de una planilla"""
+    from .cierre_planilla import PlanillaCerrada
+    from .forms import ImportarMovimientosPlanillaForm
+    from .importacion_planilla import ErrorImportacion, importar_movimientos_planilla
+
+    empresa = get_empresa_from_request(request)
+    planillas = Planilla.objects.select_related('proyecto__empresa')
+    if empresa:
+        planillas = planillas.filter(proyecto__empresa=empresa)
+    planilla = get_object_or_404(planillas, pk=pk)
+    if planilla.cerrada:
+        messages.error(request, 'La planilla está cerrada y no se puede modificar.')
+        return redirect('planilla_cierre', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+    errores = []
+
+    if request.method == 'POST':
+        form = ImportarMovimientosPlanillaForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                resultado = importar_movimientos_planilla(
+                    planilla, form.cleaned_data['archivo'], tipo=form.cleaned_data['tipo'] or None
+                )
+            except ErrorImportacion as error:
+                form.add_error('archivo', str(error))
+            except PlanillaCerrada as error:
+                messages.error(request, str(error))
+                return redirect('planilla_cierre', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+            else:
+                if resultado.errores:
+                    errores = resultado.errores
+                    messages.error(
+                        request,
+                        f'No se importó ninguna fila: {len(errores)} filas con errores. Corrija el archivo y vuelva a cargarlo.'
+                    )
+                else:
+                    messages.success(
+                        request,
+                        f'{resultado.total_creados} movimientos importados '
+                        f'({resultado.creados["hora_extra"]} horas extra, {resultado.creados["bonificacion"]} bonificaciones, '
+                        f'{resultado.creados["deduccion"]} deducciones) para {len(resultado.empleados)} empleados.'
+                    )
+                    return redirect('planilla_update', pk=planilla.pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+    else:
+        form = ImportarMovimientosPlanillaForm()
+
+    return render(request, 'proyectos/planilla_importar.html', {
+        'form': form,
+        'planilla': planilla,
+        'errores': errores,
+    })
+
+
 @login_required
 def planilla_update(request, pk, empresa_codigo=None):
     empresa = get_empresa_from_request(request)
     planilla = get_object_or_404(Planilla, pk=pk)
 
+    # Una planilla cerrada solo se consulta desde su cierre
+    if planilla.cerrada:
+        messages.info(request, 'La planilla está cerrada y no se puede editar.')
+        return redirect('planilla_cierre', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+
     if request.method == 'POST':
         form = PlanillaForm(request.POST, instance=planilla, empresa=empresa)
         formset = DetallePlanillaFormSet(request.POST, instance=planilla)
@@ -939,14 +1314,41 @@ def planilla_update(request, pk, empresa_codigo=None):
         horaextra_formset = HoraExtraFormSet(request.POST, instance=planilla)
         deduccion_formset = DeduccionFormSet(request.POST, instance=planilla)
 
+        # Versión de la planilla que se cargó en el formulario (control de concurrencia)
+        try:
+            version = int(request.POST['version'])
+        except (KeyError, ValueError):
+            version = None
+            form.add_error(None, 'Falta la versión de la planilla. Recargue la página e intente de nuevo.')
+
         if form.is_valid() and formset.is_valid() and bonificacion_formset.is_valid() and horaextra_formset.is_valid() and deduccion_formset.is_valid():
-            form.save()
-            formset.save()
-            bonificacion_formset.save()
-            horaextra_formset.save()
-            deduccion_formset.save()
-            messages.success(request, 'Planilla actualizada exitosamente.')
-            return redirect('planillas_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+            from django.db import transaction
+            from .cierre_planilla import PlanillaCerrada
+            from .persistencia_planilla import ConflictoVersionPlanilla, bloquear_planilla
+
+            try:
+                # Solo se escriben las filas que cambiaron, con una operación en bloque por tipo de cambio
+                with transaction.atomic():
+                    # Bloquear y validar antes de escribir el encabezado: un cierre o guardado
+                    # concurrente no debe quedar pisado por esta instancia
+                    bloquear_planilla(planilla, version)
+                    planilla = form.save(commit=False)
+                    # Solo los campos del formulario: monto_total, version y cerrada los mantienen
+                    # los recálculos y el cierre
+                    planilla.save(update_fields=list(form.fields))
+                    guardar_formsets_planilla(
+                        planilla, formset, bonificacion_formset, horaextra_formset, deduccion_formset,
+                        version=version,
+                    )
+            except ConflictoVersionPlanilla as error:
+                # Se vuelve a mostrar lo que envió el usuario para que no pierda sus cambios
+                form.add_error(None, str(error))
+            except PlanillaCerrada as error:
+                messages.error(request, str(error))
+                return redirect('planilla_cierre', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+            else:
+                messages.success(request, 'Planilla actualizada exitosamente.')
+                return redirect('planillas_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
     else:
         form = PlanillaForm(instance=planilla, empresa=empresa)
         formset = DetallePlanillaFormSet(instance=planilla)
@@ -954,12 +1356,17 @@ def planilla_update(request, pk, empresa_codigo=None):
         horaextra_formset = HoraExtraFormSet(instance=planilla)
         deduccion_formset = DeduccionFormSet(instance=planilla)
 
-    # Obtener todos los empleados con su salario para JavaScript (filtrado por empresa)
-    empleados = Empleado.objects.filter(empresa=empresa, activo=True).values('id', 'salario_base')
-    empleados_salarios = {emp['id']: float(emp['salario_base']) for emp in empleados}
-
-    # Obtener lista completa de empleados para los selects (filtrado por empresa)
-    empleados_list = Empleado.objects.filter(empresa=empresa, activo=True).order_by('apellidos', 'nombres')
+    # Catálogo de empleados compartido por los selects y el JavaScript (cacheado por empresa)
+    empleados_list = _catalogo_empleados_planilla(
+        empresa, formset, bonificacion_formset, horaextra_formset, deduccion_formset
+    )
+    # Salarios vigentes al final del período de la planilla, que puede ser pasado (una consulta)
+    empleados_salarios = {
+        empleado_id: float(salario)
+        for empleado_id, salario in HistorialSalario.salarios_vigentes(
+            [empleado['id'] for empleado in empleados_list], planilla.periodo_fin
+        ).items()
+    }
 
     return render(request, 'proyectos/planilla_form.html', {
         'form': form,
@@ -974,154 +1381,239 @@ def planilla_update(request, pk, empresa_codigo=None):
 
 
 @login_required
-def planilla_delete(request, pk, empresa_codigo=None):
-    planilla = get_object_or_404(Planilla, pk=pk)
-    if request.method == 'POST':
-        planilla.delete()
-        messages.success(request, 'Planilla eliminada exitosamente.')
-        return redirect('planillas_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
-    return render(request, 'proyectos/confirm_delete.html', {'object': planilla, 'tipo': 'planilla'})
+def planilla_cierre(request, pk, empresa_codigo=None):
+    """
+    Cierre de una planilla. Si está abierta muestra sus totales actuales y, por POST,
+    la cierra; si está cerrada muestra los montos congelados en su cierre.
+    """
+    from .cierre_planilla import PlanillaCerrada, cerrar_planilla
 
+    empresa = get_empresa_from_request(request)
+    planillas = Planilla.objects.select_related('proyecto')
+    if empresa:
+        planillas = planillas.filter(proyecto__empresa=empresa)
+    planilla = get_object_or_404(planillas, pk=pk)
 
-@login_required
-def get_empleados_proyecto(request, proyecto_id):
-    """Devuelve los empleados asignados activamente a un proyecto en formato JSON"""
-    # Obtener las asignaciones activas del proyecto
-    asignaciones = AsignacionEmpleado.objects.filter(
-        proyecto_id=proyecto_id,
-        activo=True,
-        empleado__activo=True
-    ).select_related('empleado')
-
-    # Construir lista de empleados con su información
-    empleados_data = []
-    for asignacion in asignaciones:
-        empleado = asignacion.empleado
-        empleados_data.append({
-            'id': empleado.id,
-            'nombre_completo': empleado.nombre_completo,
-            'salario_base': float(empleado.salario_base),
-            'cargo': empleado.cargo,
-        })
+    if request.method == 'POST':
+        try:
+            cierre = cerrar_planilla(planilla, usuario=request.user)
+        except PlanillaCerrada as error:
+            messages.error(request, str(error))
+        else:
+            messages.success(
+                request,
+                f'Planilla cerrada con {cierre.cantidad_empleados} empleados por ${cierre.monto_total:,.2f}.'
+            )
+        return redirect('planilla_cierre', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+
+    cierre = None
+    if planilla.cerrada:
+        cierre = CierrePlanilla.objects.select_related('cerrada_por').get(planilla=planilla)
 
-    return JsonResponse({'empleados': empleados_data})
+    return render(request, 'proyectos/planilla_cierre.html', {
+        'planilla': planilla,
+        'cierre': cierre,
+        'detalles': cierre.detalles.all() if cierre else None,
+        'cantidad_empleados': planilla.detalles.count() if not cierre else cierre.cantidad_empleados,
+    })
 
 
 @login_required
-def planilla_save_empleados(request, pk, empresa_codigo=None):
-    """Vista AJAX para guardar solo la sección de empleados de una planilla"""
-    planilla = get_object_or_404(Planilla, pk=pk)
+def planilla_deducciones_ley(request, pk, empresa_codigo=None):
+    """Calcula las deducciones de ley (IHSS, RAP, ISR...) de todas las líneas de la planilla"""
+    from .cierre_planilla import PlanillaCerrada
+    from .deducciones_ley import aplicar_deducciones_ley
 
-    if request.method == 'POST':
-        formset = DetallePlanillaFormSet(request.POST, instance=planilla)
+    empresa = get_empresa_from_request(request)
+    planillas = Planilla.objects.select_related('proyecto')
+    if empresa:
+        planillas = planillas.filter(proyecto__empresa=empresa)
+    planilla = get_object_or_404(planillas, pk=pk)
+    if request.method != 'POST':
+        return redirect('planilla_update', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
 
-        if formset.is_valid():
-            formset.save()
+    try:
+        resultado = aplicar_deducciones_ley(planilla)
+    except PlanillaCerrada as error:
+        messages.error(request, str(error))
+        return redirect('planilla_cierre', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+
+    if resultado.creadas:
+        detalle = ', '.join(f'{descripcion} ${total:,.2f}' for descripcion, total in resultado.totales.items())
+        messages.success(
+            request,
+            f'{resultado.creadas} deducciones de ley calculadas para {len(resultado.empleados)} empleados ({detalle}).'
+        )
+    else:
+        messages.warning(
+            request,
+            'No se generaron deducciones de ley: revise que la empresa tenga reglas activas y la planilla tenga empleados.'
+        )
+    return redirect('planilla_update', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
 
-            # Recalcular el total de la planilla
-            total_planilla = planilla.monto_total
 
-            # Devolver los totales actualizados
-            return JsonResponse({
-                'success': True,
-                'message': 'Empleados guardados exitosamente',
-                'total_planilla': float(total_planilla),
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'errors': formset.errors,
-                'message': 'Error al guardar empleados'
-            }, status=400)
+@login_required
+def planilla_recalcular_salarios(request, pk, empresa_codigo=None):
+    """Recalcula el salario devengado de las líneas con el salario vigente al final del período"""
+    from django.db import transaction
+    from .signals import programar_recalculo_planilla
 
-    return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    empresa = get_empresa_from_request(request)
+    planillas = Planilla.objects.select_related('proyecto')
+    if empresa:
+        planillas = planillas.filter(proyecto__empresa=empresa)
+    planilla = get_object_or_404(planillas, pk=pk)
+    if request.method != 'POST':
+        return redirect('planilla_update', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+
+    with transaction.atomic():
+        if Planilla.objects.select_for_update().filter(pk=planilla.pk).values_list('cerrada', flat=True).get():
+            messages.error(request, 'La planilla está cerrada y no se puede modificar.')
+            return redirect('planilla_cierre', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+        monto_total = planilla.recalcular_salarios()
+        programar_recalculo_planilla(planilla)
+
+    messages.success(
+        request,
+        f'Salarios recalculados al {planilla.periodo_fin:%d/%m/%Y}. Nuevo total de la planilla: ${monto_total:,.2f}.'
+    )
+    return redirect('planilla_update', pk=pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
 
 
 @login_required
-def planilla_save_bonificaciones(request, pk, empresa_codigo=None):
-    """Vista AJAX para guardar solo la sección de bonificaciones de una planilla"""
+def planilla_delete(request, pk, empresa_codigo=None):
     planilla = get_object_or_404(Planilla, pk=pk)
-
+    if planilla.cerrada:
+        messages.error(request, 'No se puede eliminar una planilla cerrada.')
+        return redirect('planillas_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
     if request.method == 'POST':
-        formset = BonificacionFormSet(request.POST, instance=planilla)
+        planilla.delete()
+        messages.success(request, 'Planilla eliminada exitosamente.')
+        return redirect('planillas_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+    return render(request, 'proyectos/confirm_delete.html', {'object': planilla, 'tipo': 'planilla'})
 
-        if formset.is_valid():
-            formset.save()
 
-            # Recalcular el total de la planilla
-            total_planilla = planilla.monto_total
+def _etag_empleados_proyecto(request, proyecto_id, empresa_codigo=None):
+    from .cache_empleados import etag_nomina_proyecto
+    return etag_nomina_proyecto(proyecto_id, get_empresa_from_request(request))
 
-            return JsonResponse({
-                'success': True,
-                'message': 'Bonificaciones guardadas exitosamente',
-                'total_planilla': float(total_planilla),
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'errors': formset.errors,
-                'message': 'Error al guardar bonificaciones'
-            }, status=400)
 
-    return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+@login_required
+@condition(etag_func=_etag_empleados_proyecto)
+def get_empleados_proyecto(request, proyecto_id, empresa_codigo=None):
+    """
+    Devuelve los empleados asignados activamente a un proyecto en formato JSON.
+    La nómina se cachea por versión de empleados de la empresa, que también es el
+    ETag: si el navegador ya la tiene, se responde 304 sin consultar nada.
+    """
+    from .cache_empleados import nomina_proyecto
 
+    response = JsonResponse({'empleados': nomina_proyecto(proyecto_id, get_empresa_from_request(request))})
+    # El navegador puede guardarla, pero debe revalidarla con el ETag cada vez
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-@login_required
-def planilla_save_deducciones(request, pk, empresa_codigo=None):
-    """Vista AJAX para guardar solo la sección de deducciones de una planilla"""
-    planilla = get_object_or_404(Planilla, pk=pk)
 
-    if request.method == 'POST':
-        formset = DeduccionFormSet(request.POST, instance=planilla)
+def _guardar_seccion_planilla(request, pk, formset_class, mensaje_exito, mensaje_error):
+    """
+    Guarda una sección (formset) de la planilla vía AJAX.
 
-        if formset.is_valid():
-            formset.save()
+    El POST debe incluir la versión de la planilla que tiene el usuario: si otro
+    usuario la modificó después, responde 409 sin guardar. La respuesta solo trae
+    los totales de los empleados afectados, el nuevo total y la nueva versión.
+    """
+    from .cierre_planilla import PlanillaCerrada
+    from .persistencia_planilla import ConflictoVersionPlanilla
 
-            # Recalcular el total de la planilla
-            total_planilla = planilla.monto_total
+    planilla = get_object_or_404(Planilla, pk=pk)
 
-            return JsonResponse({
-                'success': True,
-                'message': 'Deducciones guardadas exitosamente',
-                'total_planilla': float(total_planilla),
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'errors': formset.errors,
-                'message': 'Error al guardar deducciones'
-            }, status=400)
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+
+    try:
+        version = int(request.POST['version'])
+    except (KeyError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Falta la versión de la planilla'
+        }, status=400)
+
+    formset = formset_class(request.POST, instance=planilla)
+    if not formset.is_valid():
+        return JsonResponse({
+            'success': False,
+            'errors': formset.errors,
+            'message': mensaje_error
+        }, status=400)
 
-    return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    try:
+        # Guardar solo las filas que cambiaron (en bloque) y recalcular los empleados afectados
+        detalles, empleados = guardar_formsets_planilla(planilla, formset, version=version)
+    except ConflictoVersionPlanilla as error:
+        return JsonResponse({
+            'success': False,
+            'conflicto': True,
+            'version': error.version_actual,
+            'message': str(error)
+        }, status=409)
+    except PlanillaCerrada as error:
+        return JsonResponse({
+            'success': False,
+            'cerrada': True,
+            'message': str(error)
+        }, status=409)
+
+    return JsonResponse({
+        'success': True,
+        'message': mensaje_exito,
+        'version': planilla.version,
+        'total_planilla': float(planilla.monto_total),
+        'totales_empleados': {
+            detalle.empleado_id: {
+                'salario_devengado': float(detalle.salario_devengado),
+                'total_bonificaciones': float(detalle.total_bonificaciones),
+                'total_deducciones': float(detalle.total_deducciones),
+                'total_horas_extra': float(detalle.total_horas_extra),
+                'monto_horas_extra': float(detalle.monto_horas_extra),
+                'total_neto': float(detalle.total_neto),
+            }
+            for detalle in detalles
+        },
+        # Empleados afectados que ya no tienen línea en la planilla
+        'empleados_sin_linea': sorted(empleados - {detalle.empleado_id for detalle in detalles}),
+    })
 
 
 @login_required
-def planilla_save_horas_extra(request, pk, empresa_codigo=None):
-    """Vista AJAX para guardar solo la sección de horas extra de una planilla"""
-    planilla = get_object_or_404(Planilla, pk=pk)
+def planilla_save_empleados(request, pk, empresa_codigo=None):
+    """Vista AJAX para guardar solo la sección de empleados de una planilla"""
+    return _guardar_seccion_planilla(
+        request, pk, DetallePlanillaFormSet, 'Empleados guardados exitosamente', 'Error al guardar empleados'
+    )
 
-    if request.method == 'POST':
-        formset = HoraExtraFormSet(request.POST, instance=planilla)
 
-        if formset.is_valid():
-            formset.save()
+@login_required
+def planilla_save_bonificaciones(request, pk, empresa_codigo=None):
+    """Vista AJAX para guardar solo la sección de bonificaciones de una planilla"""
+    return _guardar_seccion_planilla(
+        request, pk, BonificacionFormSet, 'Bonificaciones guardadas exitosamente', 'Error al guardar bonificaciones'
+    )
+
 
-            # Recalcular el total de la planilla
-            total_planilla = planilla.monto_total
+@login_required
+def planilla_save_deducciones(request, pk, empresa_codigo=None):
+    """Vista AJAX para guardar solo la sección de deducciones de una planilla"""
+    return _guardar_seccion_planilla(
+        request, pk, DeduccionFormSet, 'Deducciones guardadas exitosamente', 'Error al guardar deducciones'
+    )
 
-            return JsonResponse({
-                'success': True,
-                'message': 'Horas extra guardadas exitosamente',
-                'total_planilla': float(total_planilla),
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'errors': formset.errors,
-                'message': 'Error al guardar horas extra'
-            }, status=400)
 
-    return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+@login_required
+def planilla_save_horas_extra(request, pk, empresa_codigo=None):
+    """Vista AJAX para guardar solo la sección de horas extra de una planilla"""
+    return _guardar_seccion_planilla(
+        request, pk, HoraExtraFormSet, 'Horas extra guardadas exitosamente', 'Error al guardar horas extra'
+    )
 
 
 # ====== API REST (ViewSets) ======
@@ -1155,53 +1647,98 @@ class ProyectoViewSet(viewsets.ModelViewSet):
     ordering_fields = ['codigo', 'fecha_inicio', 'monto_contrato']
     ordering = ['-fecha_inicio']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # En lecturas los cálculos financieros vienen anotados desde la base de datos.
+        # En escrituras no se anotan para que la respuesta no muestre valores previos al cambio.
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = queryset.with_financials()
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'list':
             return ProyectoListSerializer
         return ProyectoSerializer
 
     @action(detail=True, methods=['get'])
-    def utilidades(self, request, pk=None):
+    def utilidades(self, request, pk=None, empresa_codigo=None):
         """Endpoint para obtener el detalle de utilidades de un proyecto"""
         proyecto = self.get_object()
+        finanzas = ProyectoFinancialSnapshot.de_proyecto(proyecto).como_dict()
         return Response({
             'proyecto': {
                 'codigo': proyecto.codigo,
                 'nombre': proyecto.nombre,
-                'cliente': proyecto.cliente,
+                'cliente': proyecto.cliente.nombre if proyecto.cliente else None,
             },
             'financiero': {
-                'monto_contrato': float(proyecto.monto_contrato),
-                'costos_totales': float(proyecto.calcular_costos_totales()),
-                'utilidad_bruta': float(proyecto.calcular_utilidad_bruta()),
-                'margen_utilidad': float(proyecto.calcular_margen_utilidad()),
+                'monto_contrato': finanzas['monto_contrato'],
+                'costos_totales': finanzas['costos_totales'],
+                'utilidad_bruta': finanzas['utilidad_bruta'],
+                'margen_utilidad': finanzas['margen_utilidad'],
             },
             'desglose_costos': {
-                'total_planillas': float(sum(p.monto_total for p in proyecto.planillas.all())),
-                'total_gastos': float(sum(g.monto for g in proyecto.gastos.all())),
+                'total_planillas': finanzas['total_planillas'],
+                'total_gastos': finanzas['total_gastos'],
+                'total_maquinaria': finanzas['total_maquinaria'],
             }
         })
 
-    @action(detail=False, methods=['get'])
-    def resumen_utilidades(self, request):
-        """Endpoint para obtener resumen de utilidades de todos los proyectos"""
-        proyectos = self.get_queryset()
-        data = []
-
-        for proyecto in proyectos:
-            data.append({
-                'id': proyecto.id,
-                'codigo': proyecto.codigo,
-                'nombre': proyecto.nombre,
-                'cliente': proyecto.cliente,
-                'estado': proyecto.estado,
-                'monto_contrato': float(proyecto.monto_contrato),
-                'costos_totales': float(proyecto.calcular_costos_totales()),
-                'utilidad_bruta': float(proyecto.calcular_utilidad_bruta()),
-                'margen_utilidad': float(proyecto.calcular_margen_utilidad()),
-            })
+    # Columnas del resumen de utilidades (todas salen de las anotaciones de with_financials)
+    CAMPOS_RESUMEN_UTILIDADES = [
+        'id', 'codigo', 'nombre', 'cliente__nombre', 'estado',
+        'monto_contrato', 'costos_totales', 'utilidad_bruta', 'margen_utilidad',
+    ]
+
+    def _resumen_utilidades_queryset(self):
+        """Proyectos filtrados como diccionarios con las columnas del resumen, en un orden estable para paginar"""
+        proyectos = self.filter_queryset(self.get_queryset())
+        return proyectos.order_by(*proyectos.query.order_by, 'pk').values(*self.CAMPOS_RESUMEN_UTILIDADES)
+
+    @staticmethod
+    def _fila_resumen_utilidades(fila):
+        return {
+            'id': fila['id'],
+            'codigo': fila['codigo'],
+            'nombre': fila['nombre'],
+            'cliente': fila['cliente__nombre'],
+            'estado': fila['estado'],
+            'monto_contrato': float(fila['monto_contrato']),
+            'costos_totales': float(fila['costos_totales']),
+            'utilidad_bruta': float(fila['utilidad_bruta']),
+            'margen_utilidad': float(fila['margen_utilidad']),
+        }
 
-        return Response(data)
+    @action(detail=False, methods=['get'])
+    def resumen_utilidades(self, request, empresa_codigo=None):
+        """Endpoint paginado con el resumen de utilidades de los proyectos (una consulta por página)"""
+        pagina = self.paginate_queryset(self._resumen_utilidades_queryset())
+        return self.get_paginated_response([self._fila_resumen_utilidades(fila) for fila in pagina])
+
+    @action(detail=False, methods=['get'], url_path='resumen_utilidades/exportar')
+    def exportar_resumen_utilidades(self, request, empresa_codigo=None):
+        """
+        Exporta el resumen de utilidades de todos los proyectos filtrados en streaming.
+        Parámetro formato: 'ndjson' (por defecto) o 'csv'.
+        Las filas se leen con un cursor por bloques, así que la memoria no crece con el portafolio.
+        """
+        from .exportacion import respuesta_csv_streaming, respuesta_ndjson_streaming
+
+        formato = request.query_params.get('formato', 'ndjson')
+        if formato not in ('ndjson', 'csv'):
+            return Response({'error': "Formato no soportado. Use 'ndjson' o 'csv'."}, status=400)
+
+        filas = (
+            self._fila_resumen_utilidades(fila)
+            for fila in self._resumen_utilidades_queryset().iterator(chunk_size=1000)
+        )
+        if formato == 'csv':
+            encabezados = ['id', 'codigo', 'nombre', 'cliente', 'estado', 'monto_contrato',
+                           'costos_totales', 'utilidad_bruta', 'margen_utilidad']
+            return respuesta_csv_streaming(
+                'resumen_utilidades.csv', encabezados, ([fila[campo] for campo in encabezados] for fila in filas)
+            )
+        return respuesta_ndjson_streaming('resumen_utilidades.ndjson', filas)
 
 
 class AsignacionEmpleadoViewSet(viewsets.ModelViewSet):
@@ -1212,20 +1749,57 @@ class AsignacionEmpleadoViewSet(viewsets.ModelViewSet):
     ordering = ['-fecha_asignacion']
 
 
+def _validar_planilla_abierta(planilla):
+    """Rechaza (400) las escrituras de la API sobre una planilla cerrada o sus líneas"""
+    if planilla.cerrada:
+        from rest_framework.exceptions import ValidationError
+        raise ValidationError({'detail': 'La planilla está cerrada y no se puede modificar.'})
+
+
 class PlanillaViewSet(viewsets.ModelViewSet):
-    queryset = Planilla.objects.all()
+    queryset = Planilla.objects.select_related('proyecto', 'cierre').prefetch_related(
+        'detalles__empleado', 'cierre__detalles'
+    )
     serializer_class = PlanillaSerializer
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
-    filterset_fields = ['pagada', 'tipo_planilla', 'proyecto']
+    filterset_fields = ['pagada', 'cerrada', 'tipo_planilla', 'proyecto']
     ordering = ['-fecha_pago']
 
+    def perform_update(self, serializer):
+        _validar_planilla_abierta(serializer.instance)
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        _validar_planilla_abierta(instance)
+        instance.delete()
+
 
 class DetallePlanillaViewSet(viewsets.ModelViewSet):
-    queryset = DetallePlanilla.objects.all()
+    queryset = DetallePlanilla.objects.select_related('empleado')
     serializer_class = DetallePlanillaSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['planilla', 'empleado']
 
+    def perform_create(self, serializer):
+        _validar_planilla_abierta(serializer.validated_data['planilla'])
+        detalle = serializer.save()
+        detalle.planilla.recalcular_totales()
+
+    def perform_update(self, serializer):
+        planilla_anterior = serializer.instance.planilla
+        _validar_planilla_abierta(planilla_anterior)
+        _validar_planilla_abierta(serializer.validated_data.get('planilla', planilla_anterior))
+        detalle = serializer.save()
+        detalle.planilla.recalcular_totales()
+        if planilla_anterior.pk != detalle.planilla_id:
+            planilla_anterior.recalcular_totales()
+
+    def perform_destroy(self, instance):
+        planilla = instance.planilla
+        _validar_planilla_abierta(planilla)
+        instance.delete()
+        planilla.recalcular_totales()
+
 
 class GastoViewSet(viewsets.ModelViewSet):
     queryset = Gasto.objects.all()
@@ -1244,6 +1818,185 @@ class PagoViewSet(viewsets.ModelViewSet):
     ordering = ['-fecha_pago']
 
 
+class CostoMensualProyectoViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Costos mensuales por proyecto y categoría de la empresa actual (tabla CostoMensualProyecto).
+    La acción series devuelve los montos agrupados por mes listos para graficar.
+    """
+    serializer_class = CostoMensualProyectoSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['proyecto', 'categoria', 'mes']
+
+    def get_queryset(self):
+        empresa = get_empresa_from_request(self.request)
+        queryset = CostoMensualProyecto.objects.select_related('proyecto')
+        if empresa:
+            queryset = queryset.filter(empresa=empresa)
+        return queryset
+
+    @staticmethod
+    def _parsear_mes(valor):
+        """Convierte 'AAAA-MM' en el primer día del mes (None si el valor no es válido)"""
+        from datetime import datetime
+        try:
+            return datetime.strptime(valor, '%Y-%m').date()
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _sumar_meses(mes, cantidad):
+        """Primer día del mes que está cantidad meses después (o antes, si es negativa)"""
+        from datetime import date
+        indice = mes.year * 12 + mes.month - 1 + cantidad
+        return date(indice // 12, indice % 12 + 1, 1)
+
+    @action(detail=False, methods=['get'])
+    def series(self, request, empresa_codigo=None):
+        """
+        Series mensuales por categoría.
+        Parámetros: desde y hasta ('AAAA-MM', por defecto los últimos 12 meses),
+        proyecto (id) y categoria (una o varias separadas por coma).
+        """
+        from datetime import date
+
+        parametros = request.query_params
+        hasta = self._parsear_mes(parametros['hasta']) if parametros.get('hasta') else date.today().replace(day=1)
+        if parametros.get('desde'):
+            desde = self._parsear_mes(parametros['desde'])
+        else:
+            desde = self._sumar_meses(hasta, -11) if hasta else None
+        if not desde or not hasta or desde > hasta:
+            return Response({'error': 'Parámetros desde/hasta inválidos. Use el formato AAAA-MM.'}, status=400)
+
+        queryset = self.get_queryset().filter(mes__gte=desde, mes__lte=hasta)
+        if parametros.get('proyecto'):
+            queryset = queryset.filter(proyecto_id=parametros['proyecto'])
+        if parametros.get('categoria'):
+            queryset = queryset.filter(categoria__in=parametros['categoria'].split(','))
+
+        cantidad_meses = (hasta.year - desde.year) * 12 + hasta.month - desde.month + 1
+        meses = [self._sumar_meses(desde, i) for i in range(cantidad_meses)]
+        posicion = {mes: i for i, mes in enumerate(meses)}
+
+        series = {}
+        filas = queryset.order_by().values('mes', 'categoria').annotate(total=Sum('monto'))
+        for fila in filas:
+            serie = series.setdefault(fila['categoria'], [0.0] * len(meses))
+            serie[posicion[fila['mes']]] = float(fila['total'])
+
+        return Response({
+            'desde': desde.strftime('%Y-%m'),
+            'hasta': hasta.strftime('%Y-%m'),
+            'meses': [mes.strftime('%Y-%m') for mes in meses],
+            'series': series,
+        })
+
+
+class UsoMaquinariaViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Usos de maquinaria de la empresa actual. Se registran uno a uno desde las vistas
+    (retiro y devolución) o en bloque con la acción importar.
+    """
+    serializer_class = UsoMaquinariaSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['maquinaria', 'proyecto', 'fecha_inicio']
+    ordering = ['-fecha_inicio']
+
+    def get_queryset(self):
+        empresa = get_empresa_from_request(self.request)
+        queryset = UsoMaquinaria.objects.select_related('maquinaria', 'proyecto')
+        if empresa:
+            queryset = queryset.filter(maquinaria__empresa=empresa)
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def importar(self, request, empresa_codigo=None):
+        """
+        Importa usos en bloque desde un archivo CSV o XLSX (campo archivo) o desde una
+        lista JSON en usos con las mismas columnas. Si alguna fila tiene errores no se
+        importa ninguna y se responde 400 con los errores por fila.
+        """
+        from .importacion_planilla import ErrorImportacion
+        from .importacion_usos_maquinaria import importar_archivo_usos_maquinaria, importar_usos_maquinaria
+
+        if not (request.user.is_superuser or request.user.rol in ['gerente', 'operador']):
+            return Response({'error': 'No tienes permisos para acceder al módulo de maquinaria.'}, status=403)
+
+        empresa = get_empresa_from_request(request)
+        try:
+            if 'archivo' in request.FILES:
+                resultado = importar_archivo_usos_maquinaria(empresa, request.FILES['archivo'])
+            elif isinstance(request.data.get('usos'), list):
+                usos = [uso for uso in request.data['usos'] if isinstance(uso, dict)]
+                columnas = list(dict.fromkeys(columna for uso in usos for columna in uso))
+                filas = [columnas] + [
+                    ['' if uso.get(columna) is None else uso[columna] for columna in columnas] for uso in usos
+                ]
+                resultado = importar_usos_maquinaria(empresa, filas)
+            else:
+                return Response({'error': 'Envíe un archivo CSV o XLSX en archivo o una lista de usos en usos.'}, status=400)
+        except ErrorImportacion as error:
+            return Response({'error': str(error)}, status=400)
+
+        if resultado.errores:
+            return Response({
+                'error': f'No se importó ninguna fila: {len(resultado.errores)} filas con errores.',
+                'errores': [{'fila': fila, 'mensaje': mensaje} for fila, mensaje in resultado.errores],
+            }, status=400)
+        return Response({'creados': resultado.creados, 'maquinarias': len(resultado.maquinarias)}, status=201)
+
+
+class UsoMaquinariaMensualViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Horas, costo y usos por maquinaria, proyecto y mes de la empresa actual (tabla
+    UsoMaquinariaMensual). La acción utilizacion devuelve el resumen de la flota por maquinaria.
+    """
+    serializer_class = UsoMaquinariaMensualSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['maquinaria', 'proyecto', 'mes']
+
+    def get_queryset(self):
+        empresa = get_empresa_from_request(self.request)
+        queryset = UsoMaquinariaMensual.objects.select_related('maquinaria', 'proyecto')
+        if empresa:
+            queryset = queryset.filter(empresa=empresa)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def utilizacion(self, request, empresa_codigo=None):
+        """
+        Utilización por maquinaria, totales de la flota y serie mensual.
+        Parámetros: desde y hasta ('AAAA-MM', por defecto los últimos 12 meses), tipo y estado.
+        """
+        from .utilizacion_maquinaria import (
+            HORAS_DISPONIBLES_MES, cantidad_meses, fila_utilizacion, maquinarias_utilizacion, rango_meses,
+            serie_mensual_flota, totales_utilizacion
+        )
+
+        parametros = request.query_params
+        rango = rango_meses(parametros.get('desde'), parametros.get('hasta'))
+        if rango is None:
+            return Response({'error': 'Parámetros desde/hasta inválidos. Use el formato AAAA-MM.'}, status=400)
+        desde, hasta = rango
+        meses = cantidad_meses(desde, hasta)
+        empresa = get_empresa_from_request(request)
+        tipo, estado = parametros.get('tipo'), parametros.get('estado')
+
+        filas = [
+            fila_utilizacion(maquinaria, meses)
+            for maquinaria in maquinarias_utilizacion(empresa, desde, hasta, tipo=tipo, estado=estado)
+        ]
+        serie = serie_mensual_flota(empresa, desde, hasta, tipo=tipo, estado=estado)
+        return Response({
+            'desde': desde.strftime('%Y-%m'),
+            'hasta': hasta.strftime('%Y-%m'),
+            'horas_disponibles_mes': HORAS_DISPONIBLES_MES,
+            'totales': totales_utilizacion(filas, meses),
+            'maquinarias': filas,
+            'serie': [dict(fila, mes=fila['mes'].strftime('%Y-%m')) for fila in serie],
+        })
+
+
 # ========== GESTIÓN DE USUARIOS ==========
 
 @login_required
@@ -1797,6 +2550,60 @@ def maquinaria_delete(request, pk, empresa_codigo=None):
     })
 
 
+@login_required
+def maquinaria_utilizacion(request, empresa_codigo=None):
+    """
+    Reporte de utilización de la flota: horas, costo, usos y proyectos por maquinaria
+    en un rango de meses (?desde=AAAA-MM&hasta=AAAA-MM, por defecto los últimos 12),
+    filtrable por tipo y estado. Con ?formato=csv exporta el resumen por maquinaria.
+    """
+    # Verificar permisos: solo admin, gerente y operador
+    if not (request.user.is_superuser or request.user.rol in ['gerente', 'operador']):
+        messages.error(request, 'No tienes permisos para acceder al módulo de maquinaria.')
+        return redirect('dashboard', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+
+    empresa = get_empresa_from_request(request)
+    from .models import Maquinaria
+    from .exportacion import respuesta_csv_streaming
+    from .utilizacion_maquinaria import (
+        ENCABEZADOS_UTILIZACION, cantidad_meses, fila_utilizacion, filas_csv_utilizacion,
+        maquinarias_utilizacion, rango_meses, serie_mensual_flota, totales_utilizacion
+    )
+
+    tipo = request.GET.get('tipo')
+    estado = request.GET.get('estado')
+    rango = rango_meses(request.GET.get('desde'), request.GET.get('hasta'))
+    if rango is None:
+        messages.error(request, 'Rango de meses inválido. Use el formato AAAA-MM.')
+        rango = rango_meses(None, None)
+    desde, hasta = rango
+    meses = cantidad_meses(desde, hasta)
+
+    filas = [
+        fila_utilizacion(maquinaria, meses)
+        for maquinaria in maquinarias_utilizacion(empresa, desde, hasta, tipo=tipo, estado=estado)
+    ]
+
+    if request.GET.get('formato') == 'csv':
+        return respuesta_csv_streaming(
+            f'utilizacion_maquinaria_{desde:%Y-%m}_{hasta:%Y-%m}.csv',
+            ENCABEZADOS_UTILIZACION, filas_csv_utilizacion(filas)
+        )
+
+    return render(request, 'proyectos/maquinaria_utilizacion.html', {
+        'filas': filas,
+        'totales': totales_utilizacion(filas, meses),
+        'serie': serie_mensual_flota(empresa, desde, hasta, tipo=tipo, estado=estado),
+        'empresa_codigo': empresa_codigo,
+        'desde': desde,
+        'hasta': hasta,
+        'filtro_tipo': tipo,
+        'filtro_estado': estado,
+        'tipos': Maquinaria.TIPO_CHOICES,
+        'estados': Maquinaria.ESTADO_CHOICES,
+    })
+
+
 # ====== VISTAS DE USO DE MAQUINARIA ======
 
 @login_required
@@ -1860,15 +2667,15 @@ def uso_maquinaria_create(request, empresa_codigo=None):
 
     empresa = get_empresa_from_request(request)
     from .forms import UsoMaquinariaForm
+    from .uso_maquinaria import guardar_uso
     from django.core.exceptions import ValidationError
 
     if request.method == 'POST':
         form = UsoMaquinariaForm(request.POST, empresa=empresa)
         if form.is_valid():
             try:
-                uso = form.save(commit=False)
-                uso.full_clean()  # Llamar validaciones del modelo
-                uso.save()
+                # Valida y guarda con la maquinaria bloqueada (evita dos retiros simultáneos)
+                guardar_uso(form.save(commit=False))
                 messages.success(request, 'Uso de maquinaria registrado exitosamente.')
                 return redirect('usos_maquinaria_list', empresa_codigo=empresa.codigo if empresa else 'default')
             except ValidationError as e:
@@ -1891,6 +2698,50 @@ def uso_maquinaria_create(request, empresa_codigo=None):
     })
 
 
+@login_required
+def usos_maquinaria_importar(request, empresa_codigo=None):
+    """Importa desde un CSV o XLSX una bitácora de usos de maquinaria (horómetros por máquina)"""
+    # Verificar permisos: solo admin, gerente y operador
+    if not (request.user.is_superuser or request.user.rol in ['gerente', 'operador']):
+        messages.error(request, 'No tienes permisos para acceder al módulo de maquinaria.')
+        return redirect('dashboard', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+
+    empresa = get_empresa_from_request(request)
+    from .forms import ImportarUsosMaquinariaForm
+    from .importacion_planilla import ErrorImportacion
+    from .importacion_usos_maquinaria import importar_archivo_usos_maquinaria
+    errores = []
+
+    if request.method == 'POST':
+        form = ImportarUsosMaquinariaForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                resultado = importar_archivo_usos_maquinaria(empresa, form.cleaned_data['archivo'])
+            except ErrorImportacion as error:
+                form.add_error('archivo', str(error))
+            else:
+                if resultado.errores:
+                    errores = resultado.errores
+                    messages.error(
+                        request,
+                        f'No se importó ninguna fila: {len(errores)} filas con errores. Corrija el archivo y vuelva a cargarlo.'
+                    )
+                else:
+                    messages.success(
+                        request,
+                        f'{resultado.creados} usos de maquinaria importados para {len(resultado.maquinarias)} maquinarias.'
+                    )
+                    return redirect('usos_maquinaria_list', empresa_codigo=empresa.codigo if empresa else 'default')
+    else:
+        form = ImportarUsosMaquinariaForm()
+
+    return render(request, 'proyectos/usos_maquinaria_importar.html', {
+        'form': form,
+        'errores': errores,
+        'empresa_codigo': empresa_codigo,
+    })
+
+
 @login_required
 def uso_maquinaria_update(request, pk, empresa_codigo=None):
     """Actualizar uso de maquinaria"""
@@ -1902,6 +2753,7 @@ def uso_maquinaria_update(request, pk, empresa_codigo=None):
     empresa = get_empresa_from_request(request)
     from .models import UsoMaquinaria
     from .forms import UsoMaquinariaForm
+    from .uso_maquinaria import guardar_uso
     from django.core.exceptions import ValidationError
 
     uso = get_object_or_404(UsoMaquinaria, pk=pk)
@@ -1915,9 +2767,8 @@ def uso_maquinaria_update(request, pk, empresa_codigo=None):
         form = UsoMaquinariaForm(request.POST, instance=uso, empresa=empresa)
         if form.is_valid():
             try:
-                uso = form.save(commit=False)
-                uso.full_clean()  # Llamar validaciones del modelo
-                uso.save()
+                # Valida y guarda con la maquinaria bloqueada
+                uso = guardar_uso(form.save(commit=False))
                 messages.success(request, 'Uso de maquinaria actualizado exitosamente.')
                 return redirect('usos_maquinaria_list', empresa_codigo=empresa.codigo if empresa else 'default')
             except ValidationError as e:
@@ -1944,6 +2795,7 @@ def uso_maquinaria_delete(request, pk, empresa_codigo=None):
         return redirect('dashboard', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
 
     from .models import UsoMaquinaria
+    from .uso_maquinaria import eliminar_uso
 
     uso = get_object_or_404(UsoMaquinaria, pk=pk)
 
@@ -1953,7 +2805,8 @@ def uso_maquinaria_delete(request, pk, empresa_codigo=None):
         return redirect('usos_maquinaria_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
 
     if request.method == 'POST':
-        uso.delete()
+        # Si era el uso activo, la maquinaria vuelve a quedar disponible
+        eliminar_uso(uso)
         messages.success(request, 'Uso de maquinaria eliminado exitosamente.')
         return redirect('usos_maquinaria_list', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
 
@@ -1963,6 +2816,16 @@ def uso_maquinaria_delete(request, pk, empresa_codigo=None):
     })
 
 
+def _maquinarias_de_empresa(request):
+    """Maquinarias de la empresa actual; sin empresa, todas solo para el superusuario"""
+    from .models import Maquinaria
+
+    empresa = get_empresa_from_request(request)
+    if empresa is None and request.user.is_superuser:
+        return Maquinaria.objects.all()
+    return Maquinaria.objects.filter(empresa=empresa)
+
+
 @login_required
 def maquinaria_historial_tarifas(request, pk, empresa_codigo=None):
     """Ver historial de cambios de tarifa de una maquinaria"""
@@ -1971,18 +2834,69 @@ def maquinaria_historial_tarifas(request, pk, empresa_codigo=None):
         messages.error(request, 'No tienes permisos para acceder al módulo de maquinaria.')
         return redirect('dashboard', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
 
-    from .models import Maquinaria, HistorialTarifaMaquinaria
+    from .models import HistorialTarifaMaquinaria
+    from .forms import TarifaMaquinariaForm
+    from .tarifas_maquinaria import registrar_tarifa
 
-    maquinaria = get_object_or_404(Maquinaria, pk=pk)
-    historial = HistorialTarifaMaquinaria.objects.filter(maquinaria=maquinaria).order_by('-fecha_cambio')
+    maquinaria = get_object_or_404(_maquinarias_de_empresa(request), pk=pk)
+
+    # Registrar una tarifa vigente desde una fecha (corrección retroactiva) y recalcular sus usos
+    if request.method == 'POST':
+        form = TarifaMaquinariaForm(request.POST)
+        if form.is_valid():
+            cambio, resultado = registrar_tarifa(
+                maquinaria,
+                form.cleaned_data['tarifa'],
+                form.cleaned_data['vigente_desde'],
+                motivo=form.cleaned_data['motivo'],
+                usuario=request.user,
+            )
+            messages.success(
+                request,
+                f'Tarifa de L. {cambio.tarifa_nueva:,.2f} registrada desde el {cambio.vigente_desde:%d/%m/%Y}. '
+                f'{resultado.actualizados} usos recalculados (diferencia de costo L. {resultado.diferencia:,.2f}).'
+                + (f' {resultado.manuales} usos con tarifa manual se conservaron.' if resultado.manuales else '')
+            )
+            return redirect('maquinaria_historial_tarifas', pk=maquinaria.pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+    else:
+        form = TarifaMaquinariaForm(initial={'tarifa': maquinaria.tarifa_hora})
+
+    historial = HistorialTarifaMaquinaria.objects.filter(maquinaria=maquinaria).order_by('-vigente_desde', '-fecha_cambio')
 
     return render(request, 'proyectos/maquinaria_historial_tarifas.html', {
         'maquinaria': maquinaria,
         'historial': historial,
+        'form': form,
         'empresa_codigo': empresa_codigo
     })
 
 
+@login_required
+def maquinaria_recalcular_tarifas(request, pk, empresa_codigo=None):
+    """Recalcula la tarifa y el costo de los usos de una maquinaria con la tarifa vigente en su fecha"""
+    # Verificar permisos: solo admin, gerente y operador
+    if not (request.user.is_superuser or request.user.rol in ['gerente', 'operador']):
+        messages.error(request, 'No tienes permisos para acceder al módulo de maquinaria.')
+        return redirect('dashboard', empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+
+    from .models import UsoMaquinaria
+    from .tarifas_maquinaria import recalcular_tarifas_usos
+
+    maquinaria = get_object_or_404(_maquinarias_de_empresa(request), pk=pk)
+    if request.method == 'POST':
+        resultado = recalcular_tarifas_usos(UsoMaquinaria.objects.filter(maquinaria=maquinaria))
+        manuales = f' {resultado.manuales} usos con tarifa manual se conservaron.' if resultado.manuales else ''
+        if resultado.actualizados:
+            messages.success(
+                request,
+                f'{resultado.actualizados} de {resultado.revisados} usos recalculados con la tarifa vigente en su fecha '
+                f'(diferencia de costo L. {resultado.diferencia:,.2f}).{manuales}'
+            )
+        else:
+            messages.info(request, f'Los {resultado.revisados} usos ya tienen la tarifa vigente en su fecha.{manuales}')
+    return redirect('maquinaria_historial_tarifas', pk=maquinaria.pk, empresa_codigo=request.empresa.codigo if request.empresa else 'default')
+
+
 from django.http import JsonResponse
 
 @login_required
@@ -1992,6 +2906,8 @@ def get_maquinaria_datos(request, pk, empresa_codigo=None):
     if not (request.user.is_superuser or request.user.rol in ['gerente', 'operador']):
         return JsonResponse({'error': 'No tienes permisos para acceder al módulo de maquinaria.'}, status=403)
 
+    from django.db.models import Max
+    from django.utils.dateparse import parse_date
     from .models import Maquinaria, UsoMaquinaria
 
     try:
@@ -2000,27 +2916,34 @@ def get_maquinaria_datos(request, pk, empresa_codigo=None):
         # Obtener el ID del uso actual (si se está editando)
         uso_actual_id = request.GET.get('uso_id', None)
 
-        # Obtener el último horómetro final registrado, excluyendo el uso actual si existe
-        query = UsoMaquinaria.objects.filter(
-            maquinaria=maquinaria
-        ).exclude(horometro_final__isnull=True)
+        # Último horómetro final registrado (guardado en la maquinaria)
+        ultimo_horometro_final = maquinaria.ultimo_horometro_final
 
-        # Si estamos editando, excluir el uso actual
-        if uso_actual_id:
-            query = query.exclude(pk=uso_actual_id)
-
-        ultimo_uso = query.order_by('-horometro_final').first()
+        # Si se edita justo el uso con el último horómetro, buscar el anterior excluyéndolo
+        if uso_actual_id and str(maquinaria.ultimo_uso_id) == uso_actual_id:
+            ultimo_horometro_final = UsoMaquinaria.objects.filter(
+                maquinaria=maquinaria
+            ).exclude(pk=uso_actual_id).aggregate(maximo=Max('horometro_final'))['maximo']
 
         horometro_minimo = maquinaria.horometro_actual
-        if ultimo_uso and ultimo_uso.horometro_final:
-            horometro_minimo = max(horometro_minimo, ultimo_uso.horometro_final)
+        if ultimo_horometro_final:
+            horometro_minimo = max(horometro_minimo, ultimo_horometro_final)
+
+        # Tarifa vigente en la fecha de inicio del uso (?fecha=AAAA-MM-DD), por defecto la actual
+        tarifa = maquinaria.tarifa_hora
+        try:
+            fecha = parse_date(request.GET.get('fecha') or '')
+        except ValueError:
+            fecha = None
+        if fecha:
+            tarifa = UsoMaquinaria(maquinaria=maquinaria, fecha_inicio=fecha).tarifa_vigente()
 
         return JsonResponse({
             'success': True,
-            'tarifa_hora': str(maquinaria.tarifa_hora),
+            'tarifa_hora': str(tarifa),
             'horometro_actual': str(maquinaria.horometro_actual),
             'horometro_minimo': str(horometro_minimo),
-            'ultimo_horometro_final': str(ultimo_uso.horometro_final) if ultimo_uso and ultimo_uso.horometro_final else None
+            'ultimo_horometro_final': str(ultimo_horometro_final) if ultimo_horometro_final else None
         })
     except Maquinaria.DoesNotExist:
         return JsonResponse({